@@ -0,0 +1,62 @@
+"""Asyncio runtime helpers for Q-Emplois bot
+
+The bot pipeline is async-first. Sync entry points hand their coroutine to a
+single long-lived background event loop instead of calling ``asyncio.run``
+per message, so loop-bound clients (httpx, redis.asyncio) and their
+connection pools survive between calls.
+"""
+import asyncio
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    """Get or start the shared background event loop"""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever,
+                name="qemplois-aio",
+                daemon=True,
+            )
+            thread.start()
+            _loop = loop
+        return _loop
+
+
+def run_sync(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Run a coroutine on the background loop and block until it finishes"""
+    loop = _get_background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() called from the background loop; await instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+class LoopLocal(Generic[T]):
+    """Lazily create one instance of a loop-bound client per event loop"""
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._instances: "weakref.WeakKeyDictionary[Any, T]" = weakref.WeakKeyDictionary()
+
+    def get(self) -> T:
+        loop = asyncio.get_running_loop()
+        instance = self._instances.get(loop)
+        if instance is None:
+            instance = self._factory()
+            self._instances[loop] = instance
+        return instance
+
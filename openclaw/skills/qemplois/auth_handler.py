@@ -3,16 +3,124 @@ Fix 3: Real auth with Redis, HMAC tokens, and webhook callbacks
 """
 import logging
 import json
+import gzip
 import hmac
 import hashlib
+import os
 import secrets
+import threading
 import time
-from typing import Optional, Dict, Any
+from collections import Counter
+from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
+from urllib.parse import quote
 import redis
+import redis.asyncio as aioredis
+
+from .aio import LoopLocal
+from .cache import TTLCache
+from .http_client import HttpClient, get_http_client
+from .outbox import Outbox, get_outbox
 
 logger = logging.getLogger(__name__)
 
+SESSION_PREFIX = "auth:session:"
+INDEX_PREFIX = "auth:index:"
+LINK_PREFIX = "auth:link:"
+# Link keys published here on link/unlink so every worker drops its near-cache entry
+LINK_CHANNEL = "auth:link:invalidate"
+
+# Token MAC length in hex chars (96 bits); legacy tokens carried 16
+TOKEN_MAC_HEX = 24
+LEGACY_MAC_HEX = 16
+
+_MISSING = object()
+
+LINK_ERRORS = {
+    "invalid": {"success": False, "error": "Invalid or expired token"},
+    "linked": {"success": False, "error": "Already linked"},
+    "platform": {"success": False, "error": "Platform mismatch"},
+}
+
+# ── Server-side scripts ───────────────────────────────────────────────────────
+# Read-modify-write flows run inside Redis so each auth operation is a single
+# round trip (EVALSHA). Sessions are flat JSON objects merged key by key.
+# Every key a script touches is passed in KEYS; unlink and delete read the
+# record first to learn the second key, and the script re-checks it.
+
+# KEYS: session | ARGV: updates JSON, ttl
+MERGE_SESSION_LUA = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then return 0 end
+local session = cjson.decode(raw)
+for k, v in pairs(cjson.decode(ARGV[1])) do session[k] = v end
+redis.call('SETEX', KEYS[1], ARGV[2], cjson.encode(session))
+return 1
+"""
+
+# KEYS: session, link | ARGV: updates JSON, session ttl, link ttl, token,
+# linked_at, expected platform ('' = any), invalidation channel.
+# Returns {status, session JSON}
+LINK_LUA = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then return {'invalid'} end
+local session = cjson.decode(raw)
+if ARGV[6] ~= '' and session['platform'] ~= ARGV[6] then return {'platform'} end
+if session['status'] == 'linked' then return {'linked'} end
+for k, v in pairs(cjson.decode(ARGV[1])) do session[k] = v end
+redis.call('SETEX', KEYS[1], ARGV[2], cjson.encode(session))
+redis.call('SETEX', KEYS[2], ARGV[3], cjson.encode(
+    {token = ARGV[4], user_id = session['user_id'], linked_at = ARGV[5]}))
+redis.call('PUBLISH', ARGV[7], KEYS[2])
+return {'ok', raw}
+"""
+
+# KEYS: link[, session of the token read from it] | ARGV: that token ('' = none),
+# updates JSON, session ttl, invalidation channel. Returns -1 if the link changed
+UNLINK_LUA = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then return 0 end
+local token = cjson.decode(raw)['token']
+if type(token) ~= 'string' then token = '' end
+if token ~= ARGV[1] then return -1 end
+if KEYS[2] then
+  local session = redis.call('GET', KEYS[2])
+  if session then
+    session = cjson.decode(session)
+    for k, v in pairs(cjson.decode(ARGV[2])) do session[k] = v end
+    redis.call('SETEX', KEYS[2], ARGV[3], cjson.encode(session))
+  end
+end
+redis.call('PUBLISH', ARGV[4], KEYS[1])
+return redis.call('DEL', KEYS[1])
+"""
+
+# KEYS: session, its user:platform index | ARGV: index prefix.
+# Returns -1 if the session no longer belongs to that index
+DELETE_SESSION_LUA = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then return 0 end
+local session = cjson.decode(raw)
+if ARGV[1] .. session['platform'] .. ':' .. session['user_id'] ~= KEYS[2] then return -1 end
+redis.call('DEL', KEYS[2])
+return redis.call('DEL', KEYS[1])
+"""
+
+# Attempts when the record changes between the read and the script
+SCRIPT_RETRIES = 3
+
+
+class AuthScripts:
+    """The auth scripts registered once against a client (SHA computed once)"""
+
+    __slots__ = ("merge", "link", "unlink", "delete")
+
+    def __init__(self, client):
+        self.merge = client.register_script(MERGE_SESSION_LUA)
+        self.link = client.register_script(LINK_LUA)
+        self.unlink = client.register_script(UNLINK_LUA)
+        self.delete = client.register_script(DELETE_SESSION_LUA)
+
 
 class AuthHandler:
     """
@@ -20,7 +128,7 @@ class AuthHandler:
     
     Features:
     - Redis session storage with auto-TTL (Law 25 native)
-    - HMAC-signed tokens
+    - Self-verifying HMAC tokens (forgeries never reach Redis)
     - Webhook callbacks for auth linking
     - Platform integration (WhatsApp, Telegram, etc.)
     """
@@ -30,46 +138,125 @@ class AuthHandler:
         redis_url: str = "redis://localhost:6379/0",
         webhook_url: str = "https://api.qemplois.ca/api/webhooks/auth",
         secret_key: str = None,
+        http: Optional[HttpClient] = None,
+        outbox: Optional[Outbox] = None,
+        webhook_batch_size: Optional[int] = None,
+        webhook_linger_ms: Optional[float] = None,
+        link_cache_ttl: Optional[float] = None,
+        link_touch_interval: Optional[float] = None,
+        legacy_token_cutoff: Optional[float] = None,
     ):
         self.redis = redis.from_url(redis_url, decode_responses=True)
+        self._aredis = LoopLocal(lambda: aioredis.from_url(redis_url, decode_responses=True))
+        self._scripts: Optional[AuthScripts] = None
+        self._scripts_client = None
+        self._ascripts = LoopLocal(lambda: AuthScripts(self.aredis))
         self.webhook_url = webhook_url
-        self.secret_key = secret_key or secrets.token_hex(32)
+        self.http = http or get_http_client()
+        self.secret_key = secret_key or os.environ.get("QEMPLOIS_AUTH_SECRET") or secrets.token_hex(32)
+        if not (secret_key or os.environ.get("QEMPLOIS_AUTH_SECRET")):
+            logger.warning("QEMPLOIS_AUTH_SECRET not set; tokens only verify in this process")
+        # Tokens are checked in-process; the MAC key is derived from the secret
+        # so it differs from the webhook signing key
+        token_key = hmac.new(self.secret_key.encode(), b"qemplois:token", hashlib.sha256).digest()
+        self._token_hmac = hmac.new(token_key, digestmod=hashlib.sha256)
+        # Unix time the MAC'd token format was released. Older-format tokens issued
+        # before it are looked up until they expire; 0 (default) rejects them all.
+        self.legacy_token_cutoff = legacy_token_cutoff if legacy_token_cutoff is not None else float(
+            os.environ.get("QEMPLOIS_LEGACY_TOKEN_CUTOFF", 0))
+        self.rejected_tokens: TTLCache = TTLCache(maxsize=10_000, ttl=600)
+        self.token_counters: Counter = Counter()
         self.token_ttl = 86400  # 24 hours
+        self.link_ttl = 30 * 86400  # 30 days
+        # Near cache of link records: every inbound message looks one up. Entries
+        # are dropped on link/unlink (pub/sub), and the 30-day Redis expiry is
+        # only pushed back once per touch interval instead of on every message.
+        cache_ttl = link_cache_ttl if link_cache_ttl is not None else float(
+            os.environ.get("QEMPLOIS_LINK_CACHE_TTL", 60))
+        touch_interval = link_touch_interval if link_touch_interval is not None else float(
+            os.environ.get("QEMPLOIS_LINK_TOUCH_INTERVAL", 3600))
+        self.link_cache: TTLCache = TTLCache(maxsize=50_000, ttl=cache_ttl)
+        self.negative_link_ttl = min(cache_ttl, 10)
+        self._link_touched: TTLCache = TTLCache(maxsize=50_000, ttl=touch_interval)
+        self._link_epoch = 0
+        self._link_listener: Optional[threading.Thread] = None
+        self.link_counters: Counter = Counter()
+        # Webhooks are queued and posted by the outbox workers, off the link flow
+        self.outbox = outbox if outbox is not None else get_outbox()
+        # Above 1, events are sent as one signed, gzipped batch per request
+        self.webhook_batch_size = webhook_batch_size or int(
+            os.environ.get("QEMPLOIS_WEBHOOK_BATCH", 1))
+        linger_ms = webhook_linger_ms if webhook_linger_ms is not None else float(
+            os.environ.get("QEMPLOIS_WEBHOOK_LINGER_MS", 0))
+        self.outbox.register(
+            "webhook", self._deliver_webhooks,
+            batch_size=self.webhook_batch_size, linger=linger_ms / 1000, ordered=True,
+        )
+
+    @property
+    def scripts(self) -> AuthScripts:
+        """Scripts registered against ``self.redis`` on first use"""
+        if self._scripts_client is not self.redis:
+            self._scripts = AuthScripts(self.redis)
+            self._scripts_client = self.redis
+        return self._scripts
+
+    @property
+    def aredis(self):
+        """redis.asyncio client bound to the running event loop"""
+        return self._aredis.get()
 
     # ── Token Generation ─────────────────────────────────────────────────────
 
     def _generate_token(self, user_id: str, platform: str) -> str:
-        """Generate HMAC-signed token"""
+        """Generate a self-verifying token: qem_{timestamp}_{nonce}_{mac}"""
         timestamp = str(int(time.time()))
         nonce = secrets.token_hex(8)
-        data = f"{user_id}:{platform}:{timestamp}:{nonce}"
-        signature = hmac.new(
-            self.secret_key.encode(),
-            data.encode(),
-            hashlib.sha256
-        ).hexdigest()[:16]
-        return f"qem_{timestamp}_{nonce}_{signature}"
+        return f"qem_{timestamp}_{nonce}_{self._token_mac(timestamp, nonce)}"
+
+    def _token_mac(self, timestamp: str, nonce: str) -> str:
+        """Truncated HMAC-SHA256 over the token payload"""
+        mac = self._token_hmac.copy()
+        mac.update(f"{timestamp}:{nonce}".encode())
+        return mac.hexdigest()[:TOKEN_MAC_HEX]
 
     def _verify_token(self, token: str) -> Optional[Dict[str, str]]:
-        """Verify HMAC signature on token"""
-        try:
-            parts = token.split("_")
-            if len(parts) != 4 or parts[0] != "qem":
-                return None
-
-            timestamp, nonce, signature = parts[1], parts[2], parts[3]
-            # Check token age
-            if int(time.time()) - int(timestamp) > self.token_ttl:
-                return None
-
-            # Token is valid structure, full verification happens on lookup
-            return {
-                "timestamp": timestamp,
-                "nonce": nonce,
-                "signature": signature,
-            }
-        except Exception:
+        """Check the token's MAC and age in-process, before any Redis lookup"""
+        if token in self.rejected_tokens:
+            self.token_counters["rejected_cached"] += 1
             return None
+        parts = token.split("_")
+        # isascii: "²" passes isdigit() but not int(), and compare_digest
+        # raises on non-ASCII str
+        if (len(parts) != 4 or parts[0] != "qem" or not token.isascii()
+                or not parts[1].isdigit()):
+            return self._reject_token(token)
+
+        timestamp, nonce, signature = parts[1], parts[2], parts[3]
+        issued_at = int(timestamp)
+        now = time.time()
+        if now - issued_at > self.token_ttl or issued_at > now + 60:
+            return self._reject_token(token)
+
+        if len(signature) == TOKEN_MAC_HEX:
+            if not hmac.compare_digest(signature, self._token_mac(timestamp, nonce)):
+                return self._reject_token(token)
+        elif not (len(signature) == LEGACY_MAC_HEX and issued_at <= self.legacy_token_cutoff):
+            # Tokens issued before the release can't be checked here; the age
+            # check above stops accepting them token_ttl after the cutoff
+            return self._reject_token(token)
+
+        return {
+            "timestamp": timestamp,
+            "nonce": nonce,
+            "signature": signature,
+        }
+
+    def _reject_token(self, token: str) -> None:
+        """Remember a rejected token so retries skip parsing and Redis"""
+        self.token_counters["rejected"] += 1
+        self.rejected_tokens.set(token, True)
+        return None
 
     # ── Session Management ───────────────────────────────────────────────────
 
@@ -82,7 +269,6 @@ class AuthHandler:
     ) -> Dict[str, Any]:
         """Create new auth session in Redis"""
         token = self._generate_token(user_id, platform)
-        session_key = f"auth:session:{token}"
 
         session_data = {
             "user_id": user_id,
@@ -94,16 +280,11 @@ class AuthHandler:
             "linked_user_id": None,
         }
 
-        # Store in Redis with TTL
-        self.redis.setex(
-            session_key,
-            self.token_ttl,
-            json.dumps(session_data)
-        )
-
-        # Also index by user:platform for quick lookup
-        index_key = f"auth:index:{platform}:{user_id}"
-        self.redis.setex(index_key, self.token_ttl, token)
+        # Session plus the user:platform index, one round trip
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.setex(f"{SESSION_PREFIX}{token}", self.token_ttl, json.dumps(session_data))
+        pipe.setex(f"{INDEX_PREFIX}{platform}:{user_id}", self.token_ttl, token)
+        pipe.execute()
 
         logger.info(f"Created auth session for {platform}:{user_id}")
         return {
@@ -113,162 +294,314 @@ class AuthHandler:
         }
 
     def get_session(self, token: str) -> Optional[Dict[str, Any]]:
-        """Retrieve session from Redis"""
+        """Retrieve session from Redis, refreshing its TTL (GETEX)"""
         if not self._verify_token(token):
             return None
 
-        session_key = f"auth:session:{token}"
-        data = self.redis.get(session_key)
+        data = self.redis.getex(f"{SESSION_PREFIX}{token}", ex=self.token_ttl)
+        return json.loads(data) if data else self._reject_token(token)
 
-        if data:
-            session = json.loads(data)
-            # Refresh TTL on access
-            self.redis.expire(session_key, self.token_ttl)
-            return session
-        return None
-
-    def update_session(self, token: str, updates: Dict[str, Any]) -> bool:
-        """Update session data"""
-        session_key = f"auth:session:{token}"
-        data = self.redis.get(session_key)
+    async def get_session_async(self, token: str) -> Optional[Dict[str, Any]]:
+        """Retrieve session from Redis without blocking the event loop"""
+        if not self._verify_token(token):
+            return None
 
-        if not data:
-            return False
+        data = await self.aredis.getex(f"{SESSION_PREFIX}{token}", ex=self.token_ttl)
+        return json.loads(data) if data else self._reject_token(token)
 
-        session = json.loads(data)
-        session.update(updates)
-        session["updated_at"] = datetime.utcnow().isoformat()
+    def _session_updates(self, updates: Dict[str, Any]) -> str:
+        return json.dumps({**updates, "updated_at": datetime.utcnow().isoformat()})
 
-        self.redis.setex(session_key, self.token_ttl, json.dumps(session))
-        return True
+    def update_session(self, token: str, updates: Dict[str, Any]) -> bool:
+        """Update session data (merged server-side)"""
+        return bool(self.scripts.merge(
+            keys=[f"{SESSION_PREFIX}{token}"],
+            args=[self._session_updates(updates), self.token_ttl],
+        ))
+
+    async def update_session_async(self, token: str, updates: Dict[str, Any]) -> bool:
+        """Update session data without blocking the event loop"""
+        return bool(await self._ascripts.get().merge(
+            keys=[f"{SESSION_PREFIX}{token}"],
+            args=[self._session_updates(updates), self.token_ttl],
+        ))
 
     def delete_session(self, token: str) -> bool:
-        """Delete session from Redis"""
-        session = self.get_session(token)
-        if session:
-            # Remove index
-            index_key = f"auth:index:{session['platform']}:{session['user_id']}"
-            self.redis.delete(index_key)
-
-        session_key = f"auth:session:{token}"
-        return self.redis.delete(session_key) > 0
+        """Delete session and its index from Redis"""
+        key = f"{SESSION_PREFIX}{token}"
+        for _ in range(SCRIPT_RETRIES):
+            raw = self.redis.get(key)
+            if raw is None:
+                return False
+            session = json.loads(raw)
+            index = f"{INDEX_PREFIX}{session['platform']}:{session['user_id']}"
+            deleted = self.scripts.delete(keys=[key, index], args=[INDEX_PREFIX])
+            if deleted >= 0:
+                return deleted > 0
+        return False
 
     # ── Platform Linking ─────────────────────────────────────────────────────
 
+    def _link_args(self, token: str, platform_user_id: str, platform: str,
+                   metadata: Optional[Dict], expected_platform: str) -> Dict:
+        return {
+            "keys": [f"{SESSION_PREFIX}{token}", f"{LINK_PREFIX}{platform}:{platform_user_id}"],
+            "args": [
+                self._session_updates(self._link_updates(platform_user_id, platform, metadata)),
+                self.token_ttl,
+                self.link_ttl,
+                token,
+                datetime.utcnow().isoformat(),
+                expected_platform,
+                LINK_CHANNEL,
+            ],
+        }
+
     def link_platform(
         self,
         token: str,
         platform_user_id: str,
         platform: str,
         metadata: Dict = None,
+        expected_platform: str = "",
     ) -> Dict[str, Any]:
         """
         Link a chat platform user to Q-Emplois account.
         Called by the auth callback controller.
         """
-        session = self.get_session(token)
-        if not session:
-            return {"success": False, "error": "Invalid or expired token"}
+        if not self._verify_token(token):
+            return LINK_ERRORS["invalid"]
+        # Check, update the session and store the permanent link in one script
+        reply = self.scripts.link(
+            **self._link_args(token, platform_user_id, platform, metadata, expected_platform))
+        return self._linked(reply, token, platform, platform_user_id, metadata)
+
+    async def link_platform_async(
+        self,
+        token: str,
+        platform_user_id: str,
+        platform: str,
+        metadata: Dict = None,
+        expected_platform: str = "",
+    ) -> Dict[str, Any]:
+        """Async variant of link_platform"""
+        if not self._verify_token(token):
+            return LINK_ERRORS["invalid"]
+        reply = await self._ascripts.get().link(
+            **self._link_args(token, platform_user_id, platform, metadata, expected_platform))
+        return self._linked(reply, token, platform, platform_user_id, metadata)
+
+    def _linked(self, reply: List, token: str, platform: str, platform_user_id: str,
+                metadata: Optional[Dict]) -> Dict[str, Any]:
+        if reply[0] != "ok":
+            if reply[0] == "invalid":
+                self._reject_token(token)
+            return LINK_ERRORS[reply[0]]
+        session = json.loads(reply[1])
+        self._invalidate_link(f"{platform}:{platform_user_id}")
+
+        self._fire_webhook("auth.linked", self._linked_payload(
+            token, session, platform, platform_user_id, metadata,
+        ))
 
-        if session.get("status") == "linked":
-            return {"success": False, "error": "Already linked"}
+        logger.info(f"Linked {platform}:{platform_user_id} to user {session['user_id']}")
+        return {
+            "success": True,
+            "user_id": session["user_id"],
+            "platform": platform,
+        }
 
-        # Update session
-        updates = {
+    @staticmethod
+    def _link_updates(platform_user_id: str, platform: str, metadata: Optional[Dict]) -> Dict:
+        return {
             "status": "linked",
             "linked_user_id": platform_user_id,
             "linked_platform": platform,
             "linked_at": datetime.utcnow().isoformat(),
             "metadata": metadata or {},
         }
-        self.update_session(token, updates)
-
-        # Store permanent link
-        link_key = f"auth:link:{platform}:{platform_user_id}"
-        self.redis.setex(
-            link_key,
-            30 * 86400,  # 30 days
-            json.dumps({
-                "token": token,
-                "user_id": session["user_id"],
-                "linked_at": datetime.utcnow().isoformat(),
-            })
-        )
 
-        # Fire webhook
-        self._fire_webhook("auth.linked", {
+    @staticmethod
+    def _linked_payload(
+        token: str, session: Dict, platform: str, platform_user_id: str, metadata: Optional[Dict],
+    ) -> Dict:
+        return {
             "token": token,
             "user_id": session["user_id"],
             "platform": platform,
             "platform_user_id": platform_user_id,
             "metadata": metadata,
-        })
-
-        logger.info(f"Linked {platform}:{platform_user_id} to user {session['user_id']}")
-        return {
-            "success": True,
-            "user_id": session["user_id"],
-            "platform": platform,
         }
 
+    # ── Linked users (near cache) ─────────────────────────────────────────────
+
+    def _cached_link(self, key: str) -> Any:
+        cached = self.link_cache.get(key, _MISSING)
+        self.link_counters["hits" if cached is not _MISSING else "misses"] += 1
+        if cached is _MISSING:
+            return _MISSING
+        return dict(cached) if cached else None
+
+    def _remember_link(self, key: str, data: Optional[str], epoch: int) -> Optional[Dict]:
+        link = json.loads(data) if data else None
+        if epoch == self._link_epoch:  # no invalidation raced with the read
+            if link:
+                self.link_cache.set(key, link)
+            else:
+                self.link_cache.set(key, False, ttl=self.negative_link_ttl)
+        return dict(link) if link else None
+
+    def _needs_touch(self, key: str) -> bool:
+        if key in self._link_touched:
+            return False
+        self._link_touched.set(key, True)
+        self.link_counters["touches"] += 1
+        return True
+
+    def _invalidate_link(self, key: str):
+        self._link_epoch += 1
+        self.link_cache.pop(key)
+        self._link_touched.pop(key)
+        self.link_counters["invalidations"] += 1
+
     def get_linked_user(self, platform: str, platform_user_id: str) -> Optional[Dict]:
-        """Get linked Q-Emplois user for a platform user"""
-        link_key = f"auth:link:{platform}:{platform_user_id}"
-        data = self.redis.get(link_key)
-
-        if data:
-            link = json.loads(data)
-            # Refresh TTL
-            self.redis.expire(link_key, 30 * 86400)
+        """Get linked Q-Emplois user for a platform user (near-cached)"""
+        key = f"{platform}:{platform_user_id}"
+        link = self._cached_link(key)
+        if link is not _MISSING:
             return link
-        return None
+        epoch = self._link_epoch
+        if self._needs_touch(key):
+            data = self.redis.getex(f"{LINK_PREFIX}{key}", ex=self.link_ttl)
+        else:
+            data = self.redis.get(f"{LINK_PREFIX}{key}")
+        return self._remember_link(key, data, epoch)
+
+    async def get_linked_user_async(self, platform: str, platform_user_id: str) -> Optional[Dict]:
+        """Async variant of get_linked_user"""
+        key = f"{platform}:{platform_user_id}"
+        link = self._cached_link(key)
+        if link is not _MISSING:
+            return link
+        epoch = self._link_epoch
+        if self._needs_touch(key):
+            data = await self.aredis.getex(f"{LINK_PREFIX}{key}", ex=self.link_ttl)
+        else:
+            data = await self.aredis.get(f"{LINK_PREFIX}{key}")
+        return self._remember_link(key, data, epoch)
 
     def unlink_platform(self, platform: str, platform_user_id: str) -> bool:
-        """Unlink a platform user"""
-        link_key = f"auth:link:{platform}:{platform_user_id}"
-        data = self.redis.get(link_key)
-
-        if data:
-            link = json.loads(data)
-            # Update session status
-            if link.get("token"):
-                self.update_session(link["token"], {
-                    "status": "unlinked",
-                    "unlinked_at": datetime.utcnow().isoformat(),
-                })
-
-        return self.redis.delete(link_key) > 0
+        """Unlink a platform user and mark its session unlinked"""
+        key = f"{LINK_PREFIX}{platform}:{platform_user_id}"
+        updates = self._session_updates({
+            "status": "unlinked",
+            "unlinked_at": datetime.utcnow().isoformat(),
+        })
+        removed = 0
+        for _ in range(SCRIPT_RETRIES):
+            raw = self.redis.get(key)
+            if raw is None:
+                break
+            token = json.loads(raw).get("token")
+            token = token if isinstance(token, str) else ""
+            keys = [key, f"{SESSION_PREFIX}{token}"] if token else [key]
+            removed = self.scripts.unlink(
+                keys=keys, args=[token, updates, self.token_ttl, LINK_CHANNEL])
+            if removed >= 0:
+                break
+        self._invalidate_link(f"{platform}:{platform_user_id}")
+        return removed > 0
+
+    def start_link_listener(self):
+        """Drop near-cached links when any worker links or unlinks them"""
+        if self._link_listener is None:
+            self._link_listener = threading.Thread(
+                target=self._listen_link_invalidations, name="qemplois-link-invalidation", daemon=True,
+            )
+            self._link_listener.start()
+
+    def _listen_link_invalidations(self):
+        delay = 1.0
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(LINK_CHANNEL)
+                # Whatever changed while we were not subscribed is unknown
+                self._link_epoch += 1
+                self.link_cache.clear()
+                delay = 1.0
+                for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._invalidate_link(message["data"][len(LINK_PREFIX):])
+            except Exception as e:
+                logger.warning(f"Link invalidation listener disconnected: {e}")
+            self._link_epoch += 1
+            self.link_cache.clear()
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    def link_cache_stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self.link_cache),
+            **{name: self.link_counters.get(name, 0)
+               for name in ("hits", "misses", "touches", "invalidations")},
+        }
 
     # ── Webhook ───────────────────────────────────────────────────────────────
 
     def _fire_webhook(self, event: str, payload: Dict):
-        """Fire webhook to Q-Emplois backend"""
-        import requests
-
-        try:
-            requests.post(
-                self.webhook_url,
-                json={
-                    "event": event,
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "payload": payload,
-                },
-                headers={
-                    "X-QEmplois-Signature": self._sign_webhook_payload(payload),
-                },
-                timeout=10,
-            )
-        except Exception as e:
-            logger.error(f"Webhook failed: {e}")
+        """Queue a webhook to Q-Emplois backend (delivered with retries)"""
+        self.outbox.enqueue("webhook", {
+            "event": event,
+            "timestamp": datetime.utcnow().isoformat(),
+            "payload": payload,
+        })
+
+    async def _fire_webhook_async(self, event: str, payload: Dict):
+        """Async variant of _fire_webhook; queueing never blocks on the network"""
+        self._fire_webhook(event, payload)
+
+    def _deliver_webhooks(self, events: List[Dict]):
+        """Outbox handler: post queued events in order, raising on failure"""
+        if self.webhook_batch_size > 1:
+            resp = self.http.post("webhook", self.webhook_url, **self._webhook_batch_request(events))
+            resp.raise_for_status()
+            return
+        for event in events:
+            resp = self.http.post("webhook", self.webhook_url, **self._webhook_request(event))
+            resp.raise_for_status()
+
+    def _webhook_request(self, event: Dict) -> Dict:
+        return {
+            "json": event,
+            "headers": {
+                "X-QEmplois-Signature": self._sign_webhook_payload(event["payload"]),
+            },
+        }
+
+    def _webhook_batch_request(self, events: List[Dict]) -> Dict:
+        """One POST for many events: gzipped JSON, a single HMAC over the whole batch.
+        The signature covers the exact body bytes before compression, so the
+        receiver checks it against the gunzipped body without re-serializing."""
+        body = json.dumps({"events": events}, separators=(",", ":")).encode()
+        return {
+            "data": gzip.compress(body, mtime=0),
+            "headers": {
+                "Content-Type": "application/json",
+                "Content-Encoding": "gzip",
+                "X-QEmplois-Batch": str(len(events)),
+                "X-QEmplois-Signature": self._sign_webhook_body(body),
+            },
+        }
 
     def _sign_webhook_payload(self, payload: Dict) -> str:
         """Sign webhook payload"""
         data = json.dumps(payload, sort_keys=True)
-        return hmac.new(
-            self.secret_key.encode(),
-            data.encode(),
-            hashlib.sha256
-        ).hexdigest()
+        return self._sign_webhook_body(data.encode())
+
+    def _sign_webhook_body(self, body: bytes) -> str:
+        """HMAC-SHA256 of raw bytes, hex"""
+        return hmac.new(self.secret_key.encode(), body, hashlib.sha256).hexdigest()
 
     # ── WhatsApp/Telegram Integration ─────────────────────────────────────────
 
@@ -281,7 +614,7 @@ class AuthHandler:
         )
         # WhatsApp click-to-chat with pre-filled message
         message = f"Bonjour! Je veux lier mon compte Q-Emplois. Mon code: {session['token']}"
-        encoded_msg = requests.utils.quote(message)
+        encoded_msg = quote(message)
         return f"https://wa.me/?text={encoded_msg}"
 
     def generate_telegram_auth_link(self, telegram_user_id: str, username: str = None) -> str:
@@ -294,16 +627,12 @@ class AuthHandler:
         return f"https://t.me/QEmploisBot?start={session['token']}"
 
     def verify_platform_token(self, platform: str, user_id: str, token: str) -> bool:
-        """Verify token provided by user via chat"""
-        session = self.get_session(token)
-        if not session:
-            return False
-
-        if session["platform"] != platform:
-            return False
+        """Verify token provided by user via chat and link the platform"""
+        return self.link_platform(token, user_id, platform, expected_platform=platform)["success"]
 
-        # Link the platform
-        result = self.link_platform(token, user_id, platform)
+    async def verify_platform_token_async(self, platform: str, user_id: str, token: str) -> bool:
+        """Async variant of verify_platform_token"""
+        result = await self.link_platform_async(token, user_id, platform, expected_platform=platform)
         return result["success"]
 
     # ── Cleanup ───────────────────────────────────────────────────────────────
@@ -2,14 +2,25 @@
 Fix 1: Real API calls (no more mock providers)
 Fix 2: Real geocoding via Nominatim
 """
+import asyncio
+import hashlib
 import os
 import logging
+import time
+from collections import Counter
 from enum import Enum
-from typing import Optional, Dict, List
-from dataclasses import dataclass, field
+from typing import Optional, Dict, List, Tuple
+from dataclasses import dataclass, field, replace
 from datetime import datetime
-import requests
-
+from .catalog import CatalogStore, ServiceCatalog, get_catalog_store
+from .geocache import GeocodeCache
+from .geocode_scheduler import GeocodeScheduler, get_geocode_scheduler
+from .http_client import HttpClient, get_http_client
+from .intents import IntentMatcher, tokenize
+from .local_geocoder import LocalGeocoder
+from .provider_cache import ProviderSearchCache, search_key
+from .provider_index import ProviderIndex, haversine_km, provider_coords
+from .session_store import MemorySessionStore, SessionStore, session_key
 from .utils import (
     parse_date, parse_time, format_price, format_distance,
     format_datetime_fr, generate_booking_id, validate_address
@@ -32,7 +43,40 @@ class BookingState(Enum):
     COMPLETED = "completed"
 
 
-@dataclass
+@dataclass(slots=True)
+class ProviderRecord:
+    """The provider fields the conversation displays and books with"""
+    id: str
+    name: str
+    price_per_hour: float
+    rating: Optional[float] = None
+    reviews: int = 0
+    distance_km: float = 0.0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ProviderRecord":
+        """Keep only what we need from an API/index record"""
+        return cls(
+            id=str(data["id"]),
+            name=data["name"],
+            price_per_hour=data["price_per_hour"],
+            rating=data.get("rating"),
+            reviews=data.get("reviews") or 0,
+            distance_km=data.get("distance_km") or 0.0,
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "price_per_hour": self.price_per_hour,
+            "rating": self.rating,
+            "reviews": self.reviews,
+            "distance_km": self.distance_km,
+        }
+
+
+@dataclass(slots=True)
 class BookingData:
     user_id: str
     platform: str
@@ -41,10 +85,13 @@ class BookingData:
     date: Optional[datetime] = None
     time: Optional[tuple] = None
     location: Optional[Dict] = None
-    selected_provider: Optional[Dict] = None
-    providers: List[Dict] = field(default_factory=list)
+    selected_provider: Optional[ProviderRecord] = None
+    providers: List[ProviderRecord] = field(default_factory=list)
     booking_id: Optional[str] = None
     price_estimate: Optional[float] = None
+    search_radius_km: float = 25.0
+    started_at: float = 0.0  # when this booking's service was chosen; one per conversation
+    last_activity: float = 0.0  # stamped on every save; not serialized
 
     def to_dict(self) -> dict:
         return {
@@ -55,50 +102,243 @@ class BookingData:
             "date": self.date.isoformat() if self.date else None,
             "time": self.time,
             "location": self.location,
-            "selected_provider": self.selected_provider,
-            "providers": self.providers,
+            "selected_provider": self.selected_provider.to_dict() if self.selected_provider else None,
+            "providers": [p.to_dict() for p in self.providers],
             "booking_id": self.booking_id,
             "price_estimate": self.price_estimate,
+            "search_radius_km": self.search_radius_km,
+            "started_at": self.started_at,
         }
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "BookingData":
+        data = dict(data)
+        data["state"] = BookingState(data.get("state", BookingState.IDLE.value))
+        if data.get("date"):
+            data["date"] = datetime.fromisoformat(data["date"])
+        if data.get("time"):
+            data["time"] = tuple(data["time"])
+        if data.get("selected_provider"):
+            data["selected_provider"] = ProviderRecord.from_dict(data["selected_provider"])
+        data["providers"] = [ProviderRecord.from_dict(p) for p in data.get("providers", [])]
+        return cls(**data)
+
 
 class BookingFlow:
     """Booking conversation flow — now wired to real Q-Emplois API"""
 
-    SERVICES = {
-        "1": ("plomberie", "🔧 Plomberie"),
-        "2": ("électricité", "⚡ Électricité"),
-        "3": ("nettoyage", "🧹 Nettoyage"),
-        "4": ("jardinage", "🌱 Jardinage"),
-        "5": ("déménagement", "🚚 Déménagement"),
-    }
-
-    def __init__(self, api_base: str | None = None, api_key: str = ""):
+    GREETINGS = ["bonjour", "salut", "hey", "hello", "hi", "coucou", "allo", "bonsoir", "allô"]
+    CONFIRM_YES = ["oui", "yes", "ok", "daccord", "d'accord", "confirmer", "confirm",
+                   "parfait", "go", "ouais"]
+    CONFIRM_NO = ["non", "no", "annuler", "cancel", "pas ça"]
+    WIDEN_SEARCH = ["plus loin", "loin", "plus large", "élargir"]
+    OTHER_DATE = ["autre", "autres", "changer", "autre date", "une autre date"]
+    # A "yes" next to any of these is not a confirmation
+    NEGATIONS = {"pas", "non", "ne", "n", "jamais"}
+
+    MAX_PROVIDERS_SHOWN = 3
+    MAX_RADIUS_KM = 100.0
+
+    INVALID_ADDRESS_MESSAGE = "L'adresse semble incomplète. Veuillez entrer: numéro civique, rue, ville."
+    NOTHING_FURTHER_MESSAGE = (
+        "Nous cherchons déjà dans un rayon de 100 km. "
+        "Tapez 'autre date' pour essayer une autre date."
+    )
+
+    NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+    NOMINATIM_USER_AGENT = "Q-Emplois/2.0 (contact@qemplois.ca)"
+
+    def __init__(
+        self,
+        api_base: str | None = None,
+        api_key: str = "",
+        http: Optional[HttpClient] = None,
+        geocode_cache: Optional[GeocodeCache] = None,
+        local_geocoder: Optional[LocalGeocoder] = None,
+        geocoder_mode: Optional[str] = None,
+        geocode_scheduler: Optional[GeocodeScheduler] = None,
+        provider_index: Optional[ProviderIndex] = None,
+        provider_cache: Optional[ProviderSearchCache] = None,
+        session_store: Optional[SessionStore] = None,
+        catalog: Optional[CatalogStore] = None,
+        prefetch: Optional[bool] = None,
+    ):
         self.api_base = api_base or os.environ.get(
             "QEMPLOIS_API_URL",
             "http://localhost:3000/api/v1",
         )
         self.api_key = api_key
-        self.sessions: Dict[str, BookingData] = {}
+        self.http = http or get_http_client()
+        self.geocode_cache = geocode_cache or GeocodeCache()
+        # "nominatim" (default), "local" (offline only) or "hybrid" (local, then Nominatim)
+        self.geocoder_mode = geocoder_mode or os.environ.get("QEMPLOIS_GEOCODER", "nominatim")
+        if local_geocoder is None and self.geocoder_mode != "nominatim":
+            local_geocoder = LocalGeocoder.from_env()
+        self.local_geocoder = local_geocoder
+        self.geocode_scheduler = geocode_scheduler or get_geocode_scheduler()
+        self.provider_index = provider_index or ProviderIndex()
+        self.provider_cache = provider_cache or ProviderSearchCache()
+        self.catalog = catalog or get_catalog_store()
+        self._matcher: Optional[Tuple[ServiceCatalog, IntentMatcher]] = None
+        self.sessions: SessionStore = (
+            session_store if session_store is not None else MemorySessionStore()
+        )
+        # Provider search starts in the background once service and date are known
+        self.prefetch = prefetch if prefetch is not None else (
+            os.environ.get("QEMPLOIS_PREFETCH", "1") == "1")
+        self._prefetches: Dict[str, asyncio.Task] = {}
+        self.prefetch_counters: Counter = Counter()
 
     # ── Session management ────────────────────────────────────────────────────
 
     def get_or_create_session(self, user_id: str, platform: str) -> BookingData:
-        key = f"{platform}:{user_id}"
-        if key not in self.sessions:
-            self.sessions[key] = BookingData(user_id=user_id, platform=platform)
-        return self.sessions[key]
+        session = self.sessions.load(session_key(user_id, platform))
+        if session is None:
+            session = BookingData(user_id=user_id, platform=platform)
+            self.save_session(session)
+        return session
+
+    async def get_or_create_session_async(self, user_id: str, platform: str) -> BookingData:
+        session = await self.sessions.load_async(session_key(user_id, platform))
+        return session or BookingData(user_id=user_id, platform=platform)
+
+    def save_session(self, session: BookingData):
+        session.last_activity = time.time()
+        self.sessions.save(session_key(session.user_id, session.platform), session)
+
+    def session_stats(self) -> Dict[str, int]:
+        """Live sessions, estimated bytes and evictions, for sizing workers"""
+        return self.sessions.stats()
 
     def reset_session(self, user_id: str, platform: str):
-        key = f"{platform}:{user_id}"
-        self.sessions.pop(key, None)
+        self.sessions.delete(session_key(user_id, platform))
+
+    # ── Intents ───────────────────────────────────────────────────────────────
+
+    @property
+    def services(self) -> ServiceCatalog:
+        return self.catalog.current()
+
+    @property
+    def intents(self) -> IntentMatcher:
+        """Matcher for the current catalogue, rebuilt once after each reload"""
+        services = self.services
+        if self._matcher is None or self._matcher[0] is not services:
+            self._matcher = (services, IntentMatcher(self._intent_phrases(services)))
+        return self._matcher[1]
+
+    def _intent_phrases(self, services: ServiceCatalog) -> Dict[str, List[str]]:
+        return {
+            "greeting": self.GREETINGS,
+            "confirm:yes": self.CONFIRM_YES,
+            "confirm:no": self.CONFIRM_NO,
+            "widen": self.WIDEN_SEARCH,
+            "other_date": self.OTHER_DATE,
+            **services.intent_phrases(),
+        }
+
+    def _service_key(self, msg: str) -> Optional[str]:
+        if msg in self.services.by_key:
+            return msg
+        intent = self.intents.match(msg, "service:")
+        return intent.split(":", 1)[1] if intent else None
+
+    def _confirmation(self, msg: str) -> Optional[str]:
+        """"yes", "no" or None; the whole message must be one answer, since "yes" books"""
+        intent = self.intents.match_whole(msg, "confirm:")
+        if intent is None:
+            return None
+        answer = intent.split(":", 1)[1]
+        if answer == "yes" and self.NEGATIONS.intersection(tokenize(msg)):
+            return None
+        return answer
+
+    def _provider_action(self, msg: str) -> Optional[str]:
+        """"select", "other_date" or "widen" at SHOW_PROVIDERS, checked in that order.
+        Control intents must be the whole message: a free-text reply never resets
+        the date or widens the search."""
+        if msg.isdigit():
+            return "select"
+        if self.intents.match_whole(msg, "other_date"):
+            return "other_date"
+        if self.intents.match_whole(msg, "widen"):
+            return "widen"
+        return None
 
     # ── Main dispatcher ───────────────────────────────────────────────────────
 
     def handle_message(self, user_id: str, platform: str, message: str) -> str:
-        session = self.get_or_create_session(user_id, platform)
-        msg = message.strip().lower()
+        session = self.sessions.load(session_key(user_id, platform)) or BookingData(
+            user_id=user_id, platform=platform)
+        try:
+            return self._dispatch(session, message.strip().lower())
+        finally:
+            # One write per message, however many fields the handlers changed
+            self.save_session(session)
+
+    async def handle_message_async(self, user_id: str, platform: str, message: str) -> str:
+        """Async variant: network-bound states await instead of blocking the loop"""
+        session = await self.get_or_create_session_async(user_id, platform)
+        try:
+            return await self._handle_async(session, message.strip().lower())
+        finally:
+            session.last_activity = time.time()
+            await self.sessions.save_async(session_key(user_id, platform), session)
+
+    async def _handle_async(self, session: BookingData, msg: str) -> str:
+        if not msg.startswith("/"):
+            if session.state == BookingState.ASK_LOCATION:
+                return await self._handle_location_async(session, msg)
+            if session.state == BookingState.CONFIRM_BOOKING and self._confirmation(msg) == "yes":
+                return await self._handle_confirmation_async(session, msg)
+            if (session.state == BookingState.SHOW_PROVIDERS
+                    and self._provider_action(msg) == "widen"):
+                return await self._widen_search_async(session)
+
+        reply = self._dispatch(session, msg)
+        if session.state == BookingState.ASK_LOCATION and self.prefetch:
+            self._start_prefetch(session)
+        return reply
+
+    # ── Prefetch ──────────────────────────────────────────────────────────────
+
+    # While the user types their address, the provider index for the chosen
+    # service is refreshed (and, for a returning user, the shortlist around
+    # their last address is warmed). The search after geocoding then waits
+    # for that work instead of starting it.
+
+    def _start_prefetch(self, session: BookingData):
+        key = session_key(session.user_id, session.platform)
+        if key in self._prefetches:
+            return
+        task = asyncio.get_running_loop().create_task(
+            self._prefetch_providers(replace(session, providers=[])))
+        self._prefetches[key] = task
+        self.prefetch_counters["started"] += 1
+
+        def forget(_):
+            if self._prefetches.get(key) is task:
+                del self._prefetches[key]
+        task.add_done_callback(forget)
+
+    async def _prefetch_providers(self, snapshot: BookingData):
+        try:
+            await self._find_providers_async(snapshot)
+        except Exception as e:
+            logger.warning(f"Provider prefetch failed: {e}")
+
+    async def _await_prefetch(self, session: BookingData):
+        """Let an in-flight prefetch finish so its API call isn't made twice"""
+        task = self._prefetches.pop(session_key(session.user_id, session.platform), None)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            return
+        if task.done():
+            self.prefetch_counters["ready"] += 1
+        else:
+            self.prefetch_counters["awaited"] += 1
+            await asyncio.shield(task)
 
+    def _dispatch(self, session: BookingData, msg: str) -> str:
         if msg.startswith("/"):
             return self._handle_command(session, msg)
 
@@ -141,36 +381,28 @@ class BookingFlow:
     # ── State handlers ────────────────────────────────────────────────────────
 
     def _handle_idle(self, session: BookingData, msg: str) -> str:
-        greetings = ["bonjour", "salut", "hey", "hello", "hi", "coucou", "allo"]
-        if any(g in msg for g in greetings):
+        # "Bonjour, j'ai une fuite" goes straight to plumbing
+        intent = self.intents.match(msg, "service:")
+        if intent:
+            session.state = BookingState.ASK_SERVICE
+            return self._handle_service_selection(session, intent.split(":", 1)[1])
+        if self.intents.match(msg, "greeting"):
             session.state = BookingState.ASK_SERVICE
-            return self.get_welcome_message()
-        for key, (service_id, _) in self.SERVICES.items():
-            if service_id in msg:
-                session.state = BookingState.ASK_SERVICE
-                return self._handle_service_selection(session, key)
         return self.get_welcome_message()
 
     def _handle_service_selection(self, session: BookingData, msg: str) -> str:
-        service_key = None
-        if msg in self.SERVICES:
-            service_key = msg
-        else:
-            for key, (service_id, service_name) in self.SERVICES.items():
-                clean = service_name.lower().split(" ", 1)[-1]
-                if service_id in msg or clean in msg:
-                    service_key = key
-                    break
-
-        if service_key:
-            session.service_type = self.SERVICES[service_key][0]
+        services = self.services
+        service_key = self._service_key(msg)
+        if service_key in services.by_key:
+            service = services.by_key[service_key]
+            session.service_type = service.id
+            session.started_at = time.time()
             session.state = BookingState.ASK_DATE
-            label = self.SERVICES[service_key][1]
             return (
-                f"Parfait! Vous avez choisi {label}.\n\n"
+                f"Parfait! Vous avez choisi {service.label()}.\n\n"
                 "Pour quelle date?\n(Ex: aujourd'hui, demain, 20 février)"
             )
-        return "Veuillez choisir un numéro de 1 à 5 ou le nom du service."
+        return services.choose_service["fr"]
 
     def _handle_date(self, session: BookingData, msg: str) -> str:
         parsed = parse_date(msg)
@@ -192,161 +424,407 @@ class BookingFlow:
 
     def _handle_location(self, session: BookingData, msg: str) -> str:
         if not validate_address(msg):
-            return "L'adresse semble incomplète. Veuillez entrer: numéro civique, rue, ville."
+            return self.INVALID_ADDRESS_MESSAGE
 
         # FIX 2: Real geocoding via Nominatim
-        geo = self._geocode(msg)
+        self._apply_location(session, msg, self._geocode(msg))
+        return self._search_providers(session)
+
+    async def _handle_location_async(self, session: BookingData, msg: str) -> str:
+        if not validate_address(msg):
+            return self.INVALID_ADDRESS_MESSAGE
+
+        # Geocoding overlaps with the provider prefetch started at ASK_LOCATION
+        self._apply_location(session, msg, await self._geocode_async(msg))
+        return await self._search_providers_async(session)
+
+    def _apply_location(self, session: BookingData, address: str, geo: dict):
         session.location = {
-            "address": msg,
+            "address": address,
             "lat": geo["lat"],
             "lng": geo["lng"],
-            "display": geo.get("display", msg),
+            "display": geo.get("display", address),
         }
         session.state = BookingState.SEARCHING_PROVIDERS
-        return self._search_providers(session)
 
     def _handle_provider_selection(self, session: BookingData, msg: str) -> str:
-        if msg in ["autre", "autres", "changer", "autre date"]:
+        action = self._provider_action(msg)
+        if action == "select":
+            return self._select_provider(session, int(msg))
+
+        if action == "other_date":
             session.state = BookingState.ASK_DATE
             return "D'accord. Pour quelle nouvelle date?"
 
-        try:
-            choice = int(msg)
-            if 1 <= choice <= len(session.providers):
-                session.selected_provider = session.providers[choice - 1]
-                session.price_estimate = session.selected_provider["price_per_hour"] * 2
-                session.state = BookingState.CONFIRM_BOOKING
-                return self._format_booking_summary(session)
-        except ValueError:
-            pass
+        if action == "widen":
+            return self._widen_search(session)
 
         return f"Veuillez entrer 1 à {len(session.providers)}, ou 'autre' pour changer la date."
 
-    def _handle_confirmation(self, session: BookingData, msg: str) -> str:
-        yes = ["oui", "yes", "ok", "daccord", "d'accord", "confirmer", "confirm"]
-        no = ["non", "no", "annuler", "cancel"]
+    def _select_provider(self, session: BookingData, choice: int) -> str:
+        if 1 <= choice <= len(session.providers):
+            session.selected_provider = session.providers[choice - 1]
+            session.price_estimate = session.selected_provider.price_per_hour * 2
+            session.state = BookingState.CONFIRM_BOOKING
+            return self._format_booking_summary(session)
+        return f"Veuillez entrer 1 à {len(session.providers)}, ou 'autre' pour changer la date."
 
-        if msg in yes:
+    def _handle_confirmation(self, session: BookingData, msg: str) -> str:
+        answer = self._confirmation(msg)
+        if answer == "yes":
             # FIX 1: Real booking API call
-            result = self._create_booking_api(session)
-            session.booking_id = result.get("booking_id") or generate_booking_id()
-            session.state = BookingState.COMPLETED
-
-            provider = session.selected_provider
-            h, m = session.time
-            t = f"{h}h{m:02d}" if m else f"{h}h"
-
-            pay_url = result.get(
-                "payment_url",
-                f"https://pay.qemplois.ca/sess_{session.booking_id.lower().replace('-', '')}"
-            )
-
-            return (
-                f"🎉 Réservation confirmée!\n\n"
-                f"Numéro: #{session.booking_id}\n\n"
-                f"💳 Paiement sécurisé:\n{pay_url}\n\n"
-                f"Vous recevrez un SMS de confirmation.\n"
-                f"{provider['name'].split()[0]} arrivera {format_datetime_fr(session.date).lower()} "
-                f"à {t}.\n\nMerci d'utiliser Q-Emplois! 🙏"
-            )
+            return self._complete_booking(session, self._create_booking_api(session))
 
-        if msg in no:
+        if answer == "no":
             session.state = BookingState.SHOW_PROVIDERS
             return "D'accord. Choisissez un autre professionnel (1, 2 ou 3)."
 
         return "Répondez 'oui' pour confirmer ou 'non' pour annuler."
 
+    async def _handle_confirmation_async(self, session: BookingData, msg: str) -> str:
+        if self._confirmation(msg) == "yes":
+            return self._complete_booking(session, await self._create_booking_api_async(session))
+        return self._handle_confirmation(session, msg)
+
+    def _complete_booking(self, session: BookingData, result: dict) -> str:
+        session.booking_id = result.get("booking_id") or generate_booking_id()
+        session.state = BookingState.COMPLETED
+
+        provider = session.selected_provider
+        h, m = session.time
+        t = f"{h}h{m:02d}" if m else f"{h}h"
+
+        pay_url = result.get("payment_url") or (
+            f"https://pay.qemplois.ca/sess_{session.booking_id.lower().replace('-', '')}"
+        )
+
+        return (
+            f"🎉 Réservation confirmée!\n\n"
+            f"Numéro: #{session.booking_id}\n\n"
+            f"💳 Paiement sécurisé:\n{pay_url}\n\n"
+            f"Vous recevrez un SMS de confirmation.\n"
+            f"{provider.name.split()[0]} arrivera {format_datetime_fr(session.date).lower()} "
+            f"à {t}.\n\nMerci d'utiliser Q-Emplois! 🙏"
+        )
+
     # ── API calls (FIX 1: Real API) ───────────────────────────────────────────
 
     def _search_providers(self, session: BookingData) -> str:
-        providers = self._fetch_providers_api(session)
-        if not providers:
+        return self._show_providers(session, self._find_providers(session))
+
+    async def _search_providers_async(self, session: BookingData) -> str:
+        await self._await_prefetch(session)
+        return self._show_providers(session, await self._find_providers_async(session))
+
+    def _widen_search(self, session: BookingData) -> str:
+        if not self._try_widen(session):
+            return self.NOTHING_FURTHER_MESSAGE
+        return self._search_providers(session)
+
+    async def _widen_search_async(self, session: BookingData) -> str:
+        if not self._try_widen(session):
+            return self.NOTHING_FURTHER_MESSAGE
+        return await self._search_providers_async(session)
+
+    def _try_widen(self, session: BookingData) -> bool:
+        if session.search_radius_km >= self.MAX_RADIUS_KM:
+            return False
+        session.search_radius_km = min(session.search_radius_km * 2, self.MAX_RADIUS_KM)
+        return True
+
+    # Provider search goes through the local spatial index; the API is only
+    # hit to refresh it (incrementally, via updatedSince) once it goes stale.
+
+    def _find_providers(self, session: BookingData) -> List[Dict]:
+        """Nearest available providers, served from the search cache when possible"""
+        key = self._search_key(session)
+        if key is None:
+            return self._load_providers(session)
+        snapshot = replace(session, providers=[])
+        providers = self.provider_cache.get_or_load(key, lambda: self._load_providers(snapshot))
+        return self._localize(providers, session.location)
+
+    async def _find_providers_async(self, session: BookingData) -> List[Dict]:
+        key = self._search_key(session)
+        if key is None:
+            return await self._load_providers_async(session)
+        snapshot = replace(session, providers=[])
+        providers = await self.provider_cache.get_or_load_async(
+            key, lambda: self._load_providers_async(snapshot),
+        )
+        return self._localize(providers, session.location)
+
+    def invalidate_provider_searches(self, service_type: Optional[str] = None):
+        """Called when a booking changes provider availability"""
+        self.provider_cache.invalidate(service_type)
+        self.provider_index.mark_stale(service_type)
+
+    def _search_key(self, session: BookingData) -> Optional[tuple]:
+        location = session.location
+        if not location or location.get("lat") is None:
+            return None
+        # Same date as the per-date provider index the shortlist is loaded from
+        return search_key(
+            session.service_type,
+            location["lat"],
+            location["lng"],
+            self._index_date(session),
+            session.search_radius_km,
+        )
+
+    @staticmethod
+    def _localize(providers: List[Dict], location: Dict) -> List[Dict]:
+        """Re-measure a shared shortlist from this user's exact location"""
+        localized = []
+        for p in providers:
+            coords = provider_coords(p)
+            if coords is not None:
+                p = {**p, "distance_km": round(
+                    haversine_km(location["lat"], location["lng"], *coords), 1)}
+            localized.append(p)
+        localized.sort(key=lambda p: p.get("distance_km", 0))
+        return localized
+
+    @staticmethod
+    def _index_date(session: BookingData) -> Optional[str]:
+        """Availability is per day: the provider index is kept per service and date"""
+        return session.date.date().isoformat() if session.date else None
+
+    def _load_providers(self, session: BookingData) -> List[Dict]:
+        date = self._index_date(session)
+        if self.provider_index.is_stale(session.service_type, date):
+            since = self.provider_index.refreshed_at(session.service_type, date)
+            self._refresh_provider_index(session, self._fetch_providers_api(session, since))
+        return self._query_provider_index(session)
+
+    async def _load_providers_async(self, session: BookingData) -> List[Dict]:
+        date = self._index_date(session)
+        if self.provider_index.is_stale(session.service_type, date):
+            since = self.provider_index.refreshed_at(session.service_type, date)
+            self._refresh_provider_index(
+                session, await self._fetch_providers_api_async(session, since),
+            )
+        return self._query_provider_index(session)
+
+    def _refresh_provider_index(self, session: BookingData, providers: Optional[List[Dict]]):
+        # None is a failed call: stay stale and retry next time. An empty list
+        # is a valid answer (nothing changed since updatedSince).
+        if providers is not None:
+            self.provider_index.upsert(session.service_type, providers, date=self._index_date(session))
+
+    def _query_provider_index(self, session: BookingData) -> List[Dict]:
+        location = session.location
+        date = self._index_date(session)
+        if location and location.get("lat") is not None:
+            nearby = self.provider_index.nearest(
+                session.service_type,
+                location["lat"],
+                location["lng"],
+                k=self.MAX_PROVIDERS_SHOWN,
+                radius_km=session.search_radius_km,
+                date=date,
+            )
+            if nearby:
+                return nearby
+        # Providers without coordinates can't be ranked: keep API order
+        unlocated = [
+            p for p in self.provider_index.providers(session.service_type, date)
+            if provider_coords(p) is None
+        ]
+        return unlocated[:self.MAX_PROVIDERS_SHOWN]
+
+    def _show_providers(self, session: BookingData, providers: List[Dict]) -> str:
+        if not providers and not self.provider_index.providers(
+                session.service_type, self._index_date(session)):
             # Fallback to mock so bot never dies in dev
             logger.warning("API returned no providers — using fallback mock data")
             providers = self._mock_providers()
 
-        session.providers = providers
+        session.providers = [ProviderRecord.from_dict(p) for p in providers]
         session.state = BookingState.SHOW_PROVIDERS
-        return self._format_providers_list(session, providers)
+        return self._format_providers_list(session, session.providers)
+
+    # Request builders are shared by the sync and async transports of
+    # HttpClient so both paths hit the API identically.
+
+    def _auth_headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def _providers_request(self, session: BookingData, updated_since: Optional[float] = None) -> dict:
+        # No geo filter: the index answers every user's location, not the first one's
+        params = {"serviceType": session.service_type}
+        if session.date:
+            params["date"] = self._index_date(session)
+        if updated_since is not None:
+            params["updatedSince"] = datetime.utcfromtimestamp(updated_since).isoformat() + "Z"
+        return {
+            "url": f"{self.api_base}/providers",
+            "params": params,
+            "headers": self._auth_headers(),
+        }
+
+    @staticmethod
+    def _idempotency_key(session: BookingData) -> str:
+        """Same conversation, slot and provider -> same key, so a retried POST books once.
+        A new conversation for the same slot (rebooking after a cancel) gets a new key."""
+        h, m = session.time
+        booking = (f"{session.platform}:{session.user_id}:{session.started_at:.6f}:"
+                   f"{session.service_type}:{session.date.date().isoformat()}:{h:02d}:{m:02d}:"
+                   f"{session.selected_provider.id}")
+        return hashlib.sha256(booking.encode()).hexdigest()[:32]
 
-    def _fetch_providers_api(self, session: BookingData) -> List[Dict]:
-        """FIX 1: Real call to Q-Emplois /api/services/search"""
+    def _booking_request(self, session: BookingData) -> dict:
+        h, m = session.time
+        return {
+            "url": f"{self.api_base}/bookings",
+            "json": {
+                "serviceType": session.service_type,
+                "date": session.date.date().isoformat(),
+                "time": f"{h:02d}:{m:02d}",
+                "location": session.location,
+                "providerId": session.selected_provider.id,
+            },
+            "headers": {**self._auth_headers(), "Idempotency-Key": self._idempotency_key(session)},
+        }
+
+    @staticmethod
+    def _parse_booking_response(data: dict) -> dict:
+        return {
+            "booking_id": data.get("id", generate_booking_id()),
+            "payment_url": data.get("paymentUrl"),
+        }
+
+    def _fetch_providers_api(
+        self, session: BookingData, updated_since: Optional[float] = None,
+    ) -> Optional[List[Dict]]:
+        """FIX 1: Real call to Q-Emplois /api/services/search; None if the call failed"""
         try:
-            resp = requests.get(
-                f"{self.api_base}/providers",
-                params={
-                    "serviceType": session.service_type,
-                },
-                headers={"Authorization": f"Bearer {self.api_key}"},
-                timeout=8,
-            )
+            resp = self.http.get("providers", **self._providers_request(session, updated_since))
             resp.raise_for_status()
             return resp.json().get("providers", [])
         except Exception as e:
             logger.error(f"Provider search API error: {e}")
-            return []
+            return None
+
+    async def _fetch_providers_api_async(
+        self, session: BookingData, updated_since: Optional[float] = None,
+    ) -> Optional[List[Dict]]:
+        try:
+            resp = await self.http.aget("providers", **self._providers_request(session, updated_since))
+            resp.raise_for_status()
+            return resp.json().get("providers", [])
+        except Exception as e:
+            logger.error(f"Provider search API error: {e}")
+            return None
 
     def _create_booking_api(self, session: BookingData) -> dict:
         """FIX 1: Real booking creation"""
-        h, m = session.time
         try:
-            resp = requests.post(
-                f"{self.api_base}/bookings",
-                json={
-                    "serviceType": session.service_type,
-                    "date": session.date.date().isoformat(),
-                    "time": f"{h:02d}:{m:02d}",
-                    "location": session.location,
-                    "providerId": session.selected_provider["id"],
-                },
-                headers={"Authorization": f"Bearer {self.api_key}"},
-                timeout=10,
-            )
+            resp = self.http.post("bookings", **self._booking_request(session))
             resp.raise_for_status()
-            data = resp.json()
-            return {
-                "booking_id": data.get("id", generate_booking_id()),
-                "payment_url": data.get("paymentUrl"),
-            }
+            return self._parse_booking_response(resp.json())
+        except Exception as e:
+            logger.error(f"Booking creation API error: {e}")
+            return {"booking_id": generate_booking_id(), "payment_url": None}
+
+    async def _create_booking_api_async(self, session: BookingData) -> dict:
+        try:
+            resp = await self.http.apost("bookings", **self._booking_request(session))
+            resp.raise_for_status()
+            return self._parse_booking_response(resp.json())
         except Exception as e:
             logger.error(f"Booking creation API error: {e}")
             return {"booking_id": generate_booking_id(), "payment_url": None}
 
     # ── Geocoding (FIX 2: Real geocoding) ────────────────────────────────────
 
+    def _geocode_request(self, address: str) -> dict:
+        return {
+            "url": self.NOMINATIM_URL,
+            "params": {
+                "q": f"{address}, Québec, Canada",
+                "format": "json",
+                "limit": 1,
+                "countrycodes": "ca",
+                "addressdetails": 1,
+            },
+            "headers": {"User-Agent": self.NOMINATIM_USER_AGENT},
+        }
+
+    @staticmethod
+    def _parse_geocode_results(address: str, results: list) -> dict:
+        if results:
+            r = results[0]
+            return {
+                "lat": float(r["lat"]),
+                "lng": float(r["lon"]),
+                "display": r.get("display_name", address),
+                "found": True,
+            }
+        # Default: Montreal center
+        return {"lat": 45.5019, "lng": -73.5674, "display": address, "found": False}
+
+    def _geocode_local(self, address: str) -> Optional[dict]:
+        """Offline lookup; a miss falls through to Nominatim unless mode is 'local'"""
+        if self.local_geocoder is not None and self.geocoder_mode != "nominatim":
+            result = self.local_geocoder.geocode(address)
+            if result is not None:
+                return result
+        if self.geocoder_mode == "local":
+            return self._parse_geocode_results(address, [])
+        return None
+
     def _geocode(self, address: str) -> dict:
         """Nominatim geocoding — free, no API key, Quebec-biased"""
+        local = self._geocode_local(address)
+        if local is not None:
+            return local
+        cached = self.geocode_cache.get(address)
+        if cached is not None:
+            return cached
+
+        def fetch() -> dict:
+            resp = self.http.get("geocode", **self._geocode_request(address))
+            return self._parse_geocode_results(address, resp.json())
+
         try:
-            resp = requests.get(
-                "https://nominatim.openstreetmap.org/search",
-                params={
-                    "q": f"{address}, Québec, Canada",
-                    "format": "json",
-                    "limit": 1,
-                    "countrycodes": "ca",
-                    "addressdetails": 1,
-                },
-                headers={"User-Agent": "Q-Emplois/2.0 (contact@qemplois.ca)"},
-                timeout=6,
-            )
-            results = resp.json()
-            if results:
-                r = results[0]
-                return {
-                    "lat": float(r["lat"]),
-                    "lng": float(r["lon"]),
-                    "display": r.get("display_name", address),
-                    "found": True,
-                }
+            result = self.geocode_scheduler.run(GeocodeCache.key(address), fetch)
         except Exception as e:
+            # Transport errors are not cached: the address may well exist
             logger.error(f"Geocoding error: {e}")
+            return self._parse_geocode_results(address, [])
+        if result is None:
+            logger.warning("Geocode shed by rate limiter — using fallback location")
+            return self._parse_geocode_results(address, [])
+        self.geocode_cache.put(address, result)
+        return result
+
+    async def _geocode_async(self, address: str) -> dict:
+        local = self._geocode_local(address)
+        if local is not None:
+            return local
+        cached = await self.geocode_cache.get_async(address)
+        if cached is not None:
+            return cached
+
+        async def fetch() -> dict:
+            resp = await self.http.aget("geocode", **self._geocode_request(address))
+            return self._parse_geocode_results(address, resp.json())
 
-        # Default: Montreal center
-        return {"lat": 45.5019, "lng": -73.5674, "display": address, "found": False}
+        try:
+            result = await self.geocode_scheduler.run_async(GeocodeCache.key(address), fetch)
+        except Exception as e:
+            logger.error(f"Geocoding error: {e}")
+            return self._parse_geocode_results(address, [])
+        if result is None:
+            logger.warning("Geocode shed by rate limiter — using fallback location")
+            return self._parse_geocode_results(address, [])
+        await self.geocode_cache.put_async(address, result)
+        return result
 
     # ── Formatters ────────────────────────────────────────────────────────────
 
-    def _format_providers_list(self, session: BookingData, providers: List[Dict]) -> str:
+    def _format_providers_list(self, session: BookingData, providers: List[ProviderRecord]) -> str:
         if not providers:
             return (
                 "😔 Aucun professionnel disponible pour cette date/heure.\n\n"
@@ -360,10 +838,10 @@ class BookingFlow:
         msg = f"🔍 {len(providers)} professionnel(s) disponible(s):\n\n"
         for i, p in enumerate(providers, 1):
             msg += (
-                f"{i}. {p['name']} ⭐ {p.get('rating', '?')} "
-                f"({p.get('reviews', 0)} avis)\n"
-                f"   {format_price(p['price_per_hour'])}/heure — "
-                f"{format_distance(p.get('distance_km', 0))}\n\n"
+                f"{i}. {p.name} ⭐ {p.rating or '?'} "
+                f"({p.reviews} avis)\n"
+                f"   {format_price(p.price_per_hour)}/heure — "
+                f"{format_distance(p.distance_km)}\n\n"
             )
 
         msg += "Quel professionnel? (1"
@@ -377,19 +855,16 @@ class BookingFlow:
         h, m = session.time
         t = f"{h}h{m:02d}" if m else f"{h}h"
 
-        service_label = session.service_type.title()
-        for _, (sid, slabel) in self.SERVICES.items():
-            if sid == session.service_type:
-                service_label = slabel
-                break
+        service = self.services.get(session.service_type)
+        service_label = service.label() if service else session.service_type.title()
 
         return (
             f"📋 Récapitulatif:\n\n"
             f"Service: {service_label}\n"
             f"Date: {format_datetime_fr(session.date)} à {t}\n"
             f"Lieu: {session.location['address']}\n\n"
-            f"Professionnel: {p['name']}\n"
-            f"⭐ {p.get('rating', '?')} ({p.get('reviews', 0)} avis)\n"
+            f"Professionnel: {p.name}\n"
+            f"⭐ {p.rating or '?'} ({p.reviews} avis)\n"
             f"💰 Prix estimé: {format_price(session.price_estimate)} (2h)\n\n"
             "Confirmer? (oui/non)"
         )
@@ -404,23 +879,8 @@ class BookingFlow:
 
     # ── Static messages ───────────────────────────────────────────────────────
 
-    def get_welcome_message(self) -> str:
-        services = "\n".join(f"{k}. {v[1]}" for k, v in self.SERVICES.items())
-        return (
-            "Bonjour! 👋 Je suis Q-Emplois, votre assistant pour trouver "
-            "des professionnels au Québec.\n\n"
-            f"Quel service cherchez-vous?\n\n{services}\n\n"
-            "(Entrez le numéro ou le nom du service)"
-        )
+    def get_welcome_message(self, locale: str = "fr") -> str:
+        return self.services.welcome[locale]
 
-    def get_help_message(self) -> str:
-        return (
-            "🆘 AIDE Q-EMPLOIS\n\n"
-            "/start — Commencer une réservation\n"
-            "/aide — Cette aide\n"
-            "/mesreservations — Mes réservations\n"
-            "/annuler [numéro] — Annuler\n"
-            "/profil — Mon profil\n"
-            "/devenirpro — Devenir prestataire\n\n"
-            "Propulsé par KimiClaw ⚡"
-        )
+    def get_help_message(self, locale: str = "fr") -> str:
+        return self.services.help[locale]
@@ -9,28 +9,69 @@ Handles Telegram and WhatsApp messages
 import json
 import os
 import logging
-from typing import Dict, Optional
-
-from .booking_flow import BookingFlow, BookingState
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .aio import run_sync
+from .booking_flow import BookingData, BookingFlow, BookingState
+from .dispatcher import ConversationDispatcher
+from .geocache import GeocodeCache
+from .idempotency import IdempotencyCache
 from .auth_handler import get_auth_handler, AuthHandler
+from .fanout import FanOutDispatcher, HttpSender, Sender, StubSender
 from .job_notifications import JobNotifier, JobRequest
+from .ratelimit import InboundLimiter
+from .session_store import MemorySessionStore, RedisSessionStore, SessionStore, session_key
+from .utils import parse_date
 
 logger = logging.getLogger(__name__)
 
+THROTTLED_MESSAGE = "⏳ Vous envoyez trop de messages. Réessayez dans quelques secondes."
+
 
 class WhatsAppHandler:
     """WhatsApp-specific handler"""
     
-    def __init__(self, booking_flow: BookingFlow, auth_handler: AuthHandler):
+    def __init__(self, booking_flow: BookingFlow, auth_handler: AuthHandler,
+                 limiter: Optional[InboundLimiter] = None,
+                 dedup: Optional[IdempotencyCache] = None,
+                 dispatcher: Optional[ConversationDispatcher] = None):
         self.booking_flow = booking_flow
         self.auth_handler = auth_handler
+        self.limiter = limiter or InboundLimiter()
+        self.dedup = dedup or IdempotencyCache()
+        self.dispatcher = dispatcher or ConversationDispatcher()
         self.notifier = JobNotifier()
     
     def handle_message(self, message_data: dict) -> dict:
         """Handle incoming WhatsApp message"""
-        return self._handle_platform_message('whatsapp', message_data)
+        return run_sync(self.handle_message_async(message_data))
     
-    def _handle_platform_message(self, platform: str, message_data: dict) -> dict:
+    async def handle_message_async(self, message_data: dict) -> dict:
+        """Handle incoming WhatsApp message without blocking the event loop"""
+        user_id = self._extract_user_id(message_data)
+        if not user_id:
+            return {'error': 'Invalid message format'}
+        # Queue behind this user's earlier messages before the first await, so
+        # dedup, rate-limit and link lookups cannot reorder them
+        return await self.dispatcher.submit(
+            session_key(user_id, 'whatsapp'),
+            lambda: self._handle_once(message_data),
+        )
+    
+    async def _handle_once(self, message_data: dict) -> dict:
+        """Claim the message id, then handle it; released again on failure"""
+        key = self._message_key(message_data)
+        if key and not await self.dedup.claim_async(key):
+            return {'status': 'duplicate'}
+        try:
+            return await self._handle_platform_message('whatsapp', message_data)
+        except Exception:
+            if key:
+                await self.dedup.release_async(key)
+            raise
+    
+    async def _handle_platform_message(self, platform: str, message_data: dict) -> dict:
         """Handle message from WhatsApp"""
         user_id = self._extract_user_id(message_data)
         message_text = self._extract_message_text(message_data)
@@ -38,23 +79,39 @@ class WhatsAppHandler:
         if not user_id or not message_text:
             return {'error': 'Invalid message format'}
         
+        # Throttle floods before any Redis, geocoding or API work
+        if await self.limiter.check_async(platform, user_id):
+            return self._throttled(platform, user_id)
+        
         # Check for token in message (auth linking)
         if message_text.startswith('qem_'):
-            return self._handle_auth_token(user_id, message_text)
+            return await self._handle_auth_token(user_id, message_text)
         
         # Check if user is linked
-        link = self.auth_handler.get_linked_user(platform, user_id)
+        link = await self.auth_handler.get_linked_user_async(platform, user_id)
         if not link:
             return self._get_auth_prompt(user_id)
         
-        # Process booking flow
-        response_text = self.booking_flow.handle_message(user_id, platform, message_text)
+        # Process booking flow (already in order with this user's other messages)
+        response_text = await self.booking_flow.handle_message_async(user_id, platform, message_text)
         
         return {
             'text': response_text,
             'to': user_id,
         }
     
+    def _throttled(self, platform: str, user_id: str) -> dict:
+        """Warn once per interval, then drop silently"""
+        if self.limiter.should_notify(platform, user_id):
+            return {'status': 'throttled', 'text': THROTTLED_MESSAGE, 'to': user_id}
+        return {'status': 'throttled'}
+    
+    @staticmethod
+    def _message_key(message_data: dict) -> Optional[str]:
+        """Redelivery key: Cloud API message id or Twilio MessageSid"""
+        message_id = message_data.get('id') or message_data.get('MessageSid')
+        return f"msg:whatsapp:{message_id}" if message_id else None
+    
     def _extract_user_id(self, message_data: dict) -> Optional[str]:
         """Extract WhatsApp user ID (phone number)"""
         try:
@@ -72,9 +129,9 @@ class WhatsAppHandler:
         except:
             return None
     
-    def _handle_auth_token(self, user_id: str, token: str) -> dict:
+    async def _handle_auth_token(self, user_id: str, token: str) -> dict:
         """Handle auth token submission"""
-        success = self.auth_handler.verify_platform_token('whatsapp', user_id, token)
+        success = await self.auth_handler.verify_platform_token_async('whatsapp', user_id, token)
         
         if success:
             return {
@@ -114,16 +171,46 @@ class WhatsAppHandler:
 class TelegramHandler:
     """Telegram-specific handler"""
     
-    def __init__(self, booking_flow: BookingFlow, auth_handler: AuthHandler):
+    def __init__(self, booking_flow: BookingFlow, auth_handler: AuthHandler,
+                 limiter: Optional[InboundLimiter] = None,
+                 dedup: Optional[IdempotencyCache] = None,
+                 dispatcher: Optional[ConversationDispatcher] = None):
         self.booking_flow = booking_flow
         self.auth_handler = auth_handler
+        self.limiter = limiter or InboundLimiter()
+        self.dedup = dedup or IdempotencyCache()
+        self.dispatcher = dispatcher or ConversationDispatcher()
         self.notifier = JobNotifier()
     
     def handle_message(self, message_data: dict) -> dict:
         """Handle incoming Telegram message"""
-        return self._handle_platform_message('telegram', message_data)
+        return run_sync(self.handle_message_async(message_data))
     
-    def _handle_platform_message(self, platform: str, message_data: dict) -> dict:
+    async def handle_message_async(self, message_data: dict) -> dict:
+        """Handle incoming Telegram message without blocking the event loop"""
+        user_id = self._extract_user_id(message_data)
+        if not user_id:
+            return {'error': 'Invalid message format'}
+        # Queue behind this user's earlier messages before the first await, so
+        # dedup, rate-limit and link lookups cannot reorder them
+        return await self.dispatcher.submit(
+            session_key(user_id, 'telegram'),
+            lambda: self._handle_once(message_data),
+        )
+    
+    async def _handle_once(self, message_data: dict) -> dict:
+        """Claim the message id, then handle it; released again on failure"""
+        key = self._message_key(message_data)
+        if key and not await self.dedup.claim_async(key):
+            return {'status': 'duplicate'}
+        try:
+            return await self._handle_platform_message('telegram', message_data)
+        except Exception:
+            if key:
+                await self.dedup.release_async(key)
+            raise
+    
+    async def _handle_platform_message(self, platform: str, message_data: dict) -> dict:
         """Handle message from Telegram"""
         user_id = self._extract_user_id(message_data)
         message_text = self._extract_message_text(message_data)
@@ -131,20 +218,24 @@ class TelegramHandler:
         if not user_id or not message_text:
             return {'error': 'Invalid message format'}
         
+        # Throttle floods before any Redis, geocoding or API work
+        if await self.limiter.check_async(platform, user_id):
+            return self._throttled(platform, user_id)
+        
         # Handle /start with token
         if message_text.startswith('/start'):
             parts = message_text.split()
             if len(parts) > 1:
                 # Token passed via deep link
-                return self._handle_auth_token(user_id, parts[1])
+                return await self._handle_auth_token(user_id, parts[1])
         
         # Check if user is linked
-        link = self.auth_handler.get_linked_user(platform, user_id)
+        link = await self.auth_handler.get_linked_user_async(platform, user_id)
         if not link:
             return self._get_auth_prompt(user_id)
         
-        # Process booking flow
-        response_text = self.booking_flow.handle_message(user_id, platform, message_text)
+        # Process booking flow (already in order with this user's other messages)
+        response_text = await self.booking_flow.handle_message_async(user_id, platform, message_text)
         
         return {
             'text': response_text,
@@ -152,6 +243,23 @@ class TelegramHandler:
             'parse_mode': 'HTML',
         }
     
+    def _throttled(self, platform: str, user_id: str) -> dict:
+        """Warn once per interval, then drop silently"""
+        if self.limiter.should_notify(platform, user_id):
+            return {'status': 'throttled', 'text': THROTTLED_MESSAGE, 'chat_id': user_id}
+        return {'status': 'throttled'}
+    
+    @staticmethod
+    def _message_key(message_data: dict) -> Optional[str]:
+        """Redelivery key: update id, or message id (unique per chat)"""
+        if message_data.get('update_id') is not None:
+            return f"msg:telegram:u{message_data['update_id']}"
+        message_id = message_data.get('message_id')
+        chat_id = message_data.get('chat', {}).get('id') or message_data.get('from', {}).get('id')
+        if message_id is None or chat_id is None:
+            return None
+        return f"msg:telegram:{chat_id}:{message_id}"
+    
     def _extract_user_id(self, message_data: dict) -> Optional[str]:
         """Extract Telegram user ID"""
         try:
@@ -167,9 +275,9 @@ class TelegramHandler:
         except:
             return None
     
-    def _handle_auth_token(self, user_id: str, token: str) -> dict:
+    async def _handle_auth_token(self, user_id: str, token: str) -> dict:
         """Handle auth token submission"""
-        success = self.auth_handler.verify_platform_token('telegram', user_id, token)
+        success = await self.auth_handler.verify_platform_token_async('telegram', user_id, token)
         
         if success:
             return {
@@ -211,33 +319,101 @@ class QEmploisBot:
     """Main bot handler for Q-Emplois — KimiClaw Edition"""
     
     def __init__(self):
-        self.booking_flow = BookingFlow()
         self.auth_handler = get_auth_handler()
-        self.whatsapp = WhatsAppHandler(self.booking_flow, self.auth_handler)
-        self.telegram = TelegramHandler(self.booking_flow, self.auth_handler)
+        self.auth_handler.start_link_listener()
+        # Geocodes are shared across workers through the auth Redis connection
+        self.booking_flow = BookingFlow(
+            geocode_cache=GeocodeCache(
+                redis_client=self.auth_handler.redis,
+                async_redis=lambda: self.auth_handler.aredis,
+            ),
+            session_store=self._session_store(),
+        )
+        # One set of buckets for both platforms, shared in Redis with QEMPLOIS_RATELIMIT=redis
+        self.limiter = InboundLimiter.from_env(
+            redis_client=self.auth_handler.redis,
+            async_redis=lambda: self.auth_handler.aredis,
+        )
+        # Redelivered updates and retried backend events are handled once
+        self.dedup = IdempotencyCache(
+            ttl=int(os.environ.get("QEMPLOIS_IDEMPOTENCY_TTL", 86400)),
+            redis_client=self.auth_handler.redis,
+            async_redis=lambda: self.auth_handler.aredis,
+        )
+        self.dispatcher = ConversationDispatcher.from_env()
+        self.whatsapp = WhatsAppHandler(self.booking_flow, self.auth_handler,
+                                        self.limiter, self.dedup, self.dispatcher)
+        self.telegram = TelegramHandler(self.booking_flow, self.auth_handler,
+                                        self.limiter, self.dedup, self.dispatcher)
         self.job_notifier = JobNotifier()
+        self.fanout = FanOutDispatcher.from_env(self._sender(), self.job_notifier)
+        # Client notifications go through the same durable outbox as auth webhooks
+        self.outbox = self.auth_handler.outbox
+        self.outbox.register("message", self._deliver_messages)
+    
+    def _sender(self) -> Sender:
+        """Outbound messages: Telegram/Twilio, or kept in memory with QEMPLOIS_SENDER=stub"""
+        if os.environ.get("QEMPLOIS_SENDER", "http") == "stub":
+            return StubSender()
+        return HttpSender()
+    
+    def _deliver_messages(self, messages: List[Dict]):
+        """Outbox handler for queued chat messages"""
+        for message in messages:
+            run_sync(self.fanout.sender.send(message['platform'], message['chat_id'], message['text']))
+    
+    def _queue_message(self, platform: str, result: dict) -> dict:
+        """Queue a notification built by a webhook handler; the result gains its outbox id"""
+        if result.get('user_id') and result.get('message'):
+            result['outbox_id'] = self.outbox.enqueue("message", {
+                'platform': platform,
+                'chat_id': str(result['user_id']),
+                'text': result['message'],
+            })
+        return result
+    
+    def _session_store(self) -> SessionStore:
+        """Conversations live in Redis so any worker can pick them up"""
+        if os.environ.get("QEMPLOIS_SESSION_STORE", "redis") == "memory":
+            return MemorySessionStore()
+        return RedisSessionStore(
+            redis_client=self.auth_handler.redis,
+            async_redis=lambda: self.auth_handler.aredis,
+        )
     
     def handle_telegram_message(self, message_data: dict) -> dict:
         """Handle incoming Telegram message"""
-        return self.telegram.handle_message(message_data)
+        return run_sync(self.handle_telegram_message_async(message_data))
     
     def handle_whatsapp_message(self, message_data: dict) -> dict:
         """Handle incoming WhatsApp message"""
-        return self.whatsapp.handle_message(message_data)
+        return run_sync(self.handle_whatsapp_message_async(message_data))
     
-    def notify_provider_new_job(self, provider_contact: dict, job_details: dict) -> dict:
-        """Send new job notification to provider"""
-        job = JobRequest(
+    async def handle_telegram_message_async(self, message_data: dict) -> dict:
+        """Handle incoming Telegram message without blocking the event loop"""
+        return await self.telegram.handle_message_async(message_data)
+    
+    async def handle_whatsapp_message_async(self, message_data: dict) -> dict:
+        """Handle incoming WhatsApp message without blocking the event loop"""
+        return await self.whatsapp.handle_message_async(message_data)
+    
+    @staticmethod
+    def _job_request(job_details: dict) -> JobRequest:
+        return JobRequest(
             booking_id=job_details['booking_id'],
             service_type=job_details['service_type'],
             date=job_details['date'],
             time=job_details['time'],
             location=job_details['location'],
-            distance_km=job_details['distance_km'],
+            distance_km=job_details.get('distance_km', 0.0),
             client_name=job_details.get('client_name', 'Client'),
             price_estimate=job_details['price_estimate'],
             notes=job_details.get('notes')
         )
+    
+    def notify_provider_new_job(self, provider_contact: dict, job_details: dict) -> dict:
+        """Send new job notification to provider"""
+        job = self._job_request(job_details)
         
         message = self.job_notifier.format_new_job_alert(job)
         
@@ -247,8 +423,43 @@ class QEmploisBot:
             'actions': ['accept', 'decline']
         }
     
-    def confirm_booking_client(self, booking_data: dict) -> dict:
-        """Send booking confirmation to client"""
+    def _nearest_providers(self, job_details: dict, k: int, radius_km: float) -> List[Dict]:
+        """Providers closest to the job, from the booking flow's spatial index"""
+        lat, lng = job_details.get('lat'), job_details.get('lng')
+        if lat is None or lng is None:
+            return []
+        return self.booking_flow.provider_index.nearest(
+            job_details['service_type'], float(lat), float(lng), k=k, radius_km=radius_km,
+            date=self._job_date(job_details),
+        )
+    
+    @staticmethod
+    def _job_date(job_details: dict) -> Optional[str]:
+        """ISO date of the job for the per-day index; None searches every date held"""
+        parsed = parse_date(str(job_details.get('date') or ''))
+        return parsed.date().isoformat() if parsed else None
+    
+    async def notify_providers_new_job_async(self, job_details: dict,
+                                             providers: Optional[List[Dict]] = None,
+                                             k: int = 10, radius_km: float = 25) -> dict:
+        """Offer a job to several providers at once (the ``k`` nearest if none given)"""
+        job = self._job_request(job_details)
+        if providers is None:
+            providers = self._nearest_providers(job_details, k, radius_km)
+        results = await self.fanout.notify_new_job_async(job, providers)
+        summary = {'booking_id': job.booking_id, 'sent': 0, 'failed': 0, 'skipped': 0}
+        for result in results:
+            summary[result.status] += 1
+        summary['results'] = [result.to_dict() for result in results]
+        return summary
+    
+    def notify_providers_new_job(self, job_details: dict, providers: Optional[List[Dict]] = None,
+                                 k: int = 10, radius_km: float = 25) -> dict:
+        """Offer a job to several providers at once (the ``k`` nearest if none given)"""
+        return run_sync(self.notify_providers_new_job_async(job_details, providers, k, radius_km))
+    
+    def confirm_booking_client(self, booking_data: dict, platform: str = "text") -> dict:
+        """Send booking confirmation to client, rendered for ``platform``"""
         message = self.job_notifier.format_booking_confirmed_client(
             booking_id=booking_data['booking_id'],
             provider_name=booking_data['provider_name'],
@@ -256,7 +467,8 @@ class QEmploisBot:
             date=booking_data['date'],
             time=booking_data['time'],
             service=booking_data['service_type'],
-            cancel_token=booking_data.get('cancel_token', 'xxx')
+            cancel_token=booking_data.get('cancel_token', 'xxx'),
+            platform=platform,
         )
         
         return {
@@ -264,24 +476,58 @@ class QEmploisBot:
             'message': message
         }
     
+    @staticmethod
+    def _event_key(webhook_data: dict) -> Optional[str]:
+        """Event id, or event type + booking id for booking events sent without one"""
+        event_id = webhook_data.get('id') or webhook_data.get('event_id')
+        if event_id:
+            return f"event:{event_id}"
+        event_type = webhook_data.get('event') or ''
+        if not event_type.startswith('booking.'):
+            return None
+        details = webhook_data.get('job') or webhook_data.get('booking') or {}
+        booking_id = webhook_data.get('booking_id') or details.get('booking_id')
+        return f"event:{event_type}:{booking_id}" if booking_id else None
+    
     def handle_webhook(self, platform: str, webhook_data: dict) -> dict:
-        """Handle webhook from Q-Emplois platform"""
+        """Handle webhook from Q-Emplois platform; retried deliveries are processed once"""
+        key = self._event_key(webhook_data)
+        if key and not self.dedup.claim(key):
+            return {'status': 'duplicate'}
+        try:
+            return self._handle_webhook(platform, webhook_data)
+        except Exception:
+            if key:
+                self.dedup.release(key)
+            raise
+    
+    def _handle_webhook(self, platform: str, webhook_data: dict) -> dict:
         event_type = webhook_data.get('event')
         
+        if event_type in ('booking.created', 'booking.confirmed'):
+            # The booked provider may no longer be free: drop cached searches
+            details = webhook_data.get('job') or webhook_data.get('booking') or {}
+            self.booking_flow.invalidate_provider_searches(details.get('service_type'))
+        
         if event_type == 'booking.created':
+            if 'providers' in webhook_data:
+                return self.notify_providers_new_job(webhook_data.get('job', {}),
+                                                     webhook_data['providers'])
             return self.notify_provider_new_job(
                 webhook_data.get('provider', {}),
                 webhook_data.get('job', {})
             )
         
         elif event_type == 'booking.confirmed':
-            return self.confirm_booking_client(webhook_data.get('booking', {}))
+            return self._queue_message(
+                platform, self.confirm_booking_client(webhook_data.get('booking', {}), platform))
         
         elif event_type == 'booking.cancelled':
-            return {
+            return self._queue_message(platform, {
                 'user_id': webhook_data.get('client_id'),
-                'message': f"❌ Votre réservation #{webhook_data.get('booking_id')} a été annulée."
-            }
+                'message': self.job_notifier.format_booking_cancelled_client(
+                    str(webhook_data.get('booking_id')), platform),
+            })
         
         elif event_type == 'auth.linked':
             # Auth linking completed
@@ -319,24 +565,29 @@ def book_service(service_type: str, date: str, time: str,
         address: Full address with city
         provider_id: Optional preferred provider ID
     """
+    return run_sync(book_service_async(service_type, date, time, address, provider_id))
+
+
+async def book_service_async(service_type: str, date: str, time: str,
+                             address: str, provider_id: str = None) -> dict:
+    """Skill: Book a service (async)"""
     bot = get_bot()
     
     # First geocode the address
-    geo = bot.booking_flow._geocode(address)
+    geo = await bot.booking_flow._geocode_async(address)
     if not geo.get('found'):
         return {'error': 'Address not found', 'success': False}
     
-    # Search for providers
-    from datetime import datetime
-    dt = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-    
-    # Create a mock session to search providers
-    class MockSession:
-        service_type = service_type
-        date = dt
-        location = geo
+    # Search for providers with a throwaway session
+    session = BookingData(
+        user_id='skill',
+        platform='kimiclaw',
+        service_type=service_type,
+        date=datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M"),
+        location=geo,
+    )
     
-    providers = bot.booking_flow._fetch_providers_api(MockSession())
+    providers = await bot.booking_flow._find_providers_async(session)
     
     if not providers:
         return {
@@ -372,10 +623,15 @@ def find_providers(service_type: str, address: str, date: str = None) -> dict:
         address: Address to search near
         date: Optional date filter
     """
+    return run_sync(find_providers_async(service_type, address, date))
+
+
+async def find_providers_async(service_type: str, address: str, date: str = None) -> dict:
+    """Skill: Find available service providers (async)"""
     bot = get_bot()
     
     # Geocode address
-    geo = bot.booking_flow._geocode(address)
+    geo = await bot.booking_flow._geocode_async(address)
     
     return {
         'success': True,
@@ -398,8 +654,13 @@ def geocode_address(address: str) -> dict:
     Args:
         address: Full address to geocode
     """
+    return run_sync(geocode_address_async(address))
+
+
+async def geocode_address_async(address: str) -> dict:
+    """Skill: Geocode an address to coordinates (async)"""
     bot = get_bot()
-    result = bot.booking_flow._geocode(address)
+    result = await bot.booking_flow._geocode_async(address)
     
     return {
         'success': result.get('found', False),
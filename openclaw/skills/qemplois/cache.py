@@ -0,0 +1,106 @@
+"""In-process caching primitives for Q-Emplois bot"""
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[V]):
+    """
+    Thread-safe LRU cache with per-entry expiry.
+
+    Expired entries are dropped lazily on access, or in bulk by ``sweep``
+    (an expiry heap makes that proportional to what actually expired); once
+    ``maxsize`` is reached the least recently used entry is evicted.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10_000,
+        ttl: float = 300,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self._expiry: List[Tuple[float, int, Hashable]] = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._data[key]
+                self.expirations += 1
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None):
+        expires_at = self.clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            # seq breaks ties so keys themselves are never compared
+            self._seq += 1
+            heapq.heappush(self._expiry, (expires_at, self._seq, key))
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            if len(self._expiry) > 2 * len(self._data) + 64:
+                self._compact()
+
+    def _compact(self):
+        """Drop heap records superseded by a later set/pop"""
+        self._expiry = [(exp, i, key) for i, (key, (exp, _)) in enumerate(self._data.items())]
+        heapq.heapify(self._expiry)
+        self._seq = len(self._expiry)
+
+    def sweep(self, limit: Optional[int] = None) -> int:
+        """Remove up to ``limit`` expired entries; returns how many were removed"""
+        removed = 0
+        now = self.clock()
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                if limit is not None and removed >= limit:
+                    break
+                expires_at, _, key = heapq.heappop(self._expiry)
+                entry = self._data.get(key)
+                # Stale heap record: the key was re-set (or removed) since
+                if entry is not None and entry[0] == expires_at:
+                    del self._data[key]
+                    removed += 1
+            self.expirations += removed
+        return removed
+
+    def values(self) -> List[V]:
+        with self._lock:
+            return [value for _, value in self._data.values()]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._expiry.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,235 @@
+"""Service catalogue for Q-Emplois bot
+
+The list of services (menu number, labels per locale, emoji, synonyms) is
+data, not code: it is loaded from ``services.json`` (or the file named by
+QEMPLOIS_CATALOG), or fetched from the backend (QEMPLOIS_CATALOG_URL).
+
+A ``ServiceCatalog`` is an immutable snapshot with every lookup table and
+menu message precomputed. ``CatalogStore`` holds the current snapshot and
+swaps in a new one atomically when the file changes or the backend serves
+a new version, from a background thread, so messages never pay for it.
+"""
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .http_client import HttpClient, get_http_client
+from .intents import tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(__file__), "services.json")
+LOCALES = ("fr", "en")
+
+WELCOME_TEMPLATES = {
+    "fr": (
+        "Bonjour! 👋 Je suis Q-Emplois, votre assistant pour trouver "
+        "des professionnels au Québec.\n\n"
+        "Quel service cherchez-vous?\n\n{services}\n\n"
+        "(Entrez le numéro ou le nom du service)"
+    ),
+    "en": (
+        "Hello! 👋 I'm Q-Emplois, your assistant for finding "
+        "professionals in Quebec.\n\n"
+        "Which service are you looking for?\n\n{services}\n\n"
+        "(Enter the number or the name of the service)"
+    ),
+}
+
+HELP_MESSAGES = {
+    "fr": (
+        "🆘 AIDE Q-EMPLOIS\n\n"
+        "/start — Commencer une réservation\n"
+        "/aide — Cette aide\n"
+        "/mesreservations — Mes réservations\n"
+        "/annuler [numéro] — Annuler\n"
+        "/profil — Mon profil\n"
+        "/devenirpro — Devenir prestataire\n\n"
+        "Propulsé par KimiClaw ⚡"
+    ),
+    "en": (
+        "🆘 Q-EMPLOIS HELP\n\n"
+        "/start — Start a booking\n"
+        "/aide — This help\n"
+        "/mesreservations — My bookings\n"
+        "/annuler [number] — Cancel\n"
+        "/profil — My profile\n"
+        "/devenirpro — Become a provider\n\n"
+        "Powered by KimiClaw ⚡"
+    ),
+}
+
+CHOOSE_SERVICE_TEMPLATES = {
+    "fr": "Veuillez choisir un numéro de 1 à {count} ou le nom du service.",
+    "en": "Please choose a number from 1 to {count} or the name of the service.",
+}
+
+
+def name_key(name: str) -> str:
+    """Lookup key for a service name: accents, case and punctuation ignored"""
+    return " ".join(tokenize(name))
+
+
+@dataclass(frozen=True, slots=True)
+class Service:
+    id: str
+    emoji: str
+    labels: Dict[str, str]
+    key: Optional[str] = None  # menu number; None when not offered in the menu
+    aliases: Tuple[str, ...] = ()
+    synonyms: Tuple[str, ...] = ()
+
+    def label(self, locale: str = "fr") -> str:
+        return f"{self.emoji} {self.labels.get(locale) or self.labels['fr']}"
+
+
+class ServiceCatalog:
+    """Immutable catalogue snapshot with precomputed lookups and messages"""
+
+    def __init__(self, data: Dict):
+        self.version = str(data.get("version", ""))
+        services = []
+        for entry in data["services"]:
+            listed = entry.get("listed", True)
+            services.append(Service(
+                id=entry["id"],
+                emoji=entry.get("emoji", "🔧"),
+                labels=dict(entry["labels"]),
+                key=str(sum(1 for s in services if s.key) + 1) if listed else None,
+                aliases=tuple(entry.get("aliases", ())),
+                synonyms=tuple(entry.get("synonyms", ())),
+            ))
+        self.services: Tuple[Service, ...] = tuple(services)
+        self.by_key: Dict[str, Service] = {s.key: s for s in services if s.key}
+        self._by_name: Dict[str, Service] = {}
+        for service in services:
+            for name in (service.id, *service.aliases, *service.labels.values()):
+                self._by_name.setdefault(name_key(name), service)
+
+        menu = {loc: "\n".join(f"{s.key}. {s.label(loc)}" for s in self.by_key.values())
+                for loc in LOCALES}
+        self.welcome = {loc: WELCOME_TEMPLATES[loc].format(services=menu[loc]) for loc in LOCALES}
+        self.help = dict(HELP_MESSAGES)
+        self.choose_service = {loc: CHOOSE_SERVICE_TEMPLATES[loc].format(count=len(self.by_key))
+                               for loc in LOCALES}
+
+    @classmethod
+    def from_file(cls, path: str) -> "ServiceCatalog":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def get(self, name: str) -> Optional[Service]:
+        """Service by id, alias or label in any locale"""
+        return self._by_name.get(name_key(name))
+
+    def emoji(self, name: str, default: str = "🔧") -> str:
+        service = self.get(name)
+        return service.emoji if service else default
+
+    def intent_phrases(self) -> Dict[str, List[str]]:
+        """Matcher phrases for every menu service, keyed "service:<menu number>" """
+        return {
+            f"service:{s.key}": [s.id, *s.aliases, *s.labels.values(), *s.synonyms]
+            for s in self.by_key.values()
+        }
+
+
+class CatalogStore:
+    """Current catalogue, hot-reloaded from a file (mtime) or the API (ETag)"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        url: Optional[str] = None,
+        http: Optional[HttpClient] = None,
+        refresh_interval: float = 60,
+    ):
+        self.path = path or DEFAULT_CATALOG_PATH
+        self.url = url
+        self.http = http
+        self.refresh_interval = refresh_interval
+        self._mtime = os.stat(self.path).st_mtime
+        self._catalog = ServiceCatalog.from_file(self.path)
+        self._etag: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "CatalogStore":
+        return cls(
+            path=os.environ.get("QEMPLOIS_CATALOG") or None,
+            url=os.environ.get("QEMPLOIS_CATALOG_URL") or None,
+            refresh_interval=float(os.environ.get("QEMPLOIS_CATALOG_REFRESH", 60)),
+        )
+
+    def current(self) -> ServiceCatalog:
+        return self._catalog
+
+    # ── Reload ────────────────────────────────────────────────────────────────
+
+    def refresh(self) -> bool:
+        """Swap in a new snapshot if the source changed; True when swapped"""
+        with self._lock:
+            try:
+                data = self._fetch() if self.url else self._read_if_changed()
+                if data is None:
+                    return False
+                # Build the whole snapshot before publishing it
+                catalog = ServiceCatalog(data)
+            except Exception as e:
+                logger.error(f"Service catalogue reload failed, keeping {self._catalog.version}: {e}")
+                return False
+            if self.url and catalog.version == self._catalog.version:
+                return False
+            self._catalog = catalog
+        logger.info(f"Service catalogue {catalog.version} loaded ({len(catalog.services)} services)")
+        return True
+
+    def _read_if_changed(self) -> Optional[Dict]:
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self._mtime:
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self._mtime = mtime
+        return data
+
+    def _fetch(self) -> Optional[Dict]:
+        http = self.http or get_http_client()
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        resp = http.get("catalog", self.url, headers=headers)
+        if resp.status_code == 304:
+            return None
+        resp.raise_for_status()
+        self._etag = resp.headers.get("ETag")
+        return resp.json()
+
+    def start(self):
+        """Poll the source in a daemon thread"""
+        if self._thread is None and self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._watch, name="qemplois-catalog", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh()
+
+
+# Singleton instance for import
+_store: Optional[CatalogStore] = None
+
+
+def get_catalog_store() -> CatalogStore:
+    """Get or create the process-wide catalogue (watched in the background)"""
+    global _store
+    if _store is None:
+        _store = CatalogStore.from_env()
+        _store.start()
+    return _store
@@ -0,0 +1,310 @@
+"""French (Quebec) date and time parsing engine
+
+Every ASK_DATE / ASK_TIME message goes through here, so the work is done
+once at import time: accent folding is a ``str.translate`` table, each
+parser is a single precompiled pattern scanned once per input, and relative
+words come from lookup tables. Parsing produces a reference-independent
+*plan* (e.g. "weekday 0, strictly after today") that is memoized per input
+string, and resolving a plan is memoized per calendar day, so the common
+replies ("demain", "14h") cost two dict hits.
+
+``parse_dates`` / ``parse_times`` are the offline counterparts for message
+logs: input is streamed and deduplicated, each distinct string is parsed
+once, and results are scattered back into NumPy arrays.
+"""
+import re
+from array import array
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised on installs without numpy
+    np = None
+
+# ── Tables ────────────────────────────────────────────────────────────────────
+
+ACCENT_FOLD = {
+    "à": "a", "â": "a", "ä": "a", "ç": "c", "é": "e", "è": "e", "ê": "e", "ë": "e",
+    "î": "i", "ï": "i", "ô": "o", "ö": "o", "ù": "u", "û": "u", "ü": "u",
+    "œ": "oe", "æ": "ae",
+}
+
+_FOLD = str.maketrans({**ACCENT_FOLD, "'": " ", "’": " ", "`": " "})
+
+MONTHS = {
+    "janvier": 1, "janv": 1, "jan": 1,
+    "fevrier": 2, "fevr": 2, "fev": 2,
+    "mars": 3,
+    "avril": 4, "avr": 4,
+    "mai": 5,
+    "juin": 6,
+    "juillet": 7, "juil": 7,
+    "aout": 8,
+    "septembre": 9, "sept": 9, "sep": 9,
+    "octobre": 10, "oct": 10,
+    "novembre": 11, "nov": 11,
+    "decembre": 12, "dec": 12,
+}
+
+# Phrase -> days from today
+RELATIVE_DAYS = {
+    "aujourd hui": 0, "aujourdhui": 0, "today": 0,
+    "ce matin": 0, "cet apres midi": 0, "ce soir": 0, "a soir": 0, "tantot": 0,
+    "demain": 1, "tomorrow": 1,
+    "apres demain": 2, "apres-demain": 2, "apresdemain": 2,
+    "la semaine prochaine": 7, "semaine prochaine": 7,
+}
+
+# Phrase -> weekday (Monday = 0); "fin de semaine" is the Quebec weekend
+WEEKDAYS = {
+    "lundi": 0, "mardi": 1, "mercredi": 2, "jeudi": 3, "vendredi": 4,
+    "samedi": 5, "dimanche": 6,
+    "fin de semaine": 5, "weekend": 5, "week-end": 5, "week end": 5,
+}
+
+NUMBER_WORDS = {
+    "un": 1, "une": 1, "deux": 2, "trois": 3, "quatre": 4, "cinq": 5,
+    "six": 6, "sept": 7, "huit": 8, "neuf": 9, "dix": 10, "quinze": 15,
+}
+
+TIME_WORDS = {"midi": (12, 0), "minuit": (0, 0)}
+
+# "pas demain", "non, pas lundi": a refusal, not a date
+NEGATIONS = {"pas", "non", "ne", "n", "jamais"}
+
+
+def _squash(phrase: str) -> str:
+    return phrase.replace(" ", "").replace("-", "")
+
+
+def _alternation(words) -> str:
+    """Longest first, so "apres demain" wins over "demain"; spaces/hyphens optional"""
+    parts = sorted(words, key=len, reverse=True)
+    return "|".join(r"[\s-]*".join(map(re.escape, re.split(r"[\s-]+", w))) for w in parts)
+
+
+# Matched spellings are looked up with spaces and hyphens removed
+_RELATIVE_SQUASHED = {_squash(k): v for k, v in RELATIVE_DAYS.items()}
+_WEEKDAYS_SQUASHED = {_squash(k): v for k, v in WEEKDAYS.items()}
+
+
+# ── Patterns ──────────────────────────────────────────────────────────────────
+
+_DATE_RE = re.compile(
+    r"(?P<iso>\b(?P<iy>\d{4})-(?P<im>\d{1,2})-(?P<id>\d{1,2})\b)"
+    r"|(?P<dm>\b(?P<dd>\d{1,2})(?:er)?\s+(?:de\s+)?(?P<dmon>" + _alternation(MONTHS) + r")\b\.?"
+    r"(?:\s+(?P<dy>\d{4})\b)?)"
+    r"|(?P<num>\b(?P<nd>\d{1,2})[/-](?P<nm>\d{1,2})(?:[/-](?P<ny>\d{4}|\d{2}))?\b)"
+    r"|(?P<in>\bdans\s+(?P<n>\d{1,3}|" + _alternation(NUMBER_WORDS) + r")\s+"
+    r"(?P<unit>jours?|semaines?)\b)"
+    r"|(?P<rel>\b(?:" + _alternation(RELATIVE_DAYS) + r")\b)"
+    r"|(?P<wd>\b(?P<wdname>" + _alternation(WEEKDAYS) + r")\b(?P<next>\s+prochaine?)?)"
+)
+
+# When a phrase has several: "mardi 3 mars" is March 3rd, whatever day that is
+_DATE_PRIORITY = {"iso": 0, "dm": 0, "num": 0, "in": 1, "rel": 2, "wd": 3}
+
+# Applied after spaces are removed: "14 h 30" -> "14h30", "2 pm" -> "2pm"
+_TIME_RE = re.compile(
+    r"^(?:a|vers)?"
+    r"(?:(?P<word>midi|minuit)(?:et(?P<wdemi>demie?))?"
+    r"|(?P<h>\d{1,2})"
+    r"(?:(?P<sep>h|heures?|:)?(?P<m>\d{2})?(?:min)?(?:et(?P<demi>demie?|quart))?)?"
+    r"(?P<period>am|pm|dumatin|dusoir|delapresmidi|delapres-midi|lematin|lesoir)?)$"
+)
+
+_PM_PERIODS = {"pm", "dusoir", "delapresmidi", "delapres-midi", "lesoir"}
+_AM_PERIODS = {"am", "dumatin", "lematin"}
+
+
+def fold(text: str) -> str:
+    """Lowercase, strip accents and apostrophes, collapse whitespace"""
+    return " ".join(text.lower().translate(_FOLD).split())
+
+
+# ── Dates ─────────────────────────────────────────────────────────────────────
+
+# Plans: ("offset", days) | ("weekday", wd, strictly_future)
+#        | ("date", day, month, year or None, roll_on_day)
+DatePlan = Tuple
+
+
+@lru_cache(maxsize=4096)
+def date_plan(text: str) -> Optional[DatePlan]:
+    """Reference-independent meaning of a date phrase (memoized)"""
+    folded = fold(text)
+    if NEGATIONS.intersection(folded.split()):
+        return None
+    offset = _RELATIVE_SQUASHED.get(_squash(folded))
+    if offset is not None:
+        return ("offset", offset)
+
+    match = min(_DATE_RE.finditer(folded), key=lambda m: _DATE_PRIORITY[m.lastgroup], default=None)
+    if match is None:
+        return None
+    kind = match.lastgroup
+    if kind == "iso":
+        return ("date", int(match["id"]), int(match["im"]), int(match["iy"]), False)
+    if kind == "dm":
+        year = int(match["dy"]) if match["dy"] else None
+        return ("date", int(match["dd"]), MONTHS[match["dmon"]], year, False)
+    if kind == "num":
+        year = match["ny"]
+        if year:
+            year = int(year) if len(year) == 4 else 2000 + int(year)
+        return ("date", int(match["nd"]), int(match["nm"]), year or None, True)
+    if kind == "in":
+        n = match["n"]
+        n = int(n) if n.isdigit() else NUMBER_WORDS[n]
+        return ("offset", n * 7 if match["unit"].startswith("semaine") else n)
+    if kind == "rel":
+        return ("offset", _RELATIVE_SQUASHED[_squash(match["rel"])])
+    if kind == "wd":
+        return ("weekday", _WEEKDAYS_SQUASHED[_squash(match["wdname"])], bool(match["next"]))
+    return None
+
+
+def resolve_date(plan: DatePlan, reference_date: datetime) -> Optional[datetime]:
+    return _resolve(plan, reference_date.toordinal())
+
+
+@lru_cache(maxsize=4096)
+def _resolve(plan: DatePlan, today_ordinal: int) -> Optional[datetime]:
+    """Memoized per calendar day: live traffic shares one reference date"""
+    today = datetime.fromordinal(today_ordinal)
+    kind = plan[0]
+    if kind == "offset":
+        return today + timedelta(days=plan[1])
+    if kind == "weekday":
+        ahead = (plan[1] - today.weekday()) % 7
+        if ahead == 0 and plan[2]:
+            ahead = 7
+        return today + timedelta(days=ahead)
+
+    _, day, month, year, roll_on_day = plan
+    if year is None:
+        # A date already behind us means next year's
+        year = today.year
+        if month < today.month or (roll_on_day and month == today.month and day < today.day):
+            year += 1
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
+
+
+def parse_date(text: str, reference_date: datetime = None) -> Optional[datetime]:
+    """
+    Parse French date expressions into datetime objects.
+    Handles: aujourd'hui, demain, après-demain, weekdays ("lundi prochain"),
+    "dans 3 jours", "20 février", "1er mars 2027", 20/02, 2026-02-20
+    """
+    plan = date_plan(text)
+    if plan is None:
+        return None
+    return _resolve(plan, (reference_date or datetime.now()).toordinal())
+
+
+# ── Times ─────────────────────────────────────────────────────────────────────
+
+@lru_cache(maxsize=4096)
+def parse_time(text: str) -> Optional[Tuple[int, int]]:
+    """
+    Parse French time expressions into (hour, minute) tuple.
+    Handles: 14h, 14h30, 14:30, 2h30 PM, 9h du matin, 2h de l'après-midi, midi
+    """
+    match = _TIME_RE.match(fold(text).replace(" ", ""))
+    if match is None:
+        return None
+
+    if match["word"]:
+        hour, minute = TIME_WORDS[match["word"]]
+        return (hour, 30 if match["wdemi"] else minute)
+
+    # A bare number is not a time ("3" may be a menu choice); "230pm" is
+    if not match["sep"] and not match["period"]:
+        return None
+    if match["sep"] == ":" and not match["m"]:
+        return None
+
+    hour = int(match["h"])
+    minute = int(match["m"]) if match["m"] else 0
+    if match["demi"]:
+        if match["m"]:
+            return None
+        minute = 15 if match["demi"] == "quart" else 30
+
+    period = match["period"]
+    if period in _PM_PERIODS and hour < 12:
+        hour += 12
+    elif period in _AM_PERIODS and hour == 12:
+        hour = 0
+
+    if 0 <= hour <= 23 and 0 <= minute <= 59:
+        return (hour, minute)
+    return None
+
+
+# ── Batch ─────────────────────────────────────────────────────────────────────
+
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+_NAT = -(2 ** 63)  # datetime64 NaT as int64
+
+
+class DateBatch(NamedTuple):
+    dates: Any  # np.ndarray[datetime64[D]], NaT where unparsed
+    valid: Any  # np.ndarray[bool]
+
+
+class TimeBatch(NamedTuple):
+    times: Any  # np.ndarray[int16] of shape (n, 2): hour, minute; -1 where unparsed
+    valid: Any  # np.ndarray[bool]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("parse_dates/parse_times need numpy (pip install numpy)")
+
+
+def _dedupe(texts: Iterable[str]) -> Tuple[List[str], Any]:
+    """Distinct inputs in first-seen order, and each input's index into them"""
+    index: Dict[str, int] = {}
+    codes = array("q")
+    add, code_of = codes.append, index.setdefault
+    for text in texts:
+        add(code_of(text, len(index)))
+    return list(index), np.frombuffer(codes, dtype=np.int64)
+
+
+def parse_dates(texts: Iterable[str], reference_date: datetime = None) -> DateBatch:
+    """Vectorized ``parse_date`` over many messages sharing one reference date"""
+    _require_numpy()
+    uniques, codes = _dedupe(texts)
+    today = (reference_date or datetime.now()).toordinal()
+    plan_of, resolve = date_plan.__wrapped__, _resolve.__wrapped__
+    resolved: Dict[DatePlan, int] = {}
+    days = []
+    for text in uniques:
+        plan = plan_of(text) if isinstance(text, str) else None
+        if plan is None:
+            days.append(_NAT)
+            continue
+        day = resolved.get(plan)
+        if day is None:
+            result = resolve(plan, today)
+            day = resolved[plan] = result.toordinal() - _EPOCH_ORDINAL if result else _NAT
+        days.append(day)
+    dates = np.array(days, dtype=np.int64).view("datetime64[D]")[codes]
+    return DateBatch(dates, ~np.isnat(dates))
+
+
+def parse_times(texts: Iterable[str]) -> TimeBatch:
+    """Vectorized ``parse_time`` over many messages"""
+    _require_numpy()
+    uniques, codes = _dedupe(texts)
+    parse = parse_time.__wrapped__
+    rows = [(parse(text) if isinstance(text, str) else None) or (-1, -1) for text in uniques]
+    times = np.array(rows, dtype=np.int16).reshape(-1, 2)[codes]
+    return TimeBatch(times, times[:, 0] >= 0)
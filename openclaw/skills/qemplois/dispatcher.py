@@ -0,0 +1,73 @@
+"""Per-conversation ordering for concurrent message handling
+
+Messages from different users are handled in parallel, up to ``workers``
+at a time. Messages from the same conversation (``platform:user_id``) are
+handled one after the other, in arrival order: each waits for the previous
+one to finish before taking a worker, so two quick messages never load
+and save the same ``BookingData`` concurrently. A message's place is taken
+when ``submit`` is called, before its first await, so callers should submit
+on arrival and do their own awaits (dedup, rate limits) inside the handler.
+
+Ordering is per process: with several bot processes, route a
+conversation's updates to the same one.
+"""
+import asyncio
+import os
+from collections import Counter
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from .aio import LoopLocal
+
+T = TypeVar("T")
+
+DEFAULT_WORKERS = 16
+
+
+class _Lanes:
+    """Dispatcher state bound to one event loop"""
+
+    def __init__(self, workers: int):
+        self.semaphore = asyncio.Semaphore(workers)
+        self.tails: Dict[str, asyncio.Future] = {}  # key -> done signal of its last message
+
+
+class ConversationDispatcher:
+    """Ordered, non-overlapping handling per key; parallel across keys"""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        self.workers = workers
+        self._lanes = LoopLocal(lambda: _Lanes(workers))
+        self.counters: Counter = Counter()
+
+    @classmethod
+    def from_env(cls) -> "ConversationDispatcher":
+        return cls(workers=int(os.environ.get("QEMPLOIS_WORKERS", DEFAULT_WORKERS)))
+
+    async def submit(self, key: str, handler: Callable[[], Awaitable[T]]) -> T:
+        """Run ``handler()`` once every earlier message for ``key`` has finished"""
+        lanes = self._lanes.get()
+        previous = lanes.tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        lanes.tails[key] = done
+        try:
+            if previous is not None:
+                self.counters["queued"] += 1
+                await asyncio.shield(previous)
+            async with lanes.semaphore:
+                self.counters["handled"] += 1
+                return await handler()
+        finally:
+            def release(_=None):
+                done.set_result(None)
+                if lanes.tails.get(key) is done:
+                    del lanes.tails[key]
+
+            if previous is not None and not previous.done():
+                # Cancelled while waiting: the next message still waits for ours
+                previous.add_done_callback(release)
+            else:
+                release()
+
+    def pending(self) -> int:
+        """Conversations with a message queued or in progress on the current loop"""
+        return len(self._lanes.get().tails)
@@ -0,0 +1,190 @@
+"""Fan-out of job alerts to many providers
+
+A new booking is offered to the N nearest providers at once. The alert is
+rendered once per platform (see ``JobNotifier.prepare_new_job_alert``), then
+sent by a bounded pool of asyncio workers. Each platform has its own token
+bucket because Telegram and WhatsApp (Twilio) throttle messages per second
+independently; a recipient over the limit waits for its turn, it is not
+dropped.
+
+Senders are pluggable: ``HttpSender`` talks to the Telegram Bot API and
+Twilio, ``StubSender`` records messages in memory (dev and tests).
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .aio import run_sync
+from .http_client import HttpClient, get_http_client
+from .job_notifications import JobNotifier, JobRequest
+from .ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Messages per second; Telegram allows ~30/s per bot, Twilio's WhatsApp
+# senders start lower
+DEFAULT_RATES = {"telegram": 30.0, "whatsapp": 20.0}
+DEFAULT_CONCURRENCY = 16
+
+TELEGRAM_API = "https://api.telegram.org"
+TWILIO_API = "https://api.twilio.com/2010-04-01"
+
+
+@dataclass(slots=True)
+class SendResult:
+    provider_id: Optional[str]
+    platform: Optional[str]
+    status: str  # "sent", "failed" or "skipped"
+    error: Optional[str] = None
+    latency_ms: float = 0.0
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def recipient_address(provider: Dict) -> Tuple[Optional[str], Optional[str]]:
+    """(platform, chat id) a provider wants job alerts on"""
+    platform = provider.get("platform")
+    chat_id = provider.get("chat_id") or provider.get("platform_user_id")
+    if platform is None:
+        if provider.get("telegram_id"):
+            platform, chat_id = "telegram", provider["telegram_id"]
+        elif provider.get("whatsapp") or provider.get("phone"):
+            platform, chat_id = "whatsapp", provider.get("whatsapp") or provider["phone"]
+    return platform, (str(chat_id) if chat_id is not None else None)
+
+
+# ── Senders ──────────────────────────────────────────────────────────────────
+
+class Sender:
+    """Delivers one message; raises on failure"""
+
+    async def send(self, platform: str, chat_id: str, text: str):
+        raise NotImplementedError
+
+
+class StubSender(Sender):
+    """Keeps messages in memory instead of sending them"""
+
+    def __init__(self, latency: float = 0.0, fail_for: Iterable[str] = ()):
+        self.latency = latency
+        self.fail_for = set(fail_for)
+        self.sent: List[Tuple[str, str, str]] = []
+
+    async def send(self, platform: str, chat_id: str, text: str):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if chat_id in self.fail_for:
+            raise RuntimeError(f"stub failure for {chat_id}")
+        self.sent.append((platform, chat_id, text))
+
+
+class HttpSender(Sender):
+    """Telegram Bot API (HTML) and Twilio WhatsApp through the pooled client"""
+
+    def __init__(
+        self,
+        http: Optional[HttpClient] = None,
+        telegram_token: Optional[str] = None,
+        twilio_sid: Optional[str] = None,
+        twilio_token: Optional[str] = None,
+        whatsapp_from: Optional[str] = None,
+    ):
+        self.http = http or get_http_client()
+        self.telegram_token = telegram_token or os.environ.get("TELEGRAM_BOT_TOKEN", "")
+        self.twilio_sid = twilio_sid or os.environ.get("TWILIO_ACCOUNT_SID", "")
+        self.twilio_token = twilio_token or os.environ.get("TWILIO_AUTH_TOKEN", "")
+        self.whatsapp_from = whatsapp_from or os.environ.get("TWILIO_WHATSAPP_NUMBER", "")
+
+    async def send(self, platform: str, chat_id: str, text: str):
+        if platform == "telegram":
+            resp = await self.http.apost(
+                "messages",
+                f"{TELEGRAM_API}/bot{self.telegram_token}/sendMessage",
+                json={"chat_id": chat_id, "text": text, "parse_mode": "HTML"},
+            )
+        elif platform == "whatsapp":
+            to = chat_id if chat_id.startswith("whatsapp:") else f"whatsapp:{chat_id}"
+            resp = await self.http.apost(
+                "messages",
+                f"{TWILIO_API}/Accounts/{self.twilio_sid}/Messages.json",
+                data={"From": self.whatsapp_from, "To": to, "Body": text},
+                auth=(self.twilio_sid, self.twilio_token),
+            )
+        else:
+            raise ValueError(f"Unsupported platform: {platform}")
+        resp.raise_for_status()
+
+
+# ── Dispatcher ───────────────────────────────────────────────────────────────
+
+class FanOutDispatcher:
+    """Renders a job alert once per platform and sends it to every provider"""
+
+    def __init__(
+        self,
+        sender: Sender,
+        notifier: Optional[JobNotifier] = None,
+        rates: Optional[Dict[str, float]] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+    ):
+        self.sender = sender
+        self.notifier = notifier or JobNotifier()
+        self.concurrency = concurrency
+        rates = {**DEFAULT_RATES, **(rates or {})}
+        # Burst of one second's worth, then the steady per-platform rate
+        self.buckets = {platform: TokenBucket(rate=rate, capacity=max(rate, 1))
+                        for platform, rate in rates.items()}
+
+    @classmethod
+    def from_env(cls, sender: Sender, notifier: Optional[JobNotifier] = None) -> "FanOutDispatcher":
+        rates = {
+            platform: float(os.environ[f"QEMPLOIS_FANOUT_RATE_{platform.upper()}"])
+            for platform in DEFAULT_RATES
+            if os.environ.get(f"QEMPLOIS_FANOUT_RATE_{platform.upper()}")
+        }
+        return cls(
+            sender,
+            notifier,
+            rates=rates,
+            concurrency=int(os.environ.get("QEMPLOIS_FANOUT_CONCURRENCY", DEFAULT_CONCURRENCY)),
+        )
+
+    async def notify_new_job_async(self, job: JobRequest, providers: Iterable[Dict]) -> List[SendResult]:
+        """Alert every provider; results are in the same order as ``providers``"""
+        providers = list(providers)
+        alerts = {}  # platform -> bound template
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(provider: Dict) -> SendResult:
+            provider_id = provider.get("id")
+            platform, chat_id = recipient_address(provider)
+            bucket = self.buckets.get(platform)
+            if bucket is None or not chat_id:
+                return SendResult(provider_id, platform, "skipped", "no reachable address")
+            alert = alerts.get(platform)
+            if alert is None:
+                alert = alerts[platform] = self.notifier.prepare_new_job_alert(job, platform)
+            text = alert.render(distance_km=provider.get("distance_km", job.distance_km))
+
+            async with semaphore:
+                wait = bucket.reserve()
+                if wait:
+                    await asyncio.sleep(wait)
+                start = time.perf_counter()
+                try:
+                    await self.sender.send(platform, chat_id, text)
+                except Exception as e:
+                    logger.warning(f"Job alert to {platform}:{chat_id} failed: {e}")
+                    return SendResult(provider_id, platform, "failed", str(e),
+                                      (time.perf_counter() - start) * 1000)
+                return SendResult(provider_id, platform, "sent",
+                                  latency_ms=(time.perf_counter() - start) * 1000)
+
+        return list(await asyncio.gather(*(deliver(p) for p in providers)))
+
+    def notify_new_job(self, job: JobRequest, providers: Iterable[Dict]) -> List[SendResult]:
+        return run_sync(self.notify_new_job_async(job, providers))
@@ -0,0 +1,156 @@
+"""Two-tier geocode cache for Q-Emplois bot
+
+Nominatim allows one request per second, so repeated addresses must never
+reach it twice. Lookups go to an in-process LRU first, then to a Redis tier
+shared by every worker (and surviving restarts). Addresses Nominatim could
+not resolve are cached too, with a shorter TTL.
+"""
+import json
+import logging
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Optional
+
+from .cache import TTLCache
+from .utils import normalize_address
+
+logger = logging.getLogger(__name__)
+
+
+class GeocodeCache:
+    """Normalized-address geocode cache: in-process LRU in front of Redis"""
+
+    def __init__(
+        self,
+        maxsize: int = 10_000,
+        ttl: int = 30 * 86400,  # addresses rarely move
+        negative_ttl: int = 3600,
+        redis_client=None,
+        async_redis: Optional[Callable[[], Any]] = None,
+        prefix: str = "geo:",
+    ):
+        self.local: TTLCache[Dict] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.redis = redis_client
+        self.async_redis = async_redis  # zero-arg callable returning a loop-bound client
+        self.prefix = prefix
+        self.counters: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(address: str) -> str:
+        return normalize_address(address)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _ttl_for(self, result: Dict) -> int:
+        return self.ttl if result.get("found") else self.negative_ttl
+
+    def _from_entry(self, address: str, entry: Dict) -> Dict:
+        if entry.get("found"):
+            return dict(entry)
+        # Misses keep the caller's wording in the fallback
+        self._count("negative_hits")
+        return {**entry, "display": address}
+
+    # ── Sync ──────────────────────────────────────────────────────────────────
+
+    def get(self, address: str) -> Optional[Dict]:
+        key = self.key(address)
+        entry = self.local.get(key)
+        if entry is not None:
+            self._count("local_hits")
+            return self._from_entry(address, entry)
+
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(self.prefix + key)
+            except Exception as e:
+                logger.warning(f"Geocode cache Redis read failed: {e}")
+                raw = None
+            if raw:
+                entry = json.loads(raw)
+                self.local.set(key, entry, ttl=self._ttl_for(entry))
+                self._count("redis_hits")
+                return self._from_entry(address, entry)
+
+        self._count("misses")
+        return None
+
+    def put(self, address: str, result: Dict):
+        key = self.key(address)
+        entry = self._entry(result)
+        ttl = self._ttl_for(entry)
+        self.local.set(key, entry, ttl=ttl)
+        if self.redis is not None:
+            try:
+                self.redis.setex(self.prefix + key, ttl, json.dumps(entry))
+            except Exception as e:
+                logger.warning(f"Geocode cache Redis write failed: {e}")
+
+    # ── Async ─────────────────────────────────────────────────────────────────
+
+    async def get_async(self, address: str) -> Optional[Dict]:
+        if self.async_redis is None:
+            return self.get(address)
+
+        key = self.key(address)
+        entry = self.local.get(key)
+        if entry is not None:
+            self._count("local_hits")
+            return self._from_entry(address, entry)
+
+        try:
+            raw = await self.async_redis().get(self.prefix + key)
+        except Exception as e:
+            logger.warning(f"Geocode cache Redis read failed: {e}")
+            raw = None
+        if raw:
+            entry = json.loads(raw)
+            self.local.set(key, entry, ttl=self._ttl_for(entry))
+            self._count("redis_hits")
+            return self._from_entry(address, entry)
+
+        self._count("misses")
+        return None
+
+    async def put_async(self, address: str, result: Dict):
+        if self.async_redis is None:
+            return self.put(address, result)
+
+        key = self.key(address)
+        entry = self._entry(result)
+        ttl = self._ttl_for(entry)
+        self.local.set(key, entry, ttl=ttl)
+        try:
+            await self.async_redis().setex(self.prefix + key, ttl, json.dumps(entry))
+        except Exception as e:
+            logger.warning(f"Geocode cache Redis write failed: {e}")
+
+    # ── Helpers ───────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _entry(result: Dict) -> Dict:
+        return {
+            "lat": result["lat"],
+            "lng": result["lng"],
+            "display": result.get("display"),
+            "found": bool(result.get("found")),
+        }
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counters = dict(self.counters)
+        hits = counters.get("local_hits", 0) + counters.get("redis_hits", 0)
+        return {
+            "hits": hits,
+            "local_hits": counters.get("local_hits", 0),
+            "redis_hits": counters.get("redis_hits", 0),
+            "negative_hits": counters.get("negative_hits", 0),
+            "misses": counters.get("misses", 0),
+            "size": len(self.local),
+            "evictions": self.local.evictions,
+        }
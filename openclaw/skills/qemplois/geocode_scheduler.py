@@ -0,0 +1,175 @@
+"""Rate-limited, coalescing scheduler for Nominatim requests
+
+Nominatim's usage policy is one request per second per application; going
+over gets us throttled or banned. Every remote geocode goes through here:
+
+- a token bucket shared by all threads and tasks enforces the rate,
+- identical in-flight queries are coalesced (single flight),
+- the wait queue is bounded and deadline-aware: when a request would wait
+  longer than the message SLA it is shed and the caller falls back to its
+  cached/default answer instead.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from .ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class GeocodeScheduler:
+    """Shared gate in front of the remote geocoder; ``None`` means shed"""
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: float = 1,
+        max_queue: int = 32,
+        max_wait: float = 2.0,
+    ):
+        self.bucket = TokenBucket(rate=rate, capacity=burst)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.counters: Counter = Counter()
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_async: Dict[Tuple[int, str], asyncio.Future] = {}
+
+    @classmethod
+    def from_env(cls) -> "GeocodeScheduler":
+        return cls(
+            rate=float(os.environ.get("QEMPLOIS_GEOCODE_RATE", 1.0)),
+            max_wait=float(os.environ.get("QEMPLOIS_GEOCODE_MAX_WAIT", 2.0)),
+        )
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _admit(self, max_wait: float) -> Optional[float]:
+        """Reserve a rate-limit slot, or None if the queue is full or too slow"""
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self.counters["shed"] += 1
+                return None
+            wait = self.bucket.reserve(max_wait=max_wait)
+            if wait is None:
+                self.counters["shed"] += 1
+                return None
+            self._waiting += 1
+            return wait
+
+    def _leave(self):
+        with self._lock:
+            self._waiting -= 1
+
+    # ── Sync ──────────────────────────────────────────────────────────────────
+
+    def run(self, key: str, fetch: Callable[[], T], max_wait: Optional[float] = None) -> Optional[T]:
+        max_wait = self.max_wait if max_wait is None else max_wait
+        self._count("requests")
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            self._count("coalesced")
+            try:
+                return future.result(timeout=max_wait)
+            except FutureTimeout:
+                self._count("shed")
+                return None
+
+        try:
+            wait = self._admit(max_wait)
+            if wait is None:
+                future.set_result(None)
+                return None
+            try:
+                time.sleep(wait)
+                self._count("executed")
+                result = fetch()
+            finally:
+                self._leave()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    # ── Async ─────────────────────────────────────────────────────────────────
+
+    async def run_async(
+        self, key: str, fetch: Callable[[], Awaitable[T]], max_wait: Optional[float] = None,
+    ) -> Optional[T]:
+        max_wait = self.max_wait if max_wait is None else max_wait
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        self._count("requests")
+
+        future = self._inflight_async.get(slot)
+        if future is not None:
+            self._count("coalesced")
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), max_wait)
+            except asyncio.TimeoutError:
+                self._count("shed")
+                return None
+
+        future = self._inflight_async[slot] = loop.create_future()
+        try:
+            wait = self._admit(max_wait)
+            if wait is None:
+                future.set_result(None)
+                return None
+            try:
+                await asyncio.sleep(wait)
+                self._count("executed")
+                result = await fetch()
+            finally:
+                self._leave()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Followers re-raise it; don't warn about a never-retrieved exception
+                future.exception()
+            raise
+        finally:
+            self._inflight_async.pop(slot, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {name: self.counters.get(name, 0)
+                     for name in ("requests", "executed", "coalesced", "shed")}
+            stats["waiting"] = self._waiting
+        return stats
+
+
+# Singleton instance for import: the rate limit is per process, not per flow
+_scheduler: Optional[GeocodeScheduler] = None
+
+
+def get_geocode_scheduler() -> GeocodeScheduler:
+    """Get or create the process-wide Nominatim scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = GeocodeScheduler.from_env()
+    return _scheduler
@@ -0,0 +1,194 @@
+"""Shared HTTP client layer for Q-Emplois bot
+
+Every outbound call (Q-Emplois API, Nominatim, auth webhooks) goes through a
+single keep-alive session so TCP+TLS handshakes are paid once per pooled
+connection instead of once per request.
+"""
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .aio import LoopLocal
+
+logger = logging.getLogger(__name__)
+
+
+def _default_host_pool_sizes() -> Dict[str, int]:
+    # Nominatim allows 1 req/s, extra sockets would only sit idle
+    return {"nominatim.openstreetmap.org": 2}
+
+
+def _default_timeouts() -> Dict[str, float]:
+    return {
+        "providers": 8,
+        "bookings": 10,
+        "geocode": 6,
+        "webhook": 10,
+        "messages": 5,
+    }
+
+
+@dataclass
+class HttpClientConfig:
+    """Connection pool, retry and timeout settings"""
+    pool_connections: int = 10  # distinct hosts kept in the pool manager
+    pool_maxsize: int = 20  # keep-alive connections per host
+    host_pool_sizes: Dict[str, int] = field(default_factory=_default_host_pool_sizes)
+    retries: int = 3
+    backoff_factor: float = 0.3
+    retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)
+    timeouts: Dict[str, float] = field(default_factory=_default_timeouts)
+    default_timeout: float = 10
+
+    @classmethod
+    def from_env(cls) -> "HttpClientConfig":
+        config = cls()
+        config.pool_maxsize = int(os.environ.get("QEMPLOIS_HTTP_POOL_MAXSIZE", config.pool_maxsize))
+        config.retries = int(os.environ.get("QEMPLOIS_HTTP_RETRIES", config.retries))
+        config.backoff_factor = float(os.environ.get("QEMPLOIS_HTTP_BACKOFF", config.backoff_factor))
+        return config
+
+    def timeout_for(self, endpoint: str) -> float:
+        return self.timeouts.get(endpoint, self.default_timeout)
+
+
+class HttpClient:
+    """
+    Pooled HTTP client shared by BookingFlow and AuthHandler.
+
+    Sync calls use a requests.Session with per-host HTTPAdapters; async calls
+    use one httpx.AsyncClient per event loop, with a per-host transport for
+    the same ``host_pool_sizes``. Retries only apply to idempotent methods,
+    so a booking POST is never sent twice.
+    """
+
+    def __init__(self, config: Optional[HttpClientConfig] = None):
+        self.config = config or HttpClientConfig.from_env()
+        self.session = requests.Session()
+        self._adapters = []
+
+        default = self._make_adapter(self.config.pool_maxsize)
+        self.session.mount("http://", default)
+        self.session.mount("https://", default)
+        for host, size in self.config.host_pool_sizes.items():
+            self.session.mount(f"https://{host}/", self._make_adapter(size))
+
+        self._async = LoopLocal(self._make_async_client)
+        self._async_requests: Counter = Counter()
+        self._async_connections: Counter = Counter()
+
+    def _retry_policy(self) -> Retry:
+        return Retry(
+            total=self.config.retries,
+            backoff_factor=self.config.backoff_factor,
+            status_forcelist=self.config.retry_statuses,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+        )
+
+    def _make_adapter(self, pool_maxsize: int) -> HTTPAdapter:
+        adapter = HTTPAdapter(
+            pool_connections=self.config.pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=self._retry_policy(),
+        )
+        self._adapters.append(adapter)
+        return adapter
+
+    def _make_async_client(self):
+        import httpx
+
+        def transport(max_connections: int, max_keepalive: int):
+            return httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(max_connections=max_connections,
+                                    max_keepalive_connections=max_keepalive),
+                retries=self.config.retries,
+            )
+
+        async def count_request(request):
+            host = request.url.host
+            self._async_requests[host] += 1
+
+            async def trace(event: str, info: dict):
+                if event == "connection.connect_tcp.complete":
+                    self._async_connections[host] += 1
+
+            request.extensions["trace"] = trace
+
+        return httpx.AsyncClient(
+            transport=transport(self.config.pool_connections * self.config.pool_maxsize,
+                                self.config.pool_maxsize),
+            mounts={f"https://{host}": transport(size, size)
+                    for host, size in self.config.host_pool_sizes.items()},
+            timeout=self.config.default_timeout,
+            event_hooks={"request": [count_request]},
+        )
+
+    # ── Sync ──────────────────────────────────────────────────────────────────
+
+    def get(self, endpoint: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.config.timeout_for(endpoint))
+        return self.session.get(url, **kwargs)
+
+    def post(self, endpoint: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.config.timeout_for(endpoint))
+        return self.session.post(url, **kwargs)
+
+    # ── Async ─────────────────────────────────────────────────────────────────
+
+    async def aget(self, endpoint: str, url: str, **kwargs):
+        kwargs.setdefault("timeout", self.config.timeout_for(endpoint))
+        return await self._async.get().get(url, **kwargs)
+
+    async def apost(self, endpoint: str, url: str, **kwargs):
+        kwargs.setdefault("timeout", self.config.timeout_for(endpoint))
+        return await self._async.get().post(url, **kwargs)
+
+    # ── Metrics ───────────────────────────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-host request and connection counts (sync and async); pool hits are
+        reused connections"""
+        hosts: Dict[str, Dict[str, float]] = {}
+        for adapter in self._adapters:
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                entry = hosts.setdefault(pool.host, {"requests": 0, "connections": 0})
+                entry["requests"] += pool.num_requests
+                entry["connections"] += pool.num_connections
+        for host, count in self._async_requests.items():
+            entry = hosts.setdefault(host, {"requests": 0, "connections": 0})
+            entry["requests"] += count
+            entry["connections"] += self._async_connections[host]
+            entry["async_requests"] = count
+
+        for entry in hosts.values():
+            entry["pool_hits"] = max(entry["requests"] - entry["connections"], 0)
+            entry["hit_ratio"] = (
+                entry["pool_hits"] / entry["requests"] if entry["requests"] else 0.0
+            )
+        return hosts
+
+    def close(self):
+        self.session.close()
+
+
+# Singleton instance for import
+_http_client: Optional[HttpClient] = None
+
+
+def get_http_client() -> HttpClient:
+    """Get or create the process-wide pooled HTTP client"""
+    global _http_client
+    if _http_client is None:
+        _http_client = HttpClient()
+    return _http_client
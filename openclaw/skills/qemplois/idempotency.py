@@ -0,0 +1,102 @@
+"""Deduplication of redelivered webhooks and messages
+
+Telegram and WhatsApp redeliver updates they think timed out, and the
+Q-Emplois backend retries ``booking.*`` events. Each event id is claimed
+once: an in-process set answers repeats seen by this worker, and a Redis
+``SET NX EX`` decides between workers. If processing fails the claim is
+released so the next delivery is handled.
+"""
+import logging
+import threading
+from collections import Counter
+from typing import Any, Callable, Optional
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyCache:
+    """Claims event ids once across workers: in-process set in front of Redis"""
+
+    def __init__(
+        self,
+        maxsize: int = 100_000,
+        ttl: int = 86400,  # longer than any platform's redelivery window
+        redis_client=None,
+        async_redis: Optional[Callable[[], Any]] = None,
+        prefix: str = "idem:",
+    ):
+        self.local: TTLCache[bool] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.redis = redis_client
+        self.async_redis = async_redis  # zero-arg callable returning a loop-bound client
+        self.prefix = prefix
+        self.counters: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _claim_local(self, key: str) -> bool:
+        with self._lock:
+            if key in self.local:
+                self.counters["local_duplicates"] += 1
+                return False
+            self.local.set(key, True)
+            return True
+
+    def _claimed(self, key: str, won: bool) -> bool:
+        if won:
+            self._count("claimed")
+            return True
+        self._count("redis_duplicates")  # another worker has it; stays in the local set
+        return False
+
+    # ── Sync ──────────────────────────────────────────────────────────────────
+
+    def claim(self, key: str) -> bool:
+        """True the first time ``key`` is seen, False for duplicates"""
+        if not self._claim_local(key):
+            return False
+        if self.redis is None:
+            return self._claimed(key, True)
+        try:
+            won = self.redis.set(self.prefix + key, 1, nx=True, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Idempotency Redis claim failed: {e}")
+            won = True  # better a rare duplicate than a dropped event
+        return self._claimed(key, bool(won))
+
+    def release(self, key: str):
+        """Forget a claim whose processing failed"""
+        self.local.pop(key)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self.prefix + key)
+            except Exception as e:
+                logger.warning(f"Idempotency Redis release failed: {e}")
+
+    # ── Async ─────────────────────────────────────────────────────────────────
+
+    async def claim_async(self, key: str) -> bool:
+        if self.async_redis is None:
+            return self.claim(key)
+        if not self._claim_local(key):
+            return False
+        try:
+            won = await self.async_redis().set(self.prefix + key, 1, nx=True, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Idempotency Redis claim failed: {e}")
+            won = True
+        return self._claimed(key, bool(won))
+
+    async def release_async(self, key: str):
+        if self.async_redis is None:
+            return self.release(key)
+        self.local.pop(key)
+        try:
+            await self.async_redis().delete(self.prefix + key)
+        except Exception as e:
+            logger.warning(f"Idempotency Redis release failed: {e}")
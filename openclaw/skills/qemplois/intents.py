@@ -0,0 +1,118 @@
+"""Precomputed intent/entity matcher for conversation messages
+
+Phrases are accent-folded and tokenized once, then indexed by their first
+token, so matching a message costs one hash lookup per token however many
+intents (services, synonyms, yes/no words...) are registered. Misspelled
+tokens are corrected against the vocabulary with a precomputed
+single-deletion index (SymSpell-style): any word within one edit of a known
+word of ``typo_min_len`` letters or more is recognized.
+"""
+import re
+import string
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .dateparse import ACCENT_FOLD
+
+# One translate pass folds accents and blanks ASCII punctuation
+_WORD_FOLD = str.maketrans({**ACCENT_FOLD, "’": " ", **{c: " " for c in string.punctuation}})
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Accent-, case- and punctuation-insensitive tokens"""
+    folded = text.lower().translate(_WORD_FOLD)
+    if not folded.isascii():  # emoji, other symbols
+        folded = _NON_WORD.sub(" ", folded)
+    return folded.split()
+
+
+def _deletes(word: str) -> Set[str]:
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """Optimal string alignment distance <= 1 (insert, delete, substitute, swap)"""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    i = 0
+    while i < min(la, lb) and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        return a[i + 1:] == b[i + 1:] or (
+            a[i + 2:] == b[i + 2:] and a[i:i + 2] == b[i:i + 2][::-1]
+        )
+    return a[i + 1:] == b[i:] if la > lb else a[i:] == b[i + 1:]
+
+
+class IntentMatcher:
+    """Token-hash index from phrases to intent names, with typo tolerance"""
+
+    def __init__(self, intents: Dict[str, Iterable[str]], typo_min_len: int = 5,
+                 cache_size: int = 4096):
+        self.typo_min_len = typo_min_len
+        # first token -> [(phrase tokens, intent)], longest phrase first
+        self._by_first: Dict[str, List[Tuple[Tuple[str, ...], str]]] = defaultdict(list)
+        self.vocabulary: Set[str] = set()
+        for intent, phrases in intents.items():
+            for phrase in phrases:
+                tokens = tuple(tokenize(phrase))
+                if tokens:
+                    self._by_first[tokens[0]].append((tokens, intent))
+                    self.vocabulary.update(tokens)
+        for entries in self._by_first.values():
+            entries.sort(key=lambda entry: -len(entry[0]))
+
+        self._typo_index: Dict[str, Set[str]] = defaultdict(set)
+        for word in self.vocabulary:
+            if len(word) >= typo_min_len and not word.isdigit():
+                self._typo_index[word].add(word)
+                for variant in _deletes(word):
+                    self._typo_index[variant].add(word)
+
+        self._scan = lru_cache(maxsize=cache_size)(self._scan_uncached)
+        self._correct = lru_cache(maxsize=cache_size)(self._correct_uncached)
+
+    def _correct_uncached(self, token: str) -> str:
+        if token in self.vocabulary or len(token) < self.typo_min_len - 1 or token.isdigit():
+            return token
+        candidates = set(self._typo_index.get(token, ()))
+        for variant in _deletes(token):
+            candidates.update(self._typo_index.get(variant, ()))
+        matches = sorted(c for c in candidates if within_one_edit(token, c))
+        return matches[0] if matches else token
+
+    def _scan_uncached(self, text: str) -> Tuple[str, ...]:
+        """Distinct intents in the order they appear in the message"""
+        tokens = [self._correct(token) for token in tokenize(text)]
+        found: Dict[str, None] = {}
+        for i, token in enumerate(tokens):
+            for phrase, intent in self._by_first.get(token, ()):
+                if tuple(tokens[i:i + len(phrase)]) == phrase:
+                    found.setdefault(intent)
+                    break
+        return tuple(found)
+
+    def matches(self, text: str) -> Tuple[str, ...]:
+        return self._scan(text)
+
+    def match_whole(self, text: str, prefix: str = "") -> Optional[str]:
+        """Intent whose phrase is the entire message (typos corrected), if any"""
+        tokens = tuple(self._correct(token) for token in tokenize(text))
+        if not tokens:
+            return None
+        for phrase, intent in self._by_first.get(tokens[0], ()):
+            if phrase == tokens and intent.startswith(prefix):
+                return intent
+        return None
+
+    def match(self, text: str, prefix: str = "") -> Optional[str]:
+        """First intent mentioned whose name starts with ``prefix``"""
+        for intent in self._scan(text):
+            if intent.startswith(prefix):
+                return intent
+        return None
@@ -1,8 +1,11 @@
 """Job notifications for Q-Emplois providers"""
 
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 from dataclasses import dataclass
 
+from .catalog import CatalogStore, get_catalog_store
+from .templates import Raw, Template, TemplateSet
+
 @dataclass
 class JobRequest:
     """Represents a job request to send to providers"""
@@ -16,126 +19,229 @@ class JobRequest:
     price_estimate: float
     notes: Optional[str] = None
 
-class JobNotifier:
-    """Handles notifications to service providers"""
-    
-    SERVICE_EMOJIS = {
-        'plomberie': '🔧',
-        'plumber': '🔧',
-        'électricité': '⚡',
-        'electricity': '⚡',
-        'électricien': '⚡',
-        'nettoyage': '🧹',
-        'cleaning': '🧹',
-        'jardinage': '🌱',
-        'gardening': '🌱',
-        'déménagement': '🚚',
-        'moving': '🚚',
-        'peinture': '🎨',
-        'painting': '🎨'
-    }
-    
-    def __init__(self):
-        pass
-    
-    def _get_emoji(self, service_type: str) -> str:
-        """Get emoji for service type"""
-        service_lower = service_type.lower()
-        return self.SERVICE_EMOJIS.get(service_lower, '🔧')
-    
-    def format_new_job_alert(self, job: JobRequest) -> str:
-        """Format new job notification for provider"""
-        emoji = self._get_emoji(job.service_type)
-        
-        message = f"""🔔 NOUVELLE DEMANDE!
-
-{emoji} Service: {job.service_type.title()}
-📅 Date: {job.date}
-🕐 Heure: {job.time}
-📍 Lieu: {job.location} ({job.distance_km:.1f} km)
-👤 Client: {job.client_name}
-💰 Prix estimé: {job.price_estimate:.0f} $
-"""
-        if job.notes:
-            message += f"\n📝 Notes: {job.notes}\n"
-        
-        message += "\nAccepter? 👍 / Refuser? 👎"
-        return message
-    
-    def format_job_accepted(self, job: JobRequest, provider_name: str) -> str:
-        """Format confirmation when provider accepts job"""
-        return f"""✅ Demande acceptée!
-
-{provider_name} a accepté votre demande de {job.service_type}.
+# Message templates; "telegram" variants are HTML (values are escaped),
+# everything else is sent as plain text
+TEMPLATES = {
+    "new_job_alert": {
+        "text": """🔔 NOUVELLE DEMANDE!
+
+{emoji} Service: {service}
+📅 Date: {date}
+🕐 Heure: {time}
+📍 Lieu: {location} ({distance_km:.1f} km)
+👤 Client: {client_name}
+💰 Prix estimé: {price_estimate:.0f} $
+{notes}
+Accepter? 👍 / Refuser? 👎""",
+        "telegram": """🔔 <b>NOUVELLE DEMANDE!</b>
+
+{emoji} <b>Service:</b> {service}
+📅 <b>Date:</b> {date}
+🕐 <b>Heure:</b> {time}
+📍 <b>Lieu:</b> {location} ({distance_km:.1f} km)
+👤 <b>Client:</b> {client_name}
+💰 <b>Prix estimé:</b> {price_estimate:.0f} $
+{notes}
+Accepter? 👍 / Refuser? 👎""",
+    },
+    "notes": {
+        "text": "\n📝 Notes: {notes}\n",
+        "telegram": "\n📝 <b>Notes:</b> {notes}\n",
+    },
+    "job_accepted": {
+        "text": """✅ Demande acceptée!
+
+{provider_name} a accepté votre demande de {service_type}.
 
 Nous vous contacterons sous peu pour confirmer les détails.
-"""
-    
-    def format_job_declined(self, job: JobRequest) -> str:
-        """Format message when provider declines"""
-        return f"""❌ Indisponible
+""",
+    },
+    "job_declined": {
+        "text": """❌ Indisponible
 
 Le professionnel n'est pas disponible pour cette date.
 
 Nous recherchons d'autres professionnels près de chez vous...
-"""
-    
-    def format_booking_confirmed_client(self, booking_id: str, provider_name: str,
-                                        provider_phone: str, date: str, 
-                                        time: str, service: str,
-                                        cancel_token: str) -> str:
-        """Format booking confirmation for client"""
-        emoji = self._get_emoji(service)
-        
-        return f"""✅ Votre réservation est confirmée!
+""",
+    },
+    "booking_confirmed_client": {
+        "text": """✅ Votre réservation est confirmée!
 
-{emoji} Service: {service.title()}
+{emoji} Service: {service}
 👤 {provider_name}
 📞 {provider_phone}
 📅 {date} à {time}
 
 Numéro de suivi: #{booking_id}
 Annuler: https://qemplois.ca/cancel/{cancel_token}
-"""
-    
-    def format_provider_reminder(self, job: JobRequest, client_phone: str) -> str:
-        """Format reminder for provider before job"""
-        emoji = self._get_emoji(job.service_type)
-        
-        return f"""⏰ RAPPEL - RDV dans 1h
-
-{emoji} {job.service_type.title()}
-📍 {job.location}
-🕐 {job.time}
-👤 Client: {job.client_name}
+""",
+        "telegram": """✅ <b>Votre réservation est confirmée!</b>
+
+{emoji} <b>Service:</b> {service}
+👤 {provider_name}
+📞 {provider_phone}
+📅 {date} à {time}
+
+Numéro de suivi: <code>#{booking_id}</code>
+Annuler: https://qemplois.ca/cancel/{cancel_token}
+""",
+    },
+    "booking_cancelled_client": {
+        "text": "❌ Votre réservation #{booking_id} a été annulée.",
+        "telegram": "❌ Votre réservation <code>#{booking_id}</code> a été annulée.",
+    },
+    "provider_reminder": {
+        "text": """⏰ RAPPEL - RDV dans 1h
+
+{emoji} {service}
+📍 {location}
+🕐 {time}
+👤 Client: {client_name}
 📞 {client_phone}
 
 Bon travail! 💪
-"""
-    
-    def format_provider_confirmation(self, job: JobRequest, client_phone: str) -> str:
-        """Format confirmation message sent to provider"""
-        emoji = self._get_emoji(job.service_type)
-        
-        return f"""✅ RDV CONFIRMÉ
-
-{emoji} {job.service_type.title()}
-📍 {job.location}
-🕐 {job.date} à {job.time}
-👤 Client: {job.client_name}
+""",
+        "telegram": """⏰ <b>RAPPEL - RDV dans 1h</b>
+
+{emoji} {service}
+📍 {location}
+🕐 {time}
+👤 Client: {client_name}
 📞 {client_phone}
-💰 {job.price_estimate:.0f} $
+
+Bon travail! 💪
+""",
+    },
+    "provider_confirmation": {
+        "text": """✅ RDV CONFIRMÉ
+
+{emoji} {service}
+📍 {location}
+🕐 {date} à {time}
+👤 Client: {client_name}
+📞 {client_phone}
+💰 {price_estimate:.0f} $
 
 Merci d'arriver à l'heure!
-"""
-    
-    def format_client_review_request(self, booking_id: str, provider_name: str) -> str:
-        """Format review request sent after job completion"""
-        return f"""⭐ Comment s'est passé votre service?
+""",
+        "telegram": """✅ <b>RDV CONFIRMÉ</b>
+
+{emoji} {service}
+📍 {location}
+🕐 {date} à {time}
+👤 Client: {client_name}
+📞 {client_phone}
+💰 {price_estimate:.0f} $
+
+Merci d'arriver à l'heure!
+""",
+    },
+    "client_review_request": {
+        "text": """⭐ Comment s'est passé votre service?
 
 Votre avis nous intéresse! Laissez une évaluation pour {provider_name}:
 
 https://qemplois.ca/review/{booking_id}
 
 Merci d'avoir utilisé Q-Emplois! 🙏
-"""
+""",
+    },
+}
+
+_templates: Optional[TemplateSet] = None
+
+
+def get_templates() -> TemplateSet:
+    """Templates compiled once per process"""
+    global _templates
+    if _templates is None:
+        _templates = TemplateSet(TEMPLATES)
+    return _templates
+
+
+class JobNotifier:
+    """Handles notifications to service providers
+    
+    Every ``format_*`` method takes a ``platform`` ("text", "whatsapp" or
+    "telegram") selecting the template variant.
+    """
+    
+    def __init__(self, catalog: Optional[CatalogStore] = None,
+                 templates: Optional[TemplateSet] = None):
+        self.catalog = catalog or get_catalog_store()
+        self.templates = templates or get_templates()
+    
+    def _get_emoji(self, service_type: str) -> str:
+        """Get emoji for service type (id, alias or label, from the catalogue)"""
+        return self.catalog.current().emoji(service_type)
+    
+    def _job_fields(self, job: JobRequest, platform: str) -> Dict:
+        """Slot values shared by every message about ``job``"""
+        notes = ""
+        if job.notes:
+            notes = self.templates.render("notes", platform, notes=job.notes)
+        return {
+            "emoji": self._get_emoji(job.service_type),
+            "service": job.service_type.title(),
+            "date": job.date,
+            "time": job.time,
+            "location": job.location,
+            "client_name": job.client_name,
+            "price_estimate": job.price_estimate,
+            "notes": Raw(notes),
+        }
+    
+    def prepare_new_job_alert(self, job: JobRequest, platform: str = "text") -> Template:
+        """New job alert with everything but the provider's distance filled in"""
+        return self.templates.get("new_job_alert", platform).bind(**self._job_fields(job, platform))
+    
+    def format_new_job_alert(self, job: JobRequest, platform: str = "text") -> str:
+        """Format new job notification for provider"""
+        return self.prepare_new_job_alert(job, platform).render(distance_km=job.distance_km)
+    
+    def format_new_job_alerts(self, job: JobRequest, recipients: Iterable[Dict],
+                              platform: str = "text") -> List[str]:
+        """New job alert for each recipient; the job is rendered only once"""
+        alert = self.prepare_new_job_alert(job, platform)
+        return [alert.render(distance_km=r.get("distance_km", job.distance_km)) for r in recipients]
+    
+    def format_job_accepted(self, job: JobRequest, provider_name: str, platform: str = "text") -> str:
+        """Format confirmation when provider accepts job"""
+        return self.templates.render("job_accepted", platform, provider_name=provider_name,
+                                     service_type=job.service_type)
+    
+    def format_job_declined(self, job: JobRequest, platform: str = "text") -> str:
+        """Format message when provider declines"""
+        return self.templates.render("job_declined", platform)
+    
+    def format_booking_confirmed_client(self, booking_id: str, provider_name: str,
+                                        provider_phone: str, date: str, 
+                                        time: str, service: str,
+                                        cancel_token: str, platform: str = "text") -> str:
+        """Format booking confirmation for client"""
+        return self.templates.render(
+            "booking_confirmed_client", platform,
+            emoji=self._get_emoji(service), service=service.title(),
+            provider_name=provider_name, provider_phone=provider_phone,
+            date=date, time=time, booking_id=booking_id, cancel_token=cancel_token,
+        )
+    
+    def format_booking_cancelled_client(self, booking_id: str, platform: str = "text") -> str:
+        """Format cancellation notice for client"""
+        return self.templates.render("booking_cancelled_client", platform, booking_id=booking_id)
+    
+    def format_provider_reminder(self, job: JobRequest, client_phone: str, platform: str = "text") -> str:
+        """Format reminder for provider before job"""
+        return self.templates.render("provider_reminder", platform,
+                                     client_phone=client_phone, **self._job_fields(job, platform))
+    
+    def format_provider_confirmation(self, job: JobRequest, client_phone: str, platform: str = "text") -> str:
+        """Format confirmation message sent to provider"""
+        return self.templates.render("provider_confirmation", platform,
+                                     client_phone=client_phone, **self._job_fields(job, platform))
+    
+    def format_client_review_request(self, booking_id: str, provider_name: str,
+                                     platform: str = "text") -> str:
+        """Format review request sent after job completion"""
+        return self.templates.render("client_review_request", platform,
+                                     booking_id=booking_id, provider_name=provider_name)
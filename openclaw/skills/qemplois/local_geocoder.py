@@ -0,0 +1,257 @@
+"""Offline Quebec geocoder backed by a memory-mapped sorted index
+
+The index is built once from a CSV of Quebec addresses
+(``postal_code,street,city,lat,lng``) into a binary file with three sorted
+sections of fixed-width records:
+
+- streets: normalized ``"street city"`` (plus an alias without the street
+  type, e.g. ``"sherbrooke est montreal"``)
+- postal codes: ``"H2X1Y4"``
+- FSAs: ``"H2X"``, the centroid of every postal code it contains
+
+Lookups binary-search the mmapped file directly, so there is no load step
+and no network, and the OS shares the pages between workers.
+
+Build an index with::
+
+    python -m openclaw.skills.qemplois.local_geocoder build addresses.csv quebec.idx
+"""
+import csv
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .utils import normalize_address
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"QGEO"
+VERSION = 1
+STREET_KEY_LEN = 48
+POSTAL_KEY_LEN = 6
+FSA_KEY_LEN = 3
+
+# magic, version, then (offset, count, key_len) for streets, postal codes, FSAs
+_HEADER = struct.Struct("<4sH" + "QIH" * 3)
+_COORDS = struct.Struct("<ff")
+
+STREET_TYPES = {
+    "rue", "avenue", "av", "boulevard", "boul", "bd", "chemin", "ch",
+    "route", "rang", "place", "cote", "montee", "allee", "impasse", "croissant",
+}
+
+REGION_TOKENS = {"qc", "quebec", "canada", "ca"}
+
+POSTAL_CODE_RE = re.compile(r"\b([a-z]\d[a-z])\s?(\d[a-z]\d)\b", re.IGNORECASE)
+MIN_STREET_TOKENS = 2
+
+
+def _pack_key(key: str, length: int) -> bytes:
+    return key.encode("ascii", "ignore")[:length].ljust(length, b"\0")
+
+
+def street_keys(street: str, city: str) -> List[str]:
+    """Index keys for a street: full name, and without a leading street type"""
+    tokens = normalize_address(f"{street} {city}").split()
+    keys = [" ".join(tokens)]
+    if len(tokens) > MIN_STREET_TOKENS and tokens[0] in STREET_TYPES:
+        keys.append(" ".join(tokens[1:]))
+    return keys
+
+
+# ── Build ─────────────────────────────────────────────────────────────────────
+
+def _write_section(out, records: Dict[str, Tuple[float, float]], key_len: int) -> Tuple[int, int]:
+    offset = out.tell()
+    for key in sorted(records):
+        lat, lng = records[key]
+        out.write(_pack_key(key, key_len))
+        out.write(_COORDS.pack(lat, lng))
+    return offset, len(records)
+
+
+def build_index(rows: Iterable[Dict[str, str]], index_path: str) -> Dict[str, int]:
+    """Write a sorted binary index from address rows; returns section sizes"""
+    streets: Dict[str, Tuple[float, float]] = {}
+    postal: Dict[str, Tuple[float, float]] = {}
+    fsa_points: Dict[str, List[Tuple[float, float]]] = defaultdict(list)
+
+    for row in rows:
+        lat, lng = float(row["lat"]), float(row["lng"])
+        code = (row.get("postal_code") or "").replace(" ", "").upper()
+        if len(code) == 6:
+            postal[code] = (lat, lng)
+            fsa_points[code[:3]].append((lat, lng))
+        if row.get("street"):
+            for key in street_keys(row["street"], row.get("city", "")):
+                # First row for a truncated key wins; the CSV is ordered by civic number
+                streets.setdefault(_pack_key(key, STREET_KEY_LEN).rstrip(b"\0").decode(), (lat, lng))
+
+    fsa = {
+        code: (sum(p[0] for p in pts) / len(pts), sum(p[1] for p in pts) / len(pts))
+        for code, pts in fsa_points.items()
+    }
+
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(b"\0" * _HEADER.size)
+        sections = [
+            _write_section(out, streets, STREET_KEY_LEN),
+            _write_section(out, postal, POSTAL_KEY_LEN),
+            _write_section(out, fsa, FSA_KEY_LEN),
+        ]
+        out.seek(0)
+        out.write(_HEADER.pack(
+            MAGIC, VERSION,
+            sections[0][0], sections[0][1], STREET_KEY_LEN,
+            sections[1][0], sections[1][1], POSTAL_KEY_LEN,
+            sections[2][0], sections[2][1], FSA_KEY_LEN,
+        ))
+    os.replace(tmp_path, index_path)
+    return {"streets": len(streets), "postal_codes": len(postal), "fsas": len(fsa)}
+
+
+def build_index_from_csv(csv_path: str, index_path: str) -> Dict[str, int]:
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return build_index(csv.DictReader(f), index_path)
+
+
+# ── Lookup ────────────────────────────────────────────────────────────────────
+
+class _Section:
+    """Sorted fixed-width records inside the mmapped index"""
+
+    def __init__(self, buf, offset: int, count: int, key_len: int):
+        self.buf = buf
+        self.offset = offset
+        self.count = count
+        self.key_len = key_len
+        self.record_size = key_len + _COORDS.size
+
+    def key_at(self, i: int) -> bytes:
+        start = self.offset + i * self.record_size
+        return self.buf[start:start + self.key_len]
+
+    def coords_at(self, i: int) -> Tuple[float, float]:
+        start = self.offset + i * self.record_size + self.key_len
+        return _COORDS.unpack_from(self.buf, start)
+
+    def lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def exact(self, key: str) -> Optional[Tuple[float, float]]:
+        packed = _pack_key(key, self.key_len)
+        i = self.lower_bound(packed)
+        if i < self.count and self.key_at(i) == packed:
+            return self.coords_at(i)
+        return None
+
+    def prefix(self, prefix: str) -> Optional[Tuple[str, Tuple[float, float]]]:
+        """The record whose key is ``prefix``, else the only one starting with it.
+        None when several do ("rue principale" in two cities is ambiguous)."""
+        raw = prefix.encode("ascii", "ignore")[:self.key_len]
+        i = self.lower_bound(raw)
+        if i >= self.count:
+            return None
+        key = self.key_at(i).rstrip(b"\0")
+        if not key.startswith(raw):
+            return None
+        if key != raw and i + 1 < self.count and self.key_at(i + 1).startswith(raw):
+            return None
+        return key.decode(), self.coords_at(i)
+
+
+class LocalGeocoder:
+    """Microsecond, network-free geocoding over a prebuilt Quebec index"""
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self._file = open(index_path, "rb")
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _HEADER.unpack_from(self._buf, 0)
+        if header[0] != MAGIC or header[1] != VERSION:
+            self.close()
+            raise ValueError(f"Not a Q-Emplois geocoder index: {index_path}")
+        self.streets = _Section(self._buf, *header[2:5])
+        self.postal_codes = _Section(self._buf, *header[5:8])
+        self.fsas = _Section(self._buf, *header[8:11])
+
+    @classmethod
+    def from_env(cls) -> Optional["LocalGeocoder"]:
+        """Load the index named by QEMPLOIS_GEOCODER_INDEX, if any"""
+        path = os.environ.get("QEMPLOIS_GEOCODER_INDEX")
+        if not path:
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Local geocoder disabled: {e}")
+            return None
+
+    def geocode(self, address: str) -> Optional[Dict]:
+        """Street prefix match, then postal code, then FSA centroid"""
+        postal_match = POSTAL_CODE_RE.search(address)
+        text = POSTAL_CODE_RE.sub(" ", address) if postal_match else address
+
+        tokens = normalize_address(text).split()
+        # Drop civic number / unit ("123", "4b", "1200-5") before the street name
+        while tokens and any(ch.isdigit() for ch in tokens[0]):
+            tokens.pop(0)
+
+        # "Québec" may be the city or the province, so try with and without it
+        candidates = [tokens]
+        stripped = list(tokens)
+        while stripped and stripped[-1] in REGION_TOKENS:
+            stripped.pop()
+        if stripped != tokens:
+            candidates.append(stripped)
+
+        for candidate in candidates:
+            if len(candidate) >= MIN_STREET_TOKENS:
+                hit = self.streets.prefix(" ".join(candidate))
+                if hit:
+                    return self._result(address, hit[1], "street")
+
+        if postal_match:
+            code = (postal_match.group(1) + postal_match.group(2)).upper()
+            coords = self.postal_codes.exact(code)
+            if coords:
+                return self._result(address, coords, "postal_code")
+            coords = self.fsas.exact(code[:3])
+            if coords:
+                return self._result(address, coords, "fsa")
+        return None
+
+    @staticmethod
+    def _result(address: str, coords: Tuple[float, float], precision: str) -> Dict:
+        return {
+            "lat": round(coords[0], 6),
+            "lng": round(coords[1], 6),
+            "display": address,
+            "found": True,
+            "source": "local",
+            "precision": precision,
+        }
+
+    def close(self):
+        self._buf.close()
+        self._file.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        print("usage: python -m openclaw.skills.qemplois.local_geocoder build <csv> <index>")
+        sys.exit(2)
+    print(build_index_from_csv(sys.argv[2], sys.argv[3]))
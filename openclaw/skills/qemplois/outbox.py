@@ -0,0 +1,387 @@
+"""Durable outbox for webhooks and outbound chat messages
+
+Producers (``AuthHandler._fire_webhook``, webhook-driven notifications)
+only append to the outbox, which is O(1) and never touches the network.
+Background workers deliver what is due in batches per kind. A failed batch
+is retried with exponential backoff; after ``max_attempts`` the messages
+go to the dead-letter list, where they can be inspected and requeued.
+
+A kind can linger (hold its first message for a few ms so later ones join
+the batch) and be ordered: one batch in flight at a time, and a failed
+batch holds back everything queued after it until its retry.
+
+With a ``path`` every state change is appended to a JSON-lines log that
+is replayed on start, so queued events survive a restart. The log is
+compacted (rewritten with only live entries) once it is mostly acks.
+Without a path the outbox only lives in memory.
+"""
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[List[Dict]], None]  # delivers a batch of payloads or raises
+
+
+@dataclass(slots=True)
+class OutboxMessage:
+    id: str
+    kind: str
+    payload: Dict
+    attempts: int = 0
+    due: float = 0.0
+    error: Optional[str] = None
+    seq: int = 0  # enqueue order
+
+
+@dataclass(slots=True)
+class Route:
+    handler: Handler
+    batch_size: int = 1
+    linger: float = 0.0  # seconds the first message waits for company
+    ordered: bool = False
+
+
+class Outbox:
+    """Append-only queue with retries and dead-lettering, drained by worker threads"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_attempts: int = 8,
+        backoff_base: float = 1.0,
+        backoff_max: float = 300.0,
+        fsync: bool = False,
+        compact_after: int = 10_000,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.fsync = fsync
+        self.compact_after = compact_after
+        self.clock = clock
+
+        self._pending: Dict[str, OutboxMessage] = {}
+        self._dead: Dict[str, OutboxMessage] = {}
+        self._queue: List[Tuple[float, int, str]] = []  # (due, seq, id); stale entries skipped
+        self._seq = itertools.count()
+        self._routes: Dict[str, Route] = {}
+        self._in_flight: set = set()  # ordered kinds with a batch being delivered
+        self._blocked_until: Dict[str, float] = {}  # ordered kind -> retry time of a failed batch
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.counters: Counter = Counter()
+
+        self._log = None
+        self._log_records = 0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._replay()
+            self._log = open(path, "a", encoding="utf-8")
+
+    # ── Log ───────────────────────────────────────────────────────────────────
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn write at the end of the log
+                self._log_records += 1
+                self._apply(record)
+        for message in self._pending.values():
+            self._schedule(message)
+            if message.attempts:
+                # Applied once the kind is registered as ordered (see register)
+                self._blocked_until[message.kind] = max(
+                    self._blocked_until.get(message.kind, 0.0), message.due)
+        if self._pending or self._dead:
+            logger.info(f"Outbox replayed {len(self._pending)} pending, {len(self._dead)} dead")
+
+    def _apply(self, record: Dict):
+        op, mid = record.get("op"), record.get("id")
+        if op == "add":
+            self._pending[mid] = OutboxMessage(mid, record["kind"], record["payload"],
+                                               seq=next(self._seq))
+        elif op == "ack":
+            self._pending.pop(mid, None)
+            self._dead.pop(mid, None)
+        elif op in ("retry", "dead"):
+            message = self._pending.pop(mid, None) or self._dead.pop(mid, None)
+            if message is None:
+                return
+            message.attempts, message.due, message.error = (
+                record["attempts"], record.get("due", 0.0), record.get("error"))
+            (self._pending if op == "retry" else self._dead)[mid] = message
+
+    def _write(self, *records: Dict):
+        if self._log is None:
+            return
+        self._log.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+        self._log_records += len(records)
+        live = len(self._pending) + len(self._dead)
+        if self._log_records > self.compact_after and self._log_records > 4 * live:
+            self._compact()
+
+    @staticmethod
+    def _records(message: OutboxMessage, state: str) -> List[Dict]:
+        records = [{"op": "add", "id": message.id, "kind": message.kind, "payload": message.payload}]
+        if message.attempts or state == "dead":
+            records.append({"op": state, "id": message.id, "attempts": message.attempts,
+                            "due": message.due, "error": message.error})
+        return records
+
+    def _compact(self):
+        """Rewrite the log with only pending and dead messages (atomic rename)"""
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            count = 0
+            for state, messages in (("retry", self._pending), ("dead", self._dead)):
+                for message in messages.values():
+                    for record in self._records(message, state):
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        self._log.close()
+        os.replace(tmp, self.path)
+        self._log = open(self.path, "a", encoding="utf-8")
+        self._log_records = count
+
+    # ── Producers ─────────────────────────────────────────────────────────────
+
+    def register(self, kind: str, handler: Handler, batch_size: int = 1,
+                 linger: float = 0.0, ordered: bool = False):
+        """Deliver ``kind`` messages with ``handler``, up to ``batch_size`` per call"""
+        with self._cond:
+            self._routes[kind] = Route(handler, batch_size, linger, ordered)
+            if ordered:
+                self._hold_back(kind, self._blocked_until.get(kind, 0.0))
+            else:
+                self._blocked_until.pop(kind, None)
+            self._cond.notify_all()
+
+    def enqueue(self, kind: str, payload: Dict) -> str:
+        with self._cond:
+            route = self._routes.get(kind)
+            due = self.clock() + (route.linger if route else 0.0)
+            if route and route.ordered:
+                # Queued behind a failed batch: not before its retry
+                due = max(due, self._blocked_until.get(kind, 0.0))
+            message = OutboxMessage(uuid.uuid4().hex, kind, payload, due=due, seq=next(self._seq))
+            self._pending[message.id] = message
+            self._write({"op": "add", "id": message.id, "kind": kind, "payload": payload})
+            self._schedule(message)
+            self.counters["enqueued"] += 1
+            self._cond.notify()
+        return message.id
+
+    def _schedule(self, message: OutboxMessage):
+        heapq.heappush(self._queue, (message.due, message.seq, message.id))
+
+    def _hold_back(self, kind: str, until: float):
+        """Delay every queued message of ``kind`` to ``until``; caller holds the lock"""
+        if until <= 0:
+            return
+        self._blocked_until[kind] = until
+        for message in self._pending.values():
+            if message.kind == kind and 0 <= message.due < until:
+                message.due = until
+                self._schedule(message)
+
+    # ── Delivery ──────────────────────────────────────────────────────────────
+
+    def _take_batch(self, now: float) -> Tuple[Optional[Route], List[OutboxMessage]]:
+        """Due messages of one kind, in enqueue order; caller holds the lock"""
+        kind, route, batch, skipped = None, None, [], []
+        while self._queue:
+            entry = self._queue[0]
+            # Once a batch is open, messages still lingering may join it
+            if entry[0] > (now if route is None else now + route.linger):
+                break
+            heapq.heappop(self._queue)
+            due, _, mid = entry
+            message = self._pending.get(mid)
+            if message is None or message.due != due:
+                continue  # acked, dead-lettered or rescheduled since
+            if route is None:
+                candidate = self._routes.get(message.kind)
+                if candidate and not (candidate.ordered and message.kind in self._in_flight):
+                    kind, route = message.kind, candidate
+            if message.kind != kind:
+                skipped.append(entry)
+                continue
+            batch.append(message)
+            if len(batch) >= route.batch_size:
+                break
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+        return route, batch
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    def drain(self, now: Optional[float] = None, max_batches: Optional[int] = None) -> int:
+        """Deliver due messages now; returns how many were delivered"""
+        delivered = batches = 0
+        while max_batches is None or batches < max_batches:
+            with self._cond:
+                route, batch = self._take_batch(self.clock() if now is None else now)
+                if not batch:
+                    return delivered
+                for message in batch:
+                    message.due = -1.0  # in flight: stale for other workers
+                if route.ordered:
+                    self._in_flight.add(batch[0].kind)
+            batches += 1
+            try:
+                route.handler([message.payload for message in batch])
+            except Exception as e:
+                self._failed(route, batch, e)
+            else:
+                with self._cond:
+                    self._in_flight.discard(batch[0].kind)
+                    for message in batch:
+                        self._pending.pop(message.id, None)
+                    self._write(*({"op": "ack", "id": m.id} for m in batch))
+                    self.counters["delivered"] += len(batch)
+                delivered += len(batch)
+        return delivered
+
+    def _failed(self, route: Route, batch: List[OutboxMessage], error: Exception):
+        kind = batch[0].kind
+        logger.warning(f"Outbox delivery of {len(batch)} {kind} message(s) failed: {error}")
+        now = self.clock()
+        # One retry time for the whole batch so it stays together
+        retry_due = now + self._backoff(max(m.attempts for m in batch) + 1)
+        with self._cond:
+            self._in_flight.discard(kind)
+            records = []
+            for message in batch:
+                message.attempts += 1
+                message.error = str(error)
+                if message.attempts >= self.max_attempts:
+                    self._pending.pop(message.id, None)
+                    self._dead[message.id] = message
+                    records.append({"op": "dead", "id": message.id, "attempts": message.attempts,
+                                    "due": message.due, "error": message.error})
+                    self.counters["dead"] += 1
+                    logger.error(f"Outbox message {message.id} ({message.kind}) dead-lettered")
+                else:
+                    message.due = retry_due
+                    self._schedule(message)
+                    records.append({"op": "retry", "id": message.id, "attempts": message.attempts,
+                                    "due": message.due, "error": message.error})
+                    self.counters["retried"] += 1
+            if route.ordered:
+                # Nothing queued after the failed batch, now or later, may overtake it
+                if any(message.id in self._pending for message in batch):
+                    self._hold_back(kind, retry_due)
+                else:
+                    self._blocked_until.pop(kind, None)  # all dead-lettered: nothing to wait for
+            self._write(*records)
+
+    # ── Dead letters ──────────────────────────────────────────────────────────
+
+    def dead_letters(self) -> List[OutboxMessage]:
+        with self._cond:
+            return list(self._dead.values())
+
+    def requeue_dead(self, ids: Optional[List[str]] = None) -> int:
+        """Give dead-lettered messages a fresh set of attempts"""
+        with self._cond:
+            messages = [self._dead.pop(mid) for mid in (ids or list(self._dead)) if mid in self._dead]
+            now = self.clock()
+            for message in messages:
+                message.attempts, message.due, message.error = 0, now, None
+                self._pending[message.id] = message
+                self._schedule(message)
+            self._write(*({"op": "retry", "id": m.id, "attempts": 0, "due": now} for m in messages))
+            self._cond.notify_all()
+        return len(messages)
+
+    # ── Workers ───────────────────────────────────────────────────────────────
+
+    def _next_wait(self) -> float:
+        if not self._queue:
+            return 60.0
+        return max(0.0, min(self._queue[0][0] - self.clock(), 60.0))
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                if self.drain(max_batches=1):
+                    continue
+            except Exception as e:  # never let a worker die
+                logger.error(f"Outbox worker error: {e}")
+            with self._cond:
+                # Zero means only kinds nobody handles yet are due: poll gently
+                self._cond.wait(timeout=self._next_wait() or 1.0)
+
+    def start(self, workers: int = 1):
+        if self._threads:
+            return
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name=f"qemplois-outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            by_kind: Dict[str, int] = defaultdict(int)
+            for message in self._pending.values():
+                by_kind[message.kind] += 1
+            return {
+                "pending": len(self._pending),
+                "dead": len(self._dead),
+                **{f"pending_{kind}": count for kind, count in by_kind.items()},
+                **{name: self.counters.get(name, 0)
+                   for name in ("enqueued", "delivered", "retried")},
+            }
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+# Singleton instance for import
+_outbox: Optional[Outbox] = None
+
+
+def get_outbox() -> Outbox:
+    """Get or create the process-wide outbox and start its workers"""
+    global _outbox
+    if _outbox is None:
+        _outbox = Outbox(
+            path=os.environ.get("QEMPLOIS_OUTBOX") or None,
+            max_attempts=int(os.environ.get("QEMPLOIS_OUTBOX_MAX_ATTEMPTS", 8)),
+        )
+        _outbox.start(workers=int(os.environ.get("QEMPLOIS_OUTBOX_WORKERS", 2)))
+    return _outbox
@@ -0,0 +1,172 @@
+"""Provider search result cache with stale-while-revalidate
+
+Searches are keyed by (service type, coarse geo cell, date, radius); the
+date selects the provider index for that day's availability. A fresh
+entry is served as is; a stale one is served immediately while a single
+background refresh recomputes it; past ``max_stale`` the caller waits for a
+reload. Booking webhooks invalidate a service type; a refresh that started
+before the invalidation never writes its result back.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from .provider_index import cell_of
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CELL_DEG = 0.02  # ≈ 2 km: close enough to share a provider shortlist
+
+
+def search_key(service_type: str, lat: float, lng: float, date: Optional[str], radius_km: float) -> Tuple:
+    return (service_type, cell_of(lat, lng, SEARCH_CELL_DEG), date, radius_km)
+
+
+class ProviderSearchCache:
+    """TTL + stale-while-revalidate cache for provider shortlists"""
+
+    def __init__(self, ttl: float = 60, max_stale: float = 300, maxsize: int = 5_000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._generations: Counter = Counter()
+        self._epoch = 0
+        self._refreshing: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.counters: Counter = Counter()
+
+    # ── Lookup ────────────────────────────────────────────────────────────────
+
+    def _lookup(self, key: Tuple) -> Tuple[Optional[Any], bool]:
+        """(value, needs_refresh); value is None on a miss or hard expiry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None, False
+            age = self.clock() - entry[0]
+            if age <= self.ttl:
+                self.counters["hits"] += 1
+                return entry[1], False
+            if age <= self.max_stale:
+                self.counters["stale_hits"] += 1
+                start = key not in self._refreshing
+                if start:
+                    self._refreshing.add(key)
+                return entry[1], start
+            del self._entries[key]
+            self.counters["misses"] += 1
+            return None, False
+
+    def _store(self, key: Tuple, value: Any, generation: Tuple[int, int]):
+        with self._lock:
+            self._refreshing.discard(key)
+            if (self._epoch, self._generations[key[0]]) != generation:
+                return  # invalidated while loading
+            if len(self._entries) >= self.maxsize and key not in self._entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                del self._entries[oldest]
+            self._entries[key] = (self.clock(), value)
+
+    def _generation(self, key: Tuple) -> Tuple[int, int]:
+        with self._lock:
+            return self._epoch, self._generations[key[0]]
+
+    # ── Sync ──────────────────────────────────────────────────────────────────
+
+    def get_or_load(self, key: Tuple, loader: Callable[[], Any]) -> Any:
+        value, refresh = self._lookup(key)
+        if refresh:
+            self._refresh_in_thread(key, loader)
+        if value is not None:
+            return value
+        generation = self._generation(key)
+        value = loader()
+        if value:
+            self._store(key, value, generation)
+        return value
+
+    def _refresh_in_thread(self, key: Tuple, loader: Callable[[], Any]):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="qemplois-swr")
+        self._executor.submit(self._refresh, key, loader, self._generation(key))
+
+    def _refresh(self, key: Tuple, loader: Callable[[], Any], generation: Tuple[int, int]):
+        try:
+            value = loader()
+        except Exception as e:
+            logger.error(f"Provider cache refresh failed: {e}")
+            value = None
+        self._finish_refresh(key, value, generation)
+
+    # ── Async ─────────────────────────────────────────────────────────────────
+
+    async def get_or_load_async(self, key: Tuple, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value, refresh = self._lookup(key)
+        if refresh:
+            task = asyncio.get_running_loop().create_task(
+                self._refresh_async(key, loader, self._generation(key)),
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if value is not None:
+            return value
+        generation = self._generation(key)
+        value = await loader()
+        if value:
+            self._store(key, value, generation)
+        return value
+
+    async def _refresh_async(
+        self, key: Tuple, loader: Callable[[], Awaitable[Any]], generation: Tuple[int, int],
+    ):
+        try:
+            value = await loader()
+        except Exception as e:
+            logger.error(f"Provider cache refresh failed: {e}")
+            value = None
+        self._finish_refresh(key, value, generation)
+
+    def _finish_refresh(self, key: Tuple, value: Any, generation: Tuple[int, int]):
+        if value:
+            with self._lock:
+                self.counters["refreshes"] += 1
+            self._store(key, value, generation)
+        else:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    # ── Invalidation ──────────────────────────────────────────────────────────
+
+    def invalidate(self, service_type: Optional[str] = None) -> int:
+        """Drop cached searches for one service type (or all); returns entries removed"""
+        with self._lock:
+            if service_type is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._epoch += 1
+            else:
+                keys = [k for k in self._entries if k[0] == service_type]
+                for k in keys:
+                    del self._entries[k]
+                removed = len(keys)
+                self._generations[service_type] += 1
+            self.counters["invalidations"] += 1
+            return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {name: self.counters.get(name, 0)
+                     for name in ("hits", "stale_hits", "misses", "refreshes", "invalidations")}
+            stats["size"] = len(self._entries)
+        return stats
@@ -0,0 +1,220 @@
+"""Spatial index of providers for radius and nearest-k search
+
+Providers are bucketed per service type into a lat/lng grid. A query only
+looks at the cells overlapping the search radius, then ranks the candidates
+with a vectorized haversine (NumPy when installed, plain math otherwise).
+The index is refreshed incrementally: API results are upserted by id and
+providers flagged unavailable are dropped. Availability depends on the
+day, so each (service type, date) pair has its own index. Indexes for
+past dates are dropped when a new date is first filled, and a query
+without a date (job fan-out) looks across every date still held.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import date as Date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised on installs without numpy
+    np = None
+
+EARTH_RADIUS_KM = 6371.0088
+CELL_DEG = 0.05  # ≈ 5.5 km of latitude
+
+
+def cell_of(lat: float, lng: float, cell_deg: float = CELL_DEG) -> Tuple[int, int]:
+    return (math.floor(lat / cell_deg), math.floor(lng / cell_deg))
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def provider_coords(provider: Dict) -> Optional[Tuple[float, float]]:
+    """Coordinates from either bot-style or backend-style provider records"""
+    lat = provider.get("lat", provider.get("locationLat"))
+    lng = provider.get("lng", provider.get("locationLng"))
+    if lat is None or lng is None:
+        return None
+    return float(lat), float(lng)
+
+
+class _ServiceIndex:
+    """Providers of one service type; grid and arrays rebuilt lazily on change"""
+
+    def __init__(self, cell_deg: float):
+        self.cell_deg = cell_deg
+        self.providers: Dict[str, Dict] = {}
+        self.refreshed_at: Optional[float] = None
+        self.force_refresh = False
+        self._dirty = True
+        self._ids: List[str] = []
+        self._lat = self._lng = None
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+
+    def upsert(self, provider: Dict):
+        pid = str(provider["id"])
+        if provider.get("available", True) is False or provider.get("active", True) is False:
+            self.providers.pop(pid, None)
+        else:
+            self.providers[pid] = provider
+        self._dirty = True
+
+    def remove(self, pid: str):
+        if self.providers.pop(pid, None) is not None:
+            self._dirty = True
+
+    def _rebuild(self):
+        located = [(pid, provider_coords(p)) for pid, p in self.providers.items()]
+        located = [(pid, c) for pid, c in located if c is not None]
+        self._ids = [pid for pid, _ in located]
+        lats = [c[0] for _, c in located]
+        lngs = [c[1] for _, c in located]
+        if np is not None:
+            self._lat = np.radians(np.array(lats, dtype=np.float64))
+            self._lng = np.radians(np.array(lngs, dtype=np.float64))
+        else:
+            self._lat, self._lng = lats, lngs
+        self._cells = defaultdict(list)
+        for row, (lat, lng) in enumerate(zip(lats, lngs)):
+            self._cells[cell_of(lat, lng, self.cell_deg)].append(row)
+        self._dirty = False
+
+    def _candidate_rows(self, lat: float, lng: float, radius_km: float) -> List[int]:
+        dlat = radius_km / 111.0
+        dlng = radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+        i0, j0 = cell_of(lat - dlat, lng - dlng, self.cell_deg)
+        i1, j1 = cell_of(lat + dlat, lng + dlng, self.cell_deg)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._cells):
+            cells = (rows for (i, j), rows in self._cells.items()
+                     if i0 <= i <= i1 and j0 <= j <= j1)
+        else:
+            cells = (self._cells.get((i, j), ()) for i in range(i0, i1 + 1)
+                     for j in range(j0, j1 + 1))
+        return [row for rows in cells for row in rows]
+
+    def nearest(self, lat: float, lng: float, k: int, radius_km: float) -> List[Tuple[str, float]]:
+        if self._dirty:
+            self._rebuild()
+        rows = self._candidate_rows(lat, lng, radius_km)
+        if not rows:
+            return []
+
+        if np is not None:
+            idx = np.fromiter(rows, dtype=np.intp, count=len(rows))
+            plat, plng = self._lat[idx], self._lng[idx]
+            qlat, qlng = math.radians(lat), math.radians(lng)
+            a = (np.sin((plat - qlat) / 2) ** 2
+                 + math.cos(qlat) * np.cos(plat) * np.sin((plng - qlng) / 2) ** 2)
+            dist = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+            inside = np.nonzero(dist <= radius_km)[0]
+            if len(inside) > k:
+                inside = inside[np.argpartition(dist[inside], k - 1)[:k]]
+            order = inside[np.argsort(dist[inside], kind="stable")]
+            return [(self._ids[idx[i]], float(dist[i])) for i in order]
+
+        scored = []
+        for row in rows:
+            d = haversine_km(lat, lng, self._lat[row], self._lng[row])
+            if d <= radius_km:
+                scored.append((d, row))
+        scored.sort()
+        return [(self._ids[row], d) for d, row in scored[:k]]
+
+
+class ProviderIndex:
+    """Per-service spatial index answering "k nearest within R km" queries"""
+
+    def __init__(self, refresh_interval: float = 60, cell_deg: float = CELL_DEG):
+        self.refresh_interval = refresh_interval
+        self.cell_deg = cell_deg
+        self._services: Dict[Tuple[str, Optional[str]], _ServiceIndex] = {}
+        self._lock = threading.Lock()
+
+    def _service(self, service_type: str, date: Optional[str]) -> _ServiceIndex:
+        index = self._services.get((service_type, date))
+        if index is None:
+            self._evict_past()
+            index = self._services[service_type, date] = _ServiceIndex(self.cell_deg)
+        return index
+
+    def _evict_past(self):
+        """Drop the indexes of days already gone (ISO dates sort chronologically)"""
+        today = Date.today().isoformat()
+        for key in [key for key in self._services if key[1] is not None and key[1] < today]:
+            del self._services[key]
+
+    def upsert(self, service_type: str, providers: Iterable[Dict], refreshed: bool = True,
+               date: Optional[str] = None):
+        """Merge API results; unavailable providers are removed"""
+        with self._lock:
+            index = self._service(service_type, date)
+            for provider in providers:
+                index.upsert(provider)
+            if refreshed:
+                index.refreshed_at = time.time()
+                index.force_refresh = False
+
+    def remove(self, service_type: str, provider_id: str):
+        """Drop a provider from every date of a service"""
+        with self._lock:
+            for (service, _), index in self._services.items():
+                if service == service_type:
+                    index.remove(str(provider_id))
+
+    def mark_stale(self, service_type: Optional[str] = None):
+        """Force the next search to refresh from the API (all services if None)"""
+        with self._lock:
+            for (service, _), index in self._services.items():
+                if service_type is None or service == service_type:
+                    index.force_refresh = True
+
+    def is_stale(self, service_type: str, date: Optional[str] = None) -> bool:
+        index = self._services.get((service_type, date))
+        return (
+            index is None
+            or index.force_refresh
+            or index.refreshed_at is None
+            or time.time() - index.refreshed_at > self.refresh_interval
+        )
+
+    def refreshed_at(self, service_type: str, date: Optional[str] = None) -> Optional[float]:
+        index = self._services.get((service_type, date))
+        return index.refreshed_at if index else None
+
+    def providers(self, service_type: str, date: Optional[str] = None) -> List[Dict]:
+        index = self._services.get((service_type, date))
+        return list(index.providers.values()) if index else []
+
+    def nearest(self, service_type: str, lat: float, lng: float,
+                k: int = 3, radius_km: float = 25, date: Optional[str] = None) -> List[Dict]:
+        """Up to ``k`` providers within ``radius_km``, closest first, with distance_km set.
+        Without a date, every date held for the service is searched."""
+        with self._lock:
+            if date is not None:
+                indexes = [self._services.get((service_type, date))]
+            else:
+                indexes = [index for (service, _), index in self._services.items()
+                           if service == service_type]
+            best: Dict[str, Tuple[float, Dict]] = {}
+            for index in indexes:
+                if index is None:
+                    continue
+                for pid, dist in index.nearest(lat, lng, k, radius_km):
+                    if pid not in best or dist < best[pid][0]:
+                        best[pid] = (dist, index.providers[pid])
+            ranked = sorted(best.values(), key=lambda hit: hit[0])[:k]
+            return [{**provider, "distance_km": round(dist, 1)} for dist, provider in ranked]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                service if date is None else f"{service}:{date}": len(index.providers)
+                for (service, date), index in self._services.items()
+            }
@@ -0,0 +1,188 @@
+"""Rate limiting primitives for Q-Emplois bot"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Optional
+
+from .aio import LoopLocal
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by threads and asyncio tasks.
+
+    ``reserve`` hands out a token immediately and returns how long the caller
+    must wait before using it, so sync callers ``time.sleep`` and async
+    callers ``asyncio.sleep`` on the same bucket. Reservations stack up in
+    arrival order; a caller that would wait longer than ``max_wait`` gets
+    ``None`` and no token is taken.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, tokens: float = 1, max_wait: Optional[float] = None) -> Optional[float]:
+        with self._lock:
+            self._refill(self.clock())
+            wait = max(0.0, (tokens - self.tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self.tokens -= tokens
+            return wait
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        return self.reserve(tokens, max_wait=0) is not None
+
+
+# ── Inbound messages ─────────────────────────────────────────────────────────
+
+# Per-user and global token buckets checked in one round trip. Buckets are
+# hashes {t: tokens, ts: last refill}; nothing is written when throttled.
+# KEYS: user bucket, global bucket
+# ARGV: now, user rate, user burst, global rate, global burst, idle ttl (ms)
+INBOUND_LIMIT_LUA = """
+local now = tonumber(ARGV[1])
+local function level(key, rate, burst)
+  local state = redis.call('HMGET', key, 't', 'ts')
+  local tokens = tonumber(state[1]) or burst
+  local ts = tonumber(state[2]) or now
+  return math.min(burst, tokens + math.max(0, now - ts) * rate)
+end
+local user = level(KEYS[1], tonumber(ARGV[2]), tonumber(ARGV[3]))
+if user < 1 then return 'user' end
+local global = level(KEYS[2], tonumber(ARGV[4]), tonumber(ARGV[5]))
+if global < 1 then return 'global' end
+redis.call('HSET', KEYS[1], 't', user - 1, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], ARGV[6])
+redis.call('HSET', KEYS[2], 't', global - 1, 'ts', now)
+redis.call('PEXPIRE', KEYS[2], ARGV[6])
+return 'ok'
+"""
+
+
+class InboundLimiter:
+    """
+    Per-user and global limits on inbound chat messages.
+
+    ``check`` returns ``None`` when a message may be processed, or which
+    limit it hit ("user" or "global"). Buckets live in-process by default;
+    with a Redis client every worker shares them (one script call per
+    message), falling back to the local buckets if Redis is unreachable.
+    """
+
+    def __init__(
+        self,
+        user_rate: float = 1.0,
+        user_burst: float = 10,
+        global_rate: float = 200.0,
+        global_burst: float = 400,
+        redis_client=None,
+        async_redis: Optional[Callable[[], Any]] = None,
+        prefix: str = "rl:inbound:",
+        notice_interval: float = 60,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.redis = redis_client
+        self.async_redis = async_redis  # zero-arg callable returning a loop-bound client
+        # Scripts registered once (SHA computed once), not per message
+        self._script = (redis_client.register_script(INBOUND_LIMIT_LUA)
+                        if redis_client is not None else None)
+        self._ascript = LoopLocal(lambda: self.async_redis().register_script(INBOUND_LIMIT_LUA))
+        self.prefix = prefix
+        self.clock = clock
+        # A bucket idle for burst / rate seconds is full again and can go
+        self.idle_ttl = max(user_burst / user_rate, global_burst / global_rate, 1)
+        self.users: TTLCache[TokenBucket] = TTLCache(maxsize=100_000, ttl=self.idle_ttl)
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock=clock)
+        self._notified: TTLCache[bool] = TTLCache(maxsize=100_000, ttl=notice_interval)
+        self.counters: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, redis_client=None, async_redis=None) -> "InboundLimiter":
+        """QEMPLOIS_RATELIMIT=redis shares the buckets across workers"""
+        shared = os.environ.get("QEMPLOIS_RATELIMIT", "local") == "redis"
+        return cls(
+            user_rate=float(os.environ.get("QEMPLOIS_USER_RATE", 1.0)),
+            user_burst=float(os.environ.get("QEMPLOIS_USER_BURST", 10)),
+            global_rate=float(os.environ.get("QEMPLOIS_GLOBAL_RATE", 200.0)),
+            global_burst=float(os.environ.get("QEMPLOIS_GLOBAL_BURST", 400)),
+            redis_client=redis_client if shared else None,
+            async_redis=async_redis if shared else None,
+        )
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _verdict(self, result: Optional[str]) -> Optional[str]:
+        self._count("allowed" if result is None else f"throttled_{result}")
+        return result
+
+    def _check_local(self, key: str) -> Optional[str]:
+        with self._lock:
+            bucket = self.users.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.user_rate, self.user_burst, clock=self.clock)
+            self.users.set(key, bucket)  # pushes back the idle expiry
+        if not bucket.try_acquire():
+            return "user"
+        if not self.global_bucket.try_acquire():
+            return "global"
+        return None
+
+    def _script_args(self, key: str):
+        return {
+            "keys": [f"{self.prefix}{key}", f"{self.prefix}global"],
+            "args": [self.clock(), self.user_rate, self.user_burst,
+                     self.global_rate, self.global_burst, int(self.idle_ttl * 1000)],
+        }
+
+    def check(self, platform: str, user_id: str) -> Optional[str]:
+        key = f"{platform}:{user_id}"
+        if self.redis is not None:
+            try:
+                result = self._script(**self._script_args(key))
+                return self._verdict(None if result == "ok" else result)
+            except Exception as e:
+                self._count("redis_errors")
+                logger.warning(f"Shared rate limit unavailable, using local buckets: {e}")
+        return self._verdict(self._check_local(key))
+
+    async def check_async(self, platform: str, user_id: str) -> Optional[str]:
+        key = f"{platform}:{user_id}"
+        if self.async_redis is not None:
+            try:
+                result = await self._ascript.get()(**self._script_args(key))
+                return self._verdict(None if result == "ok" else result)
+            except Exception as e:
+                self._count("redis_errors")
+                logger.warning(f"Shared rate limit unavailable, using local buckets: {e}")
+        return self._verdict(self._check_local(key))
+
+    def should_notify(self, platform: str, user_id: str) -> bool:
+        """True for the first throttled message per notice interval: reply once, then stay quiet"""
+        key = f"{platform}:{user_id}"
+        with self._lock:
+            if key in self._notified:
+                return False
+            self._notified.set(key, True)
+            return True
@@ -0,0 +1,291 @@
+"""Conversation session stores for the booking flow
+
+A session is loaded once when a message arrives and saved once when the
+reply is ready, however many fields the handlers touched in between.
+
+- ``MemorySessionStore``: bounded, TTL-evicted, in process (single worker)
+- ``RedisSessionStore``: shared by every worker and surviving redeploys;
+  sessions are stored as compact JSON and the write is skipped when the
+  message did not change anything (the read already refreshed the TTL)
+
+How long an idle session lives depends on where the conversation stopped:
+a provider shortlist goes stale in minutes, a finished booking has nothing
+left to remember.
+"""
+import json
+import logging
+import sys
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL = 24 * 3600
+
+# Idle TTL per BookingState value; 0 deletes the session on save
+STATE_TTLS: Dict[str, int] = {
+    "idle": 3600,
+    "searching_providers": 15 * 60,
+    "show_providers": 15 * 60,
+    "confirm_booking": 30 * 60,
+    "completed": 0,
+}
+
+SWEEP_BATCH = 16
+
+
+def session_key(user_id: str, platform: str) -> str:
+    return f"{platform}:{user_id}"
+
+
+def estimate_size(obj, _seen: Optional[set] = None) -> int:
+    """Approximate deep ``sys.getsizeof`` of a session and what it references"""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), seen)
+    elif hasattr(obj, "__slots__"):
+        size += sum(estimate_size(getattr(obj, name, None), seen) for name in obj.__slots__)
+    return size
+
+
+def encode_session(session) -> bytes:
+    """Compact JSON: no whitespace, fields still at their default omitted"""
+    data = {k: v for k, v in session.to_dict().items() if v not in (None, [])}
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def decode_session(raw: bytes):
+    from .booking_flow import BookingData  # booking_flow imports this module
+    return BookingData.from_dict(json.loads(raw))
+
+
+class SessionStore(ABC):
+    """Interface; async methods default to the sync ones for in-process stores"""
+
+    ttl: int = SESSION_TTL
+    state_ttls: Dict[str, int] = STATE_TTLS
+
+    def ttl_for(self, session) -> int:
+        return self.state_ttls.get(session.state.value, self.ttl)
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+    @abstractmethod
+    def load(self, key: str):
+        """The session stored under ``key``, or None"""
+
+    @abstractmethod
+    def save(self, key: str, session):
+        """Store ``session``, or drop it when its state's TTL is 0"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Forget the session stored under ``key``"""
+
+    async def load_async(self, key: str):
+        return self.load(key)
+
+    async def save_async(self, key: str, session):
+        self.save(key, session)
+
+    async def delete_async(self, key: str):
+        self.delete(key)
+
+    def __getitem__(self, key: str):
+        session = self.load(key)
+        if session is None:
+            raise KeyError(key)
+        return session
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions kept as live objects in a bounded LRU with idle expiry"""
+
+    def __init__(self, maxsize: int = 10_000, ttl: int = SESSION_TTL,
+                 state_ttls: Optional[Dict[str, int]] = None, clock=None):
+        cache_kwargs = {"clock": clock} if clock else {}
+        self.sessions: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl, **cache_kwargs)
+        self.ttl = ttl
+        self.state_ttls = STATE_TTLS if state_ttls is None else state_ttls
+
+    def load(self, key: str):
+        return self.sessions.get(key)
+
+    def save(self, key: str, session):
+        # Amortized reaping: every write retires a few expired sessions
+        self.sessions.sweep(limit=SWEEP_BATCH)
+        ttl = self.ttl_for(session)
+        if ttl <= 0:
+            self.sessions.pop(key)
+        else:
+            self.sessions.set(key, session, ttl=ttl)
+
+    def delete(self, key: str):
+        self.sessions.pop(key)
+
+    def reap(self) -> int:
+        """Drop every expired session now (for a periodic job); returns the count"""
+        return self.sessions.sweep()
+
+    def stats(self) -> Dict[str, int]:
+        self.reap()
+        sessions = self.sessions.values()
+        now = time.time()
+        return {
+            "live": len(sessions),
+            "bytes": sum(estimate_size(s) for s in sessions),
+            "max_idle": int(max((now - s.last_activity for s in sessions), default=0)),
+            "expired": self.sessions.expirations,
+            "evictions": self.sessions.evictions,
+        }
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions in Redis, one GETEX per message plus a SETEX only on change"""
+
+    def __init__(
+        self,
+        redis_client=None,
+        async_redis: Optional[Callable[[], Any]] = None,
+        ttl: int = SESSION_TTL,
+        prefix: str = "session:",
+        state_ttls: Optional[Dict[str, int]] = None,
+    ):
+        self.redis = redis_client
+        self.async_redis = async_redis  # zero-arg callable returning a loop-bound client
+        self.ttl = ttl  # refreshed by the GETEX on load
+        self.state_ttls = STATE_TTLS if state_ttls is None else state_ttls
+        self.prefix = prefix
+        # Encoding seen at load time, to skip no-op writes
+        self._loaded: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+        # Used while Redis is unreachable so conversations keep going
+        self.fallback = MemorySessionStore(ttl=ttl, state_ttls=self.state_ttls)
+        self.counters: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _decode(self, key: str, raw: Optional[bytes]):
+        if not raw:
+            return None
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        self._loaded.set(key, raw)
+        return decode_session(raw)
+
+    def _write_plan(self, key: str, session) -> Optional[Tuple[str, tuple]]:
+        """Redis command for this save, or None when Redis already has it"""
+        ttl = self.ttl_for(session)
+        if ttl <= 0:
+            self._loaded.pop(key)
+            return "delete", (self.prefix + key,)
+        raw = encode_session(session)
+        if self._loaded.get(key) == raw:
+            self._count("skipped_writes")
+            # GETEX re-armed the default TTL; a shorter per-state one must be re-applied
+            return ("expire", (self.prefix + key, ttl)) if ttl != self.ttl else None
+        self._loaded.set(key, raw)
+        return "setex", (self.prefix + key, ttl, raw)
+
+    def _write_failed(self, key: str, session, error: Exception):
+        logger.warning(f"Session store Redis write failed: {error}")
+        self._count("errors")
+        self._loaded.pop(key)
+        self.fallback.save(key, session)
+
+    # ── Sync ──────────────────────────────────────────────────────────────────
+
+    def load(self, key: str):
+        try:
+            raw = self.redis.getex(self.prefix + key, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Session store Redis read failed: {e}")
+            self._count("errors")
+            return self.fallback.load(key)
+        self._count("reads")
+        return self._decode(key, raw)
+
+    def save(self, key: str, session):
+        plan = self._write_plan(key, session)
+        if plan is None:
+            return
+        command, args = plan
+        try:
+            getattr(self.redis, command)(*args)
+            self._count("writes")
+        except Exception as e:
+            self._write_failed(key, session, e)
+
+    def delete(self, key: str):
+        self._loaded.pop(key)
+        self.fallback.delete(key)
+        try:
+            self.redis.delete(self.prefix + key)
+        except Exception as e:
+            logger.warning(f"Session store Redis delete failed: {e}")
+
+    # ── Async ─────────────────────────────────────────────────────────────────
+
+    async def load_async(self, key: str):
+        if self.async_redis is None:
+            return self.load(key)
+        try:
+            raw = await self.async_redis().getex(self.prefix + key, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Session store Redis read failed: {e}")
+            self._count("errors")
+            return self.fallback.load(key)
+        self._count("reads")
+        return self._decode(key, raw)
+
+    async def save_async(self, key: str, session):
+        if self.async_redis is None:
+            return self.save(key, session)
+        plan = self._write_plan(key, session)
+        if plan is None:
+            return
+        command, args = plan
+        try:
+            await getattr(self.async_redis(), command)(*args)
+            self._count("writes")
+        except Exception as e:
+            self._write_failed(key, session, e)
+
+    async def delete_async(self, key: str):
+        if self.async_redis is None:
+            return self.delete(key)
+        self._loaded.pop(key)
+        self.fallback.delete(key)
+        try:
+            await self.async_redis().delete(self.prefix + key)
+        except Exception as e:
+            logger.warning(f"Session store Redis delete failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """Redis counters; ``live``/``bytes`` only cover sessions held by the fallback"""
+        with self._lock:
+            stats = {name: self.counters.get(name, 0)
+                     for name in ("reads", "writes", "skipped_writes", "errors")}
+        fallback = self.fallback.stats()
+        stats["live"] = fallback["live"]
+        stats["bytes"] = fallback["bytes"]
+        return stats
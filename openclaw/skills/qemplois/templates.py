@@ -0,0 +1,112 @@
+"""Compiled message templates for notifications
+
+A template is parsed once into static text segments and slots. ``bind``
+fills the slots known up front (everything about a job) and merges them
+into the static text, so rendering the same job for each recipient only
+formats what differs per recipient (distance, name...).
+
+Slot values are escaped for the target platform: Telegram messages are
+sent with ``parse_mode=HTML``, WhatsApp messages are plain text. Values
+wrapped in ``Raw`` (already rendered fragments) are inserted as is.
+"""
+import html
+from string import Formatter
+from typing import Callable, Dict, Optional, Tuple, Union
+
+Escape = Optional[Callable[[str], str]]
+
+
+class Raw(str):
+    """Already escaped/rendered text, inserted without escaping"""
+
+
+# platform -> escape function for slot values
+PLATFORM_ESCAPES: Dict[str, Escape] = {
+    "text": None,
+    "whatsapp": None,
+    "telegram": lambda value: html.escape(value, quote=False),
+}
+
+Slot = Tuple[str, str, Optional[str]]  # field name, format spec, conversion
+Part = Union[str, Slot]
+
+
+class Template:
+    """Static segments and slots, rendered with one ``str.join``"""
+
+    __slots__ = ("parts", "escape")
+
+    def __init__(self, source: str = "", escape: Escape = None, parts: Optional[Tuple[Part, ...]] = None):
+        self.escape = escape
+        if parts is None:
+            parts = []
+            for literal, name, spec, conversion in Formatter().parse(source):
+                parts.append(literal)
+                if name is not None:
+                    parts.append((name, spec or "", conversion))
+        self.parts = self._merge(parts)
+
+    @staticmethod
+    def _merge(parts) -> Tuple[Part, ...]:
+        merged = []
+        for part in parts:
+            if isinstance(part, str):
+                if not part:
+                    continue
+                if merged and isinstance(merged[-1], str):
+                    merged[-1] += part
+                    continue
+            merged.append(part)
+        return tuple(merged)
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        return tuple(part[0] for part in self.parts if not isinstance(part, str))
+
+    def _format(self, slot: Slot, value) -> str:
+        _, spec, conversion = slot
+        if conversion == "r":
+            value = repr(value)
+        elif conversion is not None:
+            value = str(value)
+        text = format(value, spec)
+        # Numbers can't contain markup; only text that isn't Raw needs escaping
+        if self.escape is not None and isinstance(value, str) and not isinstance(value, Raw):
+            text = self.escape(text)
+        return text
+
+    def bind(self, **values) -> "Template":
+        """Template with the given slots filled in as static text"""
+        parts = [
+            part if isinstance(part, str) or part[0] not in values
+            else self._format(part, values[part[0]])
+            for part in self.parts
+        ]
+        return Template(escape=self.escape, parts=tuple(parts))
+
+    def render(self, **values) -> str:
+        parts = self.parts
+        if len(parts) == 1 and isinstance(parts[0], str):
+            return parts[0]
+        return "".join(
+            part if isinstance(part, str) else self._format(part, values[part[0]])
+            for part in parts
+        )
+
+
+class TemplateSet:
+    """Named templates compiled per platform; platforms without a variant use "text" """
+
+    def __init__(self, sources: Dict[str, Dict[str, str]]):
+        self._templates: Dict[Tuple[str, str], Template] = {}
+        for name, variants in sources.items():
+            for platform, escape in PLATFORM_ESCAPES.items():
+                source = variants.get(platform, variants["text"])
+                self._templates[name, platform] = Template(source, escape)
+
+    def get(self, name: str, platform: str = "text") -> Template:
+        template = self._templates.get((name, platform))
+        return template if template is not None else self._templates[name, "text"]
+
+    def render(self, name: str, platform: str = "text", **values) -> str:
+        return self.get(name, platform).render(**values)
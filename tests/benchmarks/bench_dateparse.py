@@ -0,0 +1,144 @@
+"""parse_date / parse_time throughput: previous implementation vs engine,
+and scalar calls vs the batch APIs over a synthetic message log
+
+Run with::
+
+    python -m tests.benchmarks.bench_dateparse [rounds]
+"""
+import re
+import random
+import sys
+import time
+import timeit
+from datetime import datetime, timedelta
+
+from openclaw.skills.qemplois import dateparse
+
+REFERENCE = datetime(2026, 3, 4, 10, 30)
+
+# Skewed like real traffic: a few replies dominate
+DATE_INPUTS = ["demain"] * 6 + ["aujourd'hui"] * 2 + ["20 février", "15/03", "après-demain", "bof"]
+TIME_INPUTS = ["14h"] * 5 + ["9h30"] * 3 + ["14:30", "2pm", "10h", "3"]
+
+
+def legacy_parse_date(text, reference_date=None):
+    """utils.parse_date before the engine (kept verbatim for comparison)"""
+    if reference_date is None:
+        reference_date = datetime.now()
+    text = text.lower().strip()
+    if text in ["aujourd'hui", "aujourd hui", "aujourdhui", "today"]:
+        return reference_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    if text in ["demain", "tomorrow"]:
+        return (reference_date + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    if text in ["après-demain", "apres-demain", "après demain", "apres demain"]:
+        return (reference_date + timedelta(days=2)).replace(hour=0, minute=0, second=0, microsecond=0)
+    months_fr = {
+        'janvier': 1, 'février': 2, 'fevrier': 2, 'mars': 3, 'avril': 4,
+        'mai': 5, 'juin': 6, 'juillet': 7, 'août': 8, 'aout': 8,
+        'septembre': 9, 'octobre': 10, 'novembre': 11, 'décembre': 12, 'decembre': 12
+    }
+    day_month_pattern = r'(\d{1,2})\s+(janvier|février|fevrier|mars|avril|mai|juin|juillet|août|aout|septembre|octobre|novembre|décembre|decembre)'
+    match = re.search(day_month_pattern, text)
+    if match:
+        day = int(match.group(1))
+        month = months_fr.get(match.group(2), 1)
+        year = reference_date.year
+        if month < reference_date.month:
+            year += 1
+        try:
+            return datetime(year, month, day)
+        except ValueError:
+            return None
+    numeric_pattern = r'(\d{1,2})[/-](\d{1,2})(?:[/-](\d{2,4}))?'
+    match = re.search(numeric_pattern, text)
+    if match:
+        day = int(match.group(1))
+        month = int(match.group(2))
+        year_str = match.group(3)
+        if year_str:
+            year = int(year_str) if len(year_str) == 4 else 2000 + int(year_str)
+        else:
+            year = reference_date.year
+            if month < reference_date.month or (month == reference_date.month and day < reference_date.day):
+                year += 1
+        try:
+            return datetime(year, month, day)
+        except ValueError:
+            return None
+    return None
+
+
+def legacy_parse_time(text):
+    """utils.parse_time before the engine (kept verbatim for comparison)"""
+    text = text.lower().strip().replace(' ', '')
+    match = re.match(r'^(\d{1,2})h(\d{2})?$', text)
+    if match:
+        hour = int(match.group(1))
+        minute = int(match.group(2)) if match.group(2) else 0
+        if 0 <= hour <= 23 and 0 <= minute <= 59:
+            return (hour, minute)
+    match = re.match(r'^(\d{1,2}):(\d{2})$', text)
+    if match:
+        hour = int(match.group(1))
+        minute = int(match.group(2))
+        if 0 <= hour <= 23 and 0 <= minute <= 59:
+            return (hour, minute)
+    match = re.match(r'^(\d{1,2}):?(\d{2})?(am|pm|du soir|du matin)$', text)
+    if match:
+        hour = int(match.group(1))
+        minute = int(match.group(2)) if match.group(2) else 0
+        period = match.group(3)
+        if 'pm' in period or 'soir' in period:
+            if hour != 12:
+                hour += 12
+        elif ('am' in period or 'matin' in period) and hour == 12:
+            hour = 0
+        if 0 <= hour <= 23 and 0 <= minute <= 59:
+            return (hour, minute)
+    return None
+
+
+def bench(label, fn, inputs, rounds, *args):
+    seconds = timeit.timeit(lambda: [fn(text, *args) for text in inputs], number=rounds)
+    per_call = seconds / (rounds * len(inputs)) * 1e6
+    print(f"  {label:<28} {per_call:6.2f} µs/call")
+    return per_call
+
+
+def main(rounds: int = 20_000):
+    print("parse_date")
+    before = bench("legacy", legacy_parse_date, DATE_INPUTS, rounds, REFERENCE)
+    after = bench("engine (memoized)", dateparse.parse_date, DATE_INPUTS, rounds, REFERENCE)
+    cold = bench("engine (cold, no memo)", lambda t, r: dateparse._resolve.__wrapped__(
+        dateparse.date_plan.__wrapped__(t) or ("offset", 0), r.toordinal()),
+        DATE_INPUTS, rounds // 4, REFERENCE)
+    print(f"  speedup {before / after:.1f}x memoized, {before / cold:.1f}x cold")
+
+    print("parse_time")
+    before = bench("legacy", legacy_parse_time, TIME_INPUTS, rounds)
+    after = bench("engine (memoized)", dateparse.parse_time, TIME_INPUTS, rounds)
+    cold = bench("engine (cold, no memo)", dateparse.parse_time.__wrapped__, TIME_INPUTS, rounds // 4)
+    print(f"  speedup {before / after:.1f}x memoized, {before / cold:.1f}x cold")
+
+
+def bench_batch(n: int = 1_000_000):
+    rng = random.Random(0)
+    # Chat logs are mostly repeats, with a long tail of one-off strings
+    vocabulary = DATE_INPUTS + TIME_INPUTS + [f"{d}/{m}" for d in range(1, 29) for m in range(1, 13)]
+    log = [rng.choice(vocabulary) if rng.random() < 0.98 else f"message {i}" for i in range(n)]
+
+    print(f"batch over {n} messages")
+    start = time.perf_counter()
+    [dateparse.parse_date(text, REFERENCE) for text in log]
+    [dateparse.parse_time(text) for text in log]
+    scalar = time.perf_counter() - start
+    start = time.perf_counter()
+    dateparse.parse_dates(log, REFERENCE)
+    dateparse.parse_times(log)
+    batch = time.perf_counter() - start
+    print(f"  scalar loop {scalar:.2f} s, batch {batch:.2f} s ({scalar / batch:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
+    bench_batch()
@@ -0,0 +1,55 @@
+"""Conversation dispatcher throughput at 1, 4 and 16 workers
+
+Each of 64 users sends 5 messages at once. A message takes about 20 ms of
+I/O (session load and save, provider API), which is simulated with
+``asyncio.sleep``. One worker is the old single-threaded behaviour; more
+workers handle different users in parallel, while each user's messages
+still run in order and one at a time (checked after every run).
+
+Run with::
+
+    python -m tests.benchmarks.bench_dispatcher [users] [messages_per_user]
+"""
+import asyncio
+import sys
+import time
+
+from openclaw.skills.qemplois.dispatcher import ConversationDispatcher
+
+IO_SECONDS = 0.02
+
+
+async def run(workers: int, users: int, messages: int) -> float:
+    dispatcher = ConversationDispatcher(workers=workers)
+    seen = {}
+    busy = set()
+
+    async def handle(user: int, n: int):
+        assert user not in busy
+        busy.add(user)
+        await asyncio.sleep(IO_SECONDS)
+        seen.setdefault(user, []).append(n)
+        busy.discard(user)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        dispatcher.submit(f"telegram:{u}", lambda u=u, n=n: handle(u, n))
+        for n in range(messages) for u in range(users)
+    ))
+    elapsed = time.perf_counter() - start
+    assert all(order == list(range(messages)) for order in seen.values())
+    return users * messages / elapsed
+
+
+def main(users: int = 64, messages: int = 5):
+    print(f"{users} users x {messages} messages, {IO_SECONDS * 1000:.0f} ms I/O each")
+    baseline = None
+    for workers in (1, 4, 16):
+        rate = asyncio.run(run(workers, users, messages))
+        baseline = baseline or rate
+        print(f"  {workers:2d} workers  {rate:8.0f} msg/s ({rate / baseline:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 64,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 5)
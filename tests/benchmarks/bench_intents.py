@@ -0,0 +1,70 @@
+"""Service matching over the full Quebec category catalogue
+
+Compares the previous per-message linear scan (lowercase + substring test
+against every label) with the precomputed IntentMatcher.
+
+Run with::
+
+    python -m tests.benchmarks.bench_intents [rounds]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+from openclaw.skills.qemplois.intents import IntentMatcher
+
+CATALOGUE = os.path.join(os.path.dirname(__file__), "..", "..", "QUEBEC_TASK_CATEGORIES.md")
+ENTRY = re.compile(r"^\d+\.\s+\*\*(.+?)\*\*", re.MULTILINE)
+
+
+def load_catalogue():
+    """{category id: [French label, English label]} from the markdown list"""
+    with open(CATALOGUE, encoding="utf-8") as f:
+        labels = ENTRY.findall(f.read())
+    return {f"service:{i}": [part.strip() for part in label.split("/")]
+            for i, label in enumerate(labels, 1)}
+
+
+def legacy_match(catalogue, msg):
+    msg = msg.lower()
+    for intent, labels in catalogue.items():
+        for label in labels:
+            if label.lower() in msg:
+                return intent
+    return None
+
+
+def main(rounds: int = 20):
+    catalogue = load_catalogue()
+    start = time.perf_counter()
+    matcher = IntentMatcher(catalogue)
+    build = time.perf_counter() - start
+
+    rng = random.Random(0)
+    labels = [label for phrases in catalogue.values() for label in phrases]
+    messages = [f"Bonjour, j'ai besoin de {rng.choice(labels).lower()} demain svp" for _ in range(500)]
+    messages += ["bonjour", "oui", "je ne sais pas trop", "14h30"] * 125
+    # Unique strings, so the matcher's per-message memo never hits
+    messages = [f"{m} #{i}" for i, m in enumerate(messages)]
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for msg in messages:
+            legacy_match(catalogue, msg)
+    legacy = (time.perf_counter() - start) / (rounds * len(messages)) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for msg in messages:
+            matcher._scan_uncached(msg)
+    indexed = (time.perf_counter() - start) / (rounds * len(messages)) * 1e6
+
+    print(f"{len(catalogue)} categories, {len(matcher.vocabulary)} tokens, built in {build * 1e3:.1f} ms")
+    print(f"  linear scan   {legacy:6.1f} µs/message")
+    print(f"  intent index  {indexed:6.1f} µs/message ({legacy / indexed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
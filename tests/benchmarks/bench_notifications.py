@@ -0,0 +1,64 @@
+"""New job alert fan-out to 1,000 providers
+
+Compares rendering the alert per recipient with the previous f-string
+formatter (emoji lookup, ``.title()`` and the whole message every time)
+against the compiled templates, where the job is bound once and each
+recipient only formats its distance.
+
+Run with::
+
+    python -m tests.benchmarks.bench_notifications [rounds]
+"""
+import random
+import sys
+import time
+
+from openclaw.skills.qemplois.job_notifications import JobNotifier, JobRequest
+
+PROVIDERS = 1000
+
+
+def legacy_alert(notifier, job, distance_km):
+    emoji = notifier._get_emoji(job.service_type)
+    message = f"""🔔 NOUVELLE DEMANDE!
+
+{emoji} Service: {job.service_type.title()}
+📅 Date: {job.date}
+🕐 Heure: {job.time}
+📍 Lieu: {job.location} ({distance_km:.1f} km)
+👤 Client: {job.client_name}
+💰 Prix estimé: {job.price_estimate:.0f} $
+"""
+    if job.notes:
+        message += f"\n📝 Notes: {job.notes}\n"
+    message += "\nAccepter? 👍 / Refuser? 👎"
+    return message
+
+
+def timed(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e3
+
+
+def main(rounds: int = 50):
+    notifier = JobNotifier()
+    job = JobRequest("QEP-2026-001", "électricité", "20 février", "14h", "123 Rue Sainte-Catherine",
+                     0.0, "Client", 90.0, notes="Panneau au sous-sol")
+    rng = random.Random(0)
+    recipients = [{"id": f"p{i}", "distance_km": rng.uniform(0.5, 25)} for i in range(PROVIDERS)]
+
+    assert notifier.format_new_job_alerts(job, recipients)[0] == legacy_alert(
+        notifier, job, recipients[0]["distance_km"])
+
+    legacy = timed(lambda: [legacy_alert(notifier, job, r["distance_km"]) for r in recipients], rounds)
+    print(f"{PROVIDERS} recipients")
+    print(f"  f-string per recipient  {legacy:6.2f} ms")
+    for platform in ("whatsapp", "telegram"):
+        bound = timed(lambda: notifier.format_new_job_alerts(job, recipients, platform), rounds)
+        print(f"  templates ({platform:8}) {bound:6.2f} ms ({legacy / bound:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
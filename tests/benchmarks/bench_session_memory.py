@@ -0,0 +1,89 @@
+"""Memory per parked session: legacy dict-heavy layout vs slots records
+
+Run with::
+
+    python -m tests.benchmarks.bench_session_memory [sessions]
+"""
+import gc
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from openclaw.skills.qemplois.booking_flow import BookingData, BookingState, ProviderRecord
+
+
+@dataclass
+class LegacyBookingData:
+    """BookingData as it was: regular dataclass, raw provider dicts"""
+    user_id: str
+    platform: str
+    state: BookingState = BookingState.IDLE
+    service_type: Optional[str] = None
+    date: Optional[datetime] = None
+    time: Optional[tuple] = None
+    location: Optional[Dict] = None
+    selected_provider: Optional[Dict] = None
+    providers: List[Dict] = field(default_factory=list)
+    booking_id: Optional[str] = None
+    price_estimate: Optional[float] = None
+
+
+def api_provider(i: int) -> Dict:
+    """A provider as the API returns it, fields we never display included"""
+    return {
+        "id": f"prov_{i:06d}",
+        "name": f"Prestataire {i}",
+        "price_per_hour": 40 + i % 20,
+        "rating": 4.5,
+        "reviews": i % 300,
+        "distance_km": round(i % 50 / 3, 1),
+        "lat": 45.5 + i * 1e-5,
+        "lng": -73.6 - i * 1e-5,
+        "phone": f"514-555-{i % 10000:04d}",
+        "email": f"pro{i}@example.com",
+        "bio": "Professionnel certifié, 10 ans d'expérience au Québec.",
+        "photoUrl": f"https://cdn.qemplois.ca/pros/{i}.jpg",
+        "serviceAreas": ["Montréal", "Laval", "Longueuil"],
+        "createdAt": "2026-01-15T12:00:00Z",
+        "updatedAt": "2026-03-01T08:30:00Z",
+    }
+
+
+def make_session(cls, i: int, record):
+    # Each session parses its own API response, as the flow does
+    providers = [record(api_provider(i * 3 + j)) for j in range(3)]
+    return cls(
+        user_id=str(100000 + i),
+        platform="telegram",
+        state=BookingState.SHOW_PROVIDERS,
+        service_type="plomberie",
+        date=datetime(2026, 3, 2),
+        time=(14, 0),
+        location={"address": "123 rue Sherbrooke Est", "lat": 45.52, "lng": -73.58,
+                  "display": "Rue Sherbrooke Est, Montréal"},
+        providers=providers,
+    )
+
+
+def measure(cls, record, n: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    sessions = [make_session(cls, i, record) for i in range(n)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sessions
+    return current / n
+
+
+def main(n: int = 20_000):
+    legacy = measure(LegacyBookingData, dict, n)
+    slots = measure(BookingData, ProviderRecord.from_dict, n)
+    print(f"{n} sessions with 3 providers each")
+    print(f"  legacy dataclass + dicts : {legacy:8.0f} B/session")
+    print(f"  slots records            : {slots:8.0f} B/session ({slots / legacy:.0%})")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
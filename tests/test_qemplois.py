@@ -1,14 +1,333 @@
 """Tests for Q-Emplois bot skills"""
 
+import asyncio
+import csv
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import time
 import pytest
 from datetime import datetime
 from openclaw.skills.qemplois.utils import (
-    parse_date, parse_time, format_price, format_distance,
+    parse_date, parse_dates, parse_time, parse_times, format_price, format_distance,
     format_datetime_fr, generate_booking_id, validate_address
 )
-from openclaw.skills.qemplois.booking_flow import BookingFlow, BookingState
-from openclaw.skills.qemplois.auth_handler import AuthHandler
+from openclaw.skills.qemplois.booking_flow import BookingData, BookingFlow, BookingState, ProviderRecord
+from openclaw.skills.qemplois import auth_handler as auth_module
+from openclaw.skills.qemplois.auth_handler import LINK_ERRORS, AuthHandler
 from openclaw.skills.qemplois.job_notifications import JobNotifier, JobRequest
+from openclaw.skills.qemplois.templates import Raw, Template
+from openclaw.skills.qemplois.bot_handler import THROTTLED_MESSAGE, QEmploisBot, TelegramHandler, WhatsAppHandler
+from openclaw.skills.qemplois.aio import LoopLocal, run_sync
+from openclaw.skills.qemplois.http_client import HttpClient, HttpClientConfig
+from openclaw.skills.qemplois.cache import TTLCache
+from openclaw.skills.qemplois.outbox import Outbox
+from openclaw.skills.qemplois.dispatcher import ConversationDispatcher
+from openclaw.skills.qemplois.idempotency import IdempotencyCache
+from openclaw.skills.qemplois.fanout import FanOutDispatcher, StubSender
+from openclaw.skills.qemplois.catalog import DEFAULT_CATALOG_PATH, CatalogStore
+from openclaw.skills.qemplois.geocache import GeocodeCache
+from openclaw.skills.qemplois.local_geocoder import LocalGeocoder, build_index, build_index_from_csv
+from openclaw.skills.qemplois.geocode_scheduler import GeocodeScheduler
+from openclaw.skills.qemplois.ratelimit import INBOUND_LIMIT_LUA, InboundLimiter, TokenBucket
+from openclaw.skills.qemplois.provider_index import ProviderIndex, haversine_km
+from openclaw.skills.qemplois.intents import IntentMatcher, within_one_edit
+from openclaw.skills.qemplois.provider_cache import ProviderSearchCache, search_key
+from openclaw.skills.qemplois.session_store import MemorySessionStore, RedisSessionStore, SessionStore
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the redis-py commands the bot uses"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.calls = []
+        self.subscribers = []
+
+    def get(self, key):
+        self.calls.append("get")
+        return self.data.get(key)
+
+    def getex(self, key, ex=None):
+        self.calls.append("getex")
+        if ex is not None and key in self.data:
+            self.ttls[key] = ex
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        self.calls.append("set")
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        self.ttls[key] = ex
+        return True
+
+    def setex(self, key, ttl, value):
+        self.calls.append("setex")
+        self.data[key] = value
+        self.ttls[key] = ttl
+        return True
+
+    def expire(self, key, ttl):
+        self.calls.append("expire")
+        if key in self.data:
+            self.ttls[key] = ttl
+            return True
+        return False
+
+    def delete(self, *keys):
+        self.calls.append("delete")
+        removed = 0
+        for key in keys:
+            removed += self.data.pop(key, None) is not None
+            self.ttls.pop(key, None)
+        return removed
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, source):
+        return FakeScript(self, source)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+    def _publish(self, channel, message):
+        for pubsub in self.subscribers:
+            if channel in pubsub.channels:
+                pubsub.queue.put({"type": "message", "channel": channel, "data": message})
+
+
+class FakePubSub:
+    def __init__(self, backend):
+        import queue
+        self.queue = queue.Queue()
+        self.channels = set()
+        backend.subscribers.append(self)
+
+    def subscribe(self, channel):
+        self.channels.add(channel)
+
+    def listen(self):
+        while True:
+            yield self.queue.get()
+
+
+class FakePipeline:
+    """Buffers commands and runs them as one recorded round trip"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.commands = []
+
+    def __getattr__(self, name):
+        def buffer(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return buffer
+
+    def execute(self):
+        calls = list(self.backend.calls)
+        results = [getattr(self.backend, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+        self.backend.calls = calls + ["pipeline"]
+        return results
+
+
+def _merge_session(raw, updates):
+    return json.dumps({**json.loads(raw), **json.loads(updates)})
+
+
+def _fake_merge_session(r, keys, args):
+    if keys[0] not in r.data:
+        return 0
+    r.data[keys[0]] = _merge_session(r.data[keys[0]], args[0])
+    r.ttls[keys[0]] = int(args[1])
+    return 1
+
+
+def _fake_link(r, keys, args):
+    raw = r.data.get(keys[0])
+    if raw is None:
+        return ["invalid"]
+    session = json.loads(raw)
+    if args[5] and session["platform"] != args[5]:
+        return ["platform"]
+    if session["status"] == "linked":
+        return ["linked"]
+    _fake_merge_session(r, keys[:1], [args[0], args[1]])
+    r.data[keys[1]] = json.dumps({"token": args[3], "user_id": session["user_id"], "linked_at": args[4]})
+    r.ttls[keys[1]] = int(args[2])
+    r._publish(args[6], keys[1])
+    return ["ok", raw]
+
+
+def _fake_unlink(r, keys, args):
+    raw = r.data.get(keys[0])
+    if raw is None:
+        return 0
+    token = json.loads(raw).get("token")
+    if (token if isinstance(token, str) else "") != args[0]:
+        return -1
+    if len(keys) > 1:
+        _fake_merge_session(r, keys[1:], [args[1], args[2]])
+    r._publish(args[3], keys[0])
+    r.data.pop(keys[0])
+    return 1
+
+
+def _fake_delete_session(r, keys, args):
+    raw = r.data.get(keys[0])
+    if raw is None:
+        return 0
+    session = json.loads(raw)
+    if f"{args[0]}{session['platform']}:{session['user_id']}" != keys[1]:
+        return -1
+    r.data.pop(keys[1], None)
+    r.data.pop(keys[0])
+    return 1
+
+
+def _fake_inbound_limit(r, keys, args):
+    now = float(args[0])
+    levels = []
+    for key, rate, burst in ((keys[0], args[1], args[2]), (keys[1], args[3], args[4])):
+        tokens, ts = json.loads(r.data.get(key, "null")) or (float(burst), now)
+        levels.append(min(float(burst), tokens + max(0.0, now - ts) * float(rate)))
+    if levels[0] < 1:
+        return "user"
+    if levels[1] < 1:
+        return "global"
+    for key, level in zip(keys, levels):
+        r.data[key] = json.dumps([level - 1, now])
+    return "ok"
+
+
+# Python equivalents of the auth and rate limit Lua scripts
+FAKE_SCRIPTS = {
+    auth_module.MERGE_SESSION_LUA: _fake_merge_session,
+    auth_module.LINK_LUA: _fake_link,
+    auth_module.UNLINK_LUA: _fake_unlink,
+    auth_module.DELETE_SESSION_LUA: _fake_delete_session,
+    INBOUND_LIMIT_LUA: _fake_inbound_limit,
+}
+
+
+class FakeScript:
+    def __init__(self, backend, source):
+        self.backend = backend
+        self.impl = FAKE_SCRIPTS[source]
+
+    def __call__(self, keys=(), args=()):
+        self.backend.calls.append("evalsha")
+        return self.impl(self.backend, list(keys), [str(a) for a in args])
+
+
+class FakeAsyncRedis:
+    """Async facade over a FakeRedis so sync and async paths share state"""
+
+    def __init__(self, backend: FakeRedis):
+        self.backend = backend
+
+    def register_script(self, source):
+        script = self.backend.register_script(source)
+
+        async def call(keys=(), args=()):
+            return script(keys=keys, args=args)
+
+        return call
+
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+class FakeResponse:
+    def __init__(self, payload, status=200, headers=None):
+        self.payload = payload
+        self.status_code = status
+        self.headers = headers or {}
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeHttp:
+    """Records calls per endpoint and replays canned JSON (or raises)"""
+
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+        self.calls = []
+
+    def _respond(self, endpoint, url, kwargs):
+        self.calls.append((endpoint, url, kwargs))
+        response = self.responses.get(endpoint, {})
+        if isinstance(response, Exception):
+            raise response
+        if callable(response):
+            response = response(url, kwargs)
+        return FakeResponse(response)
+
+    def get(self, endpoint, url, **kwargs):
+        return self._respond(endpoint, url, kwargs)
+
+    post = get
+
+    async def aget(self, endpoint, url, **kwargs):
+        return self._respond(endpoint, url, kwargs)
+
+    apost = aget
+
+    def count(self, endpoint):
+        return sum(1 for call in self.calls if call[0] == endpoint)
+
+
+NOMINATIM_HIT = [{"lat": "45.5236", "lon": "-73.5817", "display_name": "Rue Sherbrooke, Montréal"}]
+
+
+def make_flow(**kwargs):
+    """BookingFlow with an unthrottled geocode scheduler"""
+    kwargs.setdefault("geocode_scheduler", GeocodeScheduler(rate=1000, burst=1000))
+    return BookingFlow(**kwargs)
+
+
+def make_auth(secret_key="test-secret"):
+    auth = AuthHandler(secret_key=secret_key)
+    auth.redis = FakeRedis()
+    auth._aredis = LoopLocal(lambda: FakeAsyncRedis(auth.redis))
+    auth._fire_webhook = lambda event, payload: None
+
+    async def no_webhook(event, payload):
+        return None
+
+    auth._fire_webhook_async = no_webhook
+    return auth
+
+
+def link_user(auth, platform, platform_user_id, user_id="u_1"):
+    auth.redis.setex(
+        f"auth:link:{platform}:{platform_user_id}",
+        auth.link_ttl,
+        json.dumps({"token": "t", "user_id": user_id, "linked_at": "2026-01-01"}),
+    )
+
+
+MOCK_PROVIDERS = [
+    {"id": "p1", "name": "Jean Tremblay", "rating": 4.8, "reviews": 12, "price_per_hour": 45, "distance_km": 2.1},
+    {"id": "p2", "name": "Marie Gagnon", "rating": 4.9, "reviews": 8, "price_per_hour": 50, "distance_km": 3.2},
+]
 
 class TestUtils:
     """Test utility functions"""
@@ -122,5 +441,1648 @@ class TestJobNotifier:
         assert "plomberie" in msg.lower()
         assert "90" in msg
 
+class TestAsyncPipeline:
+    """Test the async message pipeline and its sync wrappers"""
+
+    def setup_method(self):
+        self.flow = BookingFlow()
+        self.auth = make_auth()
+
+        async def geocode(address):
+            await asyncio.sleep(0.05)
+            return {"lat": 45.52, "lng": -73.58, "display": address, "found": True}
+
+        async def fetch(session, updated_since=None):
+            await asyncio.sleep(0.05)
+            return list(MOCK_PROVIDERS)
+
+        self.flow._geocode_async = geocode
+        self.flow._fetch_providers_api_async = fetch
+
+    def _advance_to_location(self, user_id):
+        for text in ("/start", "1", "demain", "14h"):
+            self.flow.handle_message(user_id, "telegram", text)
+
+    def test_async_flow_reaches_provider_list(self):
+        self._advance_to_location("u1")
+        reply = asyncio.run(self.flow.handle_message_async(
+            "u1", "telegram", "123 Rue Sherbrooke, Montréal"))
+        assert "Jean Tremblay" in reply
+        assert self.flow.sessions["telegram:u1"].state == BookingState.SHOW_PROVIDERS
+
+    def test_slow_geocode_does_not_stall_other_chats(self):
+        users = [f"u{i}" for i in range(50)]
+        for user_id in users:
+            self._advance_to_location(user_id)
+
+        async def burst():
+            return await asyncio.gather(*(
+                self.flow.handle_message_async(u, "telegram", "123 Rue Sherbrooke, Montréal")
+                for u in users
+            ))
+
+        start = time.perf_counter()
+        replies = asyncio.run(burst())
+        assert all("Jean Tremblay" in r for r in replies)
+        # 50 × (geocode + search) serially would take 5 s
+        assert time.perf_counter() - start < 1.0
+
+    def test_sync_handler_wraps_async_pipeline(self):
+        link_user(self.auth, "telegram", "42")
+        handler = TelegramHandler(self.flow, self.auth)
+        reply = handler.handle_message({"from": {"id": 42}, "text": "/start"})
+        assert "Quel service" in reply["text"]
+        assert reply["chat_id"] == "42"
+
+    def test_unlinked_user_gets_auth_prompt(self):
+        handler = WhatsAppHandler(self.flow, self.auth)
+        reply = run_sync(handler.handle_message_async({"from": "15145550000", "text": {"body": "salut"}}))
+        assert "liez votre compte" in reply["text"]
+
+
+class TestHttpClient:
+    """Test the pooled HTTP client layer"""
+
+    def setup_method(self):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                body = b'{"providers": []}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/providers"
+
+    def teardown_method(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        http = HttpClient(HttpClientConfig())
+        for _ in range(5):
+            assert http.get("providers", self.url).json() == {"providers": []}
+        stats = http.stats()["127.0.0.1"]
+        assert stats["requests"] == 5
+        assert stats["connections"] == 1
+        assert stats["pool_hits"] == 4
+
+    def test_endpoint_timeouts(self):
+        config = HttpClientConfig()
+        assert config.timeout_for("geocode") == 6
+        assert config.timeout_for("bookings") == 10
+        assert config.timeout_for("unknown") == config.default_timeout
+
+    def test_booking_flow_uses_shared_client(self):
+        http = HttpClient(HttpClientConfig())
+        flow = BookingFlow(api_base=self.url.rsplit("/", 1)[0], http=http)
+        session = flow.get_or_create_session("u1", "telegram")
+        session.service_type = "plomberie"
+        flow._fetch_providers_api(session)
+        flow._fetch_providers_api(session)
+        assert http.stats()["127.0.0.1"]["pool_hits"] == 1
+
+    def test_async_client_shares_limits_and_metrics(self):
+        import httpx
+        http = HttpClient(HttpClientConfig(host_pool_sizes={"nominatim.openstreetmap.org": 2}))
+
+        async def main():
+            for _ in range(3):
+                assert (await http.aget("providers", self.url)).json() == {"providers": []}
+            client = http._async.get()
+            nominatim = client._transport_for_url(httpx.URL("https://nominatim.openstreetmap.org/search"))
+            assert nominatim is not client._transport_for_url(httpx.URL(self.url))
+            await client.aclose()
+            return nominatim._pool._max_connections
+
+        assert asyncio.run(main()) == 2
+        stats = http.stats()["127.0.0.1"]
+        assert stats["async_requests"] == 3 and stats["connections"] == 1
+        assert stats["pool_hits"] == 2
+
+
+class TestGeocodeCache:
+    """Test the two-tier geocode cache"""
+
+    def test_ttl_cache_expiry_and_lru(self):
+        now = [0.0]
+        cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert "b" not in cache and cache.get("a") == 1
+        now[0] = 11
+        assert cache.get("a") is None
+
+    def test_repeat_address_geocoded_once(self):
+        http = FakeHttp({"geocode": NOMINATIM_HIT})
+        flow = make_flow(http=http)
+        first = flow._geocode("123 Rue Sherbrooke, Montréal")
+        again = flow._geocode("123 rue sherbrooke montreal")
+        assert first["found"] and again["lat"] == first["lat"]
+        assert http.count("geocode") == 1
+        assert flow.geocode_cache.stats()["local_hits"] == 1
+
+    def test_misses_are_negatively_cached(self):
+        http = FakeHttp({"geocode": []})
+        flow = make_flow(http=http)
+        flow._geocode("999 Rue Inconnue, Nulle-Part")
+        result = flow._geocode("999 rue inconnue nulle part")
+        assert result["found"] is False
+        assert result["display"] == "999 rue inconnue nulle part"
+        assert http.count("geocode") == 1
+        assert flow.geocode_cache.stats()["negative_hits"] == 1
+
+    def test_transport_errors_are_not_cached(self):
+        http = FakeHttp({"geocode": ConnectionError("down")})
+        flow = make_flow(http=http)
+        flow._geocode("123 Rue Sherbrooke, Montréal")
+        flow._geocode("123 Rue Sherbrooke, Montréal")
+        assert http.count("geocode") == 2
+
+    def test_redis_tier_shared_between_workers(self):
+        redis = FakeRedis()
+        worker_a = make_flow(http=FakeHttp({"geocode": NOMINATIM_HIT}),
+                               geocode_cache=GeocodeCache(redis_client=redis))
+        http_b = FakeHttp({"geocode": NOMINATIM_HIT})
+        worker_b = make_flow(http=http_b, geocode_cache=GeocodeCache(
+            redis_client=redis, async_redis=lambda: FakeAsyncRedis(redis)))
+        worker_a._geocode("123 Rue Sherbrooke, Montréal")
+        result = asyncio.run(worker_b._geocode_async("123 Rue Sherbrooke, Montréal"))
+        assert result["found"]
+        assert http_b.count("geocode") == 0
+        assert worker_b.geocode_cache.stats()["redis_hits"] == 1
+
+
+class TestLocalGeocoder:
+    """Test the offline mmapped geocoder against the bundled fixture"""
+
+    def setup_method(self, method):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.index = os.path.join(self.tmpdir, "quebec.idx")
+        self.sizes = build_index_from_csv(os.path.join(FIXTURES, "quebec_addresses.csv"), self.index)
+        self.geocoder = LocalGeocoder(self.index)
+
+    def teardown_method(self, method):
+        import shutil
+        self.geocoder.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_index_sections(self):
+        assert self.sizes["postal_codes"] == 15
+        assert self.sizes["fsas"] < self.sizes["postal_codes"]
+
+    def test_street_match_ignores_civic_number_and_accents(self):
+        result = self.geocoder.geocode("1234 rue Sherbrooke Est, Montreal, QC")
+        assert result["precision"] == "street"
+        assert result["lat"] == pytest.approx(45.5137, abs=1e-4)
+
+    def test_street_alias_without_type(self):
+        result = self.geocoder.geocode("55 Saint-Jean, Québec")
+        assert result["lng"] == pytest.approx(-71.2140, abs=1e-4)
+
+    def test_postal_code_and_fsa_fallback(self):
+        assert self.geocoder.geocode("9 rue Inconnue, H2X 2V1")["precision"] == "postal_code"
+        fsa = self.geocoder.geocode("9 rue Inconnue, H2X 9Z9")
+        assert fsa["precision"] == "fsa"
+        assert 45.51 < fsa["lat"] < 45.52
+
+    def test_unknown_address(self):
+        assert self.geocoder.geocode("12 rue Imaginaire, Atlantide") is None
+
+    def test_street_in_several_cities_needs_the_city(self):
+        index = os.path.join(self.tmpdir, "ambiguous.idx")
+        build_index([
+            {"postal_code": "J2G 6T6", "street": "Rue Principale", "city": "Granby",
+             "lat": "45.4010", "lng": "-72.7320"},
+            {"postal_code": "J2K 1J9", "street": "Rue Principale", "city": "Cowansville",
+             "lat": "45.2010", "lng": "-72.7460"},
+        ], index)
+        geocoder = LocalGeocoder(index)
+        try:
+            assert geocoder.geocode("100 rue Principale") is None
+            assert geocoder.geocode("100 rue Principale, Cowansville")["lat"] == pytest.approx(45.201)
+            assert geocoder.geocode("100 rue Principale, J2G 6T6")["precision"] == "postal_code"
+            assert geocoder.geocode("100 rue Principale, Gran")["lat"] == pytest.approx(45.401)
+
+            http = FakeHttp({"geocode": NOMINATIM_HIT})
+            flow = make_flow(http=http, local_geocoder=geocoder, geocoder_mode="hybrid")
+            assert flow._geocode("100 rue Principale")["found"]
+            assert http.count("geocode") == 1
+        finally:
+            geocoder.close()
+
+    def test_booking_flow_local_mode_skips_network(self):
+        http = FakeHttp({"geocode": NOMINATIM_HIT})
+        flow = make_flow(http=http, local_geocoder=self.geocoder, geocoder_mode="local")
+        assert flow._geocode("100 rue Principale, Granby")["found"]
+        assert flow._geocode("12 rue Imaginaire, Atlantide")["found"] is False
+        assert http.count("geocode") == 0
+
+    def test_booking_flow_hybrid_mode_falls_back(self):
+        http = FakeHttp({"geocode": NOMINATIM_HIT})
+        flow = make_flow(http=http, local_geocoder=self.geocoder, geocoder_mode="hybrid")
+        assert flow._geocode("12 rue Imaginaire, Atlantide")["found"]
+        assert http.count("geocode") == 1
+
+
+class TestGeocodeScheduler:
+    """Test the Nominatim rate limiter and request coalescing"""
+
+    def test_token_bucket_reservations_queue_up(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=1, capacity=1, clock=lambda: now[0])
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == pytest.approx(1)
+        assert bucket.reserve(max_wait=1.5) is None
+        now[0] = 5
+        assert bucket.try_acquire()
+
+    def test_identical_concurrent_queries_coalesce(self):
+        from concurrent.futures import ThreadPoolExecutor
+        scheduler = GeocodeScheduler(rate=100, burst=1)
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"lat": 1}
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: scheduler.run("plateau", fetch), range(8)))
+        assert len(calls) == 1
+        assert all(r == {"lat": 1} for r in results)
+        assert scheduler.stats()["coalesced"] == 7
+
+    def test_async_queries_coalesce(self):
+        scheduler = GeocodeScheduler(rate=100, burst=1)
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        async def burst():
+            return await asyncio.gather(*(scheduler.run_async("plateau", fetch) for _ in range(5)))
+
+        assert asyncio.run(burst()) == ["ok"] * 5
+        assert len(calls) == 1
+
+    def test_rate_limit_spaces_distinct_queries(self):
+        scheduler = GeocodeScheduler(rate=20, burst=1)
+        start = time.perf_counter()
+        for i in range(4):
+            scheduler.run(f"addr{i}", lambda: i)
+        assert time.perf_counter() - start >= 0.14
+
+    def test_sheds_when_wait_exceeds_sla(self):
+        http = FakeHttp({"geocode": NOMINATIM_HIT})
+        flow = make_flow(http=http, geocode_scheduler=GeocodeScheduler(rate=1, burst=1, max_wait=0.1))
+        assert flow._geocode("123 Rue Sherbrooke, Montréal")["found"]
+        shed = flow._geocode("456 Rue Saint-Denis, Montréal")
+        assert shed["found"] is False
+        assert http.count("geocode") == 1
+        assert flow.geocode_scheduler.stats()["shed"] == 1
+        # Shed answers are not cached
+        assert flow.geocode_cache.get("456 Rue Saint-Denis, Montréal") is None
+
+
+class TestProviderIndex:
+    """Test the spatial provider index and its wiring into the flow"""
+
+    PROVIDERS = [
+        {"id": "near", "name": "Près Plateau", "price_per_hour": 45, "lat": 45.5250, "lng": -73.5800},
+        {"id": "mid", "name": "Moyen Rosemont", "price_per_hour": 40, "lat": 45.5500, "lng": -73.5700},
+        {"id": "far", "name": "Loin Laval", "price_per_hour": 50, "lat": 45.6000, "lng": -73.7500},
+        {"id": "qc", "name": "Loin Québec", "price_per_hour": 55, "lat": 46.8120, "lng": -71.2140},
+    ]
+
+    def test_nearest_within_radius_sorted(self):
+        index = ProviderIndex()
+        index.upsert("plomberie", self.PROVIDERS)
+        hits = index.nearest("plomberie", 45.5236, -73.5817, k=3, radius_km=10)
+        assert [p["id"] for p in hits] == ["near", "mid"]
+        assert hits[0]["distance_km"] < hits[1]["distance_km"]
+        assert len(index.nearest("plomberie", 45.5236, -73.5817, k=2, radius_km=300)) == 2
+
+    def test_matches_brute_force(self):
+        import random
+        rng = random.Random(7)
+        providers = [{"id": str(i), "name": f"P{i}", "price_per_hour": 40,
+                      "lat": 45.3 + rng.random() * 0.6, "lng": -74.0 + rng.random() * 0.8}
+                     for i in range(2000)]
+        index = ProviderIndex()
+        index.upsert("nettoyage", providers)
+        hits = index.nearest("nettoyage", 45.5, -73.6, k=5, radius_km=8)
+        brute = sorted(providers, key=lambda p: haversine_km(45.5, -73.6, p["lat"], p["lng"]))[:5]
+        assert [p["id"] for p in hits] == [p["id"] for p in brute]
+
+    def test_incremental_refresh_removes_unavailable(self):
+        index = ProviderIndex()
+        index.upsert("plomberie", self.PROVIDERS)
+        index.upsert("plomberie", [{"id": "near", "available": False}])
+        hits = index.nearest("plomberie", 45.5236, -73.5817, k=3, radius_km=10)
+        assert [p["id"] for p in hits] == ["mid"]
+
+    def test_flow_ranks_by_distance_and_widens_radius(self):
+        http = FakeHttp({"providers": {"providers": self.PROVIDERS}})
+        flow = make_flow(http=http)
+        session = flow.get_or_create_session("u1", "telegram")
+        session.service_type = "plomberie"
+        session.time = (14, 0)
+        session.location = {"address": "x", "lat": 45.6, "lng": -73.75}
+        session.search_radius_km = 1
+
+        reply = flow._search_providers(session)
+        assert "Loin Laval" in reply and "Près Plateau" not in reply
+        assert "lat" not in http.calls[0][2]["params"]  # index covers every location
+
+        session.location = {"address": "x", "lat": 45.3, "lng": -73.2}
+        assert "plus loin" in flow._search_providers(session)
+        assert session.providers == []
+        reply = flow.handle_message("u1", "telegram", "plus loin")
+        assert session.search_radius_km == 2
+        for _ in range(7):
+            reply = flow.handle_message("u1", "telegram", "plus loin")
+        assert session.search_radius_km == flow.MAX_RADIUS_KM
+        assert "100 km" in reply
+        # Index was fresh: one API call for all of the above
+        assert http.count("providers") == 1
+
+    def test_users_far_apart_share_the_index(self):
+        def api(url, kwargs):  # honours a geo filter, as the backend does
+            params = kwargs["params"]
+            if "lat" not in params:
+                return {"providers": self.PROVIDERS}
+            return {"providers": [p for p in self.PROVIDERS if haversine_km(
+                params["lat"], params["lng"], p["lat"], p["lng"]) <= params["radiusKm"]]}
+
+        http = FakeHttp({"providers": api})
+        flow = make_flow(http=http)
+        montreal = flow.get_or_create_session("u1", "telegram")
+        quebec = flow.get_or_create_session("u2", "telegram")
+        for session, (lat, lng) in ((montreal, (45.5236, -73.5817)), (quebec, (46.8100, -71.2100))):
+            session.service_type = "plomberie"
+            session.date, session.time = datetime(2026, 3, 1), (14, 0)
+            session.location = {"address": "x", "lat": lat, "lng": lng}
+        assert "Près Plateau" in flow._search_providers(montreal)
+        assert "Loin Québec" in flow._search_providers(quebec)
+        assert [p.id for p in quebec.providers] == ["qc"]
+        assert http.count("providers") == 1
+
+    def test_search_cache_follows_the_date(self):
+        def api(url, kwargs):  # "near" is booked on March 2
+            booked = kwargs["params"].get("date") == "2026-03-02"
+            return {"providers": [p for p in self.PROVIDERS if not (booked and p["id"] == "near")]}
+
+        http = FakeHttp({"providers": api})
+        flow = make_flow(http=http)
+        session = flow.get_or_create_session("u1", "telegram")
+        session.service_type, session.time = "plomberie", (14, 0)
+        session.location = {"address": "x", "lat": 45.5236, "lng": -73.5817}
+        session.date = datetime(2026, 3, 1)
+        assert flow._find_providers(session)[0]["id"] == "near"
+        session.date = datetime(2026, 3, 2)
+        assert flow._find_providers(session)[0]["id"] == "mid"
+        session.date = datetime(2026, 3, 1)
+        assert flow._find_providers(session)[0]["id"] == "near"
+        assert http.count("providers") == 2
+
+    def test_past_dates_are_evicted(self):
+        from datetime import date, timedelta
+        index = ProviderIndex()
+        today = date.today()
+        yesterday, tomorrow = (today + timedelta(days=d) for d in (-1, 1))
+        index.upsert("plomberie", self.PROVIDERS, date=yesterday.isoformat())
+        index.upsert("plomberie", self.PROVIDERS, date=today.isoformat())
+        index.upsert("plomberie", self.PROVIDERS, date=tomorrow.isoformat())
+        assert set(index.stats()) == {f"plomberie:{today}", f"plomberie:{tomorrow}"}
+
+    def test_empty_incremental_refresh_keeps_index_fresh(self):
+        answers = [{"providers": self.PROVIDERS}, {"providers": []}]
+        http = FakeHttp({"providers": lambda url, kwargs: answers.pop(0) if answers else {}})
+        flow = make_flow(http=http)
+        flow.provider_index.refresh_interval = 0
+        session = flow.get_or_create_session("u1", "telegram")
+        session.service_type = "plomberie"
+        session.location = {"address": "x", "lat": 45.5236, "lng": -73.5817}
+        flow._load_providers(session)
+        flow.provider_index.refresh_interval = 60
+        flow.provider_index.mark_stale("plomberie")
+        assert flow._load_providers(session)[0]["id"] == "near"  # nothing changed
+        assert not flow.provider_index.is_stale("plomberie")
+        assert "updatedSince" in http.calls[-1][2]["params"]
+
+        http.responses["providers"] = RuntimeError("down")
+        flow.provider_index.mark_stale("plomberie")
+        assert flow._load_providers(session)[0]["id"] == "near"
+        assert flow.provider_index.is_stale("plomberie")  # failures retry next time
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
+
+
+class TestProviderSearchCache:
+    """Test provider search caching with stale-while-revalidate"""
+
+    class Clock:
+        def __init__(self):
+            self.now = 0.0
+
+        def __call__(self):
+            return self.now
+
+    def test_fresh_then_stale_served_while_refreshing(self):
+        clock = self.Clock()
+        cache = ProviderSearchCache(ttl=60, max_stale=300, clock=clock)
+        key = search_key("plomberie", 45.52, -73.58, "2026-03-01", 25)
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return [{"id": f"v{len(loads)}"}]
+
+        assert cache.get_or_load(key, loader) == [{"id": "v1"}]
+        assert cache.get_or_load(key, loader) == [{"id": "v1"}]
+        clock.now = 120
+        # Stale: old answer immediately, refresh in the background
+        assert cache.get_or_load(key, loader) == [{"id": "v1"}]
+        cache._executor.shutdown(wait=True)
+        assert cache.get_or_load(key, loader) == [{"id": "v2"}]
+        assert cache.stats()["stale_hits"] == 1 and cache.stats()["refreshes"] == 1
+
+    def test_nearby_users_share_entry(self):
+        assert (search_key("plomberie", 45.5236, -73.5817, None, 25)
+                == search_key("plomberie", 45.5241, -73.5809, None, 25))
+        assert (search_key("plomberie", 45.5236, -73.5817, None, 25)
+                != search_key("plomberie", 45.5236, -73.5817, "2026-03-01", 25))
+
+    def test_refresh_after_invalidation_is_discarded(self):
+        cache = ProviderSearchCache()
+        key = search_key("plomberie", 45.52, -73.58, None, 25)
+
+        async def scenario():
+            async def slow_loader():
+                cache.invalidate("plomberie")
+                return [{"id": "stale"}]
+            return await cache.get_or_load_async(key, slow_loader)
+
+        assert asyncio.run(scenario()) == [{"id": "stale"}]
+        assert cache.stats()["size"] == 0
+
+    def test_booking_webhook_invalidates_searches(self):
+        http = FakeHttp({"providers": {"providers": TestProviderIndex.PROVIDERS}})
+        bot = QEmploisBot.__new__(QEmploisBot)
+        bot.booking_flow = make_flow(http=http)
+        bot.job_notifier = JobNotifier()
+        bot.outbox = Outbox()
+        bot.dedup = IdempotencyCache()
+        session = bot.booking_flow.get_or_create_session("u1", "telegram")
+        session.service_type = "plomberie"
+        session.time = (14, 0)
+        session.location = {"address": "x", "lat": 45.5236, "lng": -73.5817}
+
+        first = bot.booking_flow._find_providers(session)
+        session.location = {"address": "y", "lat": 45.5241, "lng": -73.5809}
+        second = bot.booking_flow._find_providers(session)
+        assert [p["id"] for p in first] == [p["id"] for p in second]
+        assert second[0]["distance_km"] == round(haversine_km(45.5241, -73.5809, 45.5250, -73.5800), 1)
+        assert http.count("providers") == 1
+
+        bot.handle_webhook("telegram", {
+            "event": "booking.confirmed",
+            "booking": {"service_type": "plomberie", "booking_id": "B1", "client_id": "u2",
+                        "provider_name": "Près Plateau", "provider_phone": "514-555-0100",
+                        "date": "1 mars", "time": "14h00"},
+        })
+        bot.booking_flow._find_providers(session)
+        assert http.count("providers") == 2
+        assert "updatedSince" in http.calls[-1][2]["params"]
+
+
+class TestSessionStore:
+    """Test pluggable conversation session stores"""
+
+    def make_redis_flow(self):
+        backend = FakeRedis()
+        store = RedisSessionStore(redis_client=backend,
+                                  async_redis=lambda: FakeAsyncRedis(backend))
+        return make_flow(session_store=store), backend
+
+    def test_incomplete_store_fails_at_creation(self):
+        class NoDelete(SessionStore):
+            def load(self, key):
+                return None
+
+            def save(self, key, session):
+                pass
+
+        with pytest.raises(TypeError):
+            NoDelete()
+
+    def test_memory_store_is_bounded(self):
+        flow = make_flow(session_store=MemorySessionStore(maxsize=2))
+        for user in ("u1", "u2", "u3"):
+            flow.handle_message(user, "telegram", "bonjour")
+        assert len(flow.sessions) == 2
+        with pytest.raises(KeyError):
+            flow.sessions["telegram:u1"]
+
+    def test_redis_round_trip_survives_new_flow(self):
+        flow, backend = self.make_redis_flow()
+        flow.handle_message("u1", "telegram", "bonjour")
+        flow.handle_message("u1", "telegram", "1")
+        flow.handle_message("u1", "telegram", "demain")
+        raw = backend.data["session:telegram:u1"]
+        assert b'", "' not in raw and b"null" not in raw
+
+        # Another worker picks the conversation up where it was left
+        other = BookingFlow(session_store=RedisSessionStore(redis_client=backend),
+                            geocode_scheduler=GeocodeScheduler(rate=1000, burst=1000))
+        session = other.get_or_create_session("u1", "telegram")
+        assert session.state == BookingState.ASK_TIME
+        assert session.service_type == "plomberie"
+        assert isinstance(session.date, datetime)
+
+    def test_one_round_trip_per_unchanged_message(self):
+        flow, backend = self.make_redis_flow()
+        flow.handle_message("u1", "telegram", "bonjour")
+        backend.calls.clear()
+        flow.handle_message("u1", "telegram", "/aide")
+        assert backend.calls == ["getex"]
+        flow.handle_message("u1", "telegram", "1")
+        assert backend.calls == ["getex", "getex", "setex"]
+        assert backend.ttls["session:telegram:u1"] == flow.sessions.ttl
+
+    def test_async_path_and_reset(self):
+        flow, backend = self.make_redis_flow()
+        reply = asyncio.run(flow.handle_message_async("u1", "whatsapp", "bonjour"))
+        assert reply == flow.get_welcome_message()
+        assert "session:whatsapp:u1" in backend.data
+        flow.reset_session("u1", "whatsapp")
+        assert "session:whatsapp:u1" not in backend.data
+
+
+class TestSessionReaper:
+    """Test idle-session eviction and memory accounting"""
+
+    class Clock:
+        def __init__(self):
+            self.now = 0.0
+
+        def __call__(self):
+            return self.now
+
+    def test_sweep_uses_latest_expiry(self):
+        clock = self.Clock()
+        cache = TTLCache(ttl=10, clock=clock)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=100)
+        cache.set("a", 1, ttl=100)  # re-armed: the old heap record is stale
+        clock.now = 50
+        assert cache.sweep() == 0 and len(cache) == 2
+        clock.now = 200
+        assert cache.sweep(limit=1) == 1
+        assert cache.sweep() == 1 and len(cache) == 0
+        assert cache.expirations == 2
+
+    def test_state_ttls_and_completed_cleanup(self):
+        clock = self.Clock()
+        flow = make_flow(session_store=MemorySessionStore(clock=clock))
+        browsing = flow.get_or_create_session("u1", "telegram")
+        browsing.state = BookingState.SHOW_PROVIDERS
+        flow.save_session(browsing)
+        flow.handle_message("u2", "telegram", "bonjour")
+
+        clock.now = 16 * 60
+        stats = flow.session_stats()
+        assert stats["live"] == 1 and stats["expired"] == 1
+        assert stats["bytes"] > 0
+
+        done = flow.get_or_create_session("u2", "telegram")
+        done.state = BookingState.COMPLETED
+        flow.save_session(done)
+        assert flow.session_stats()["live"] == 0
+
+    def test_redis_ttl_follows_state(self):
+        backend = FakeRedis()
+        flow = make_flow(session_store=RedisSessionStore(redis_client=backend))
+        session = flow.get_or_create_session("u1", "telegram")
+        session.state = BookingState.SHOW_PROVIDERS
+        flow.save_session(session)
+        assert backend.ttls["session:telegram:u1"] == 15 * 60
+
+        # Unchanged message: GETEX re-arms 24h, so the state TTL is re-applied
+        backend.calls.clear()
+        flow.handle_message("u1", "telegram", "/aide")
+        assert backend.calls == ["getex", "expire"]
+        assert backend.ttls["session:telegram:u1"] == 15 * 60
+
+        session = flow.get_or_create_session("u1", "telegram")
+        session.state = BookingState.COMPLETED
+        flow.save_session(session)
+        assert "session:telegram:u1" not in backend.data
+
+
+class TestCompactRecords:
+    """Test slots-based session and provider records"""
+
+    def test_provider_record_keeps_displayed_fields(self):
+        record = ProviderRecord.from_dict({**MOCK_PROVIDERS[0], "bio": "x" * 500, "lat": 45.5})
+        assert not hasattr(record, "__dict__")
+        assert set(record.to_dict()) == {"id", "name", "price_per_hour", "rating",
+                                         "reviews", "distance_km"}
+        assert not hasattr(BookingData("u1", "telegram"), "__dict__")
+
+    def test_shortlist_round_trips_through_redis(self):
+        backend = FakeRedis()
+        flow = make_flow(session_store=RedisSessionStore(redis_client=backend))
+        session = flow.get_or_create_session("u1", "telegram")
+        session.service_type = "plomberie"
+        session.date = datetime(2026, 3, 2)
+        session.time = (14, 0)
+        session.location = {"address": "123 rue Sherbrooke", "lat": 45.52, "lng": -73.58}
+        reply = flow._show_providers(session, [dict(p, photoUrl="https://x") for p in MOCK_PROVIDERS])
+        assert MOCK_PROVIDERS[0]["name"] in reply
+        flow.save_session(session)
+        assert b"photoUrl" not in backend.data["session:telegram:u1"]
+
+        reply = flow.handle_message("u1", "telegram", "1")
+        assert MOCK_PROVIDERS[0]["name"] in reply
+        restored = flow.get_or_create_session("u1", "telegram")
+        assert restored.selected_provider == ProviderRecord.from_dict(MOCK_PROVIDERS[0])
+        assert restored.price_estimate == MOCK_PROVIDERS[0]["price_per_hour"] * 2
+
+
+def load_phrases(name):
+    with open(os.path.join(FIXTURES, name), newline="", encoding="utf-8") as f:
+        return [(row["text"], row["expected"]) for row in csv.DictReader(f)]
+
+
+class TestDateParseEngine:
+    """Test the date/time engine against Quebec French phrasings"""
+
+    REFERENCE = datetime(2026, 3, 4, 10, 30)  # a Wednesday
+
+    @pytest.mark.parametrize("text,expected", load_phrases("date_phrases.csv"))
+    def test_date_corpus(self, text, expected):
+        result = parse_date(text, self.REFERENCE)
+        assert (result.date().isoformat() if result else "") == expected
+
+    @pytest.mark.parametrize("text,expected", load_phrases("time_phrases.csv"))
+    def test_time_corpus(self, text, expected):
+        result = parse_time(text)
+        assert (f"{result[0]:02d}:{result[1]:02d}" if result else "") == expected
+
+    def test_memoized_plan_resolves_per_reference(self):
+        from openclaw.skills.qemplois.dateparse import date_plan
+        date_plan.cache_clear()
+        assert parse_date("demain", datetime(2026, 3, 4)) == datetime(2026, 3, 5)
+        assert parse_date("demain", datetime(2026, 12, 31)) == datetime(2027, 1, 1)
+        assert date_plan.cache_info().hits == 1
+
+
+class TestBatchParsing:
+    """Test the vectorized parse_dates / parse_times APIs"""
+
+    REFERENCE = datetime(2026, 3, 4, 10, 30)
+
+    def test_parse_dates_matches_scalar(self):
+        np = pytest.importorskip("numpy")
+        phrases = [text for text, _ in load_phrases("date_phrases.csv")]
+        batch = parse_dates(iter(phrases * 3), self.REFERENCE)
+        assert batch.dates.dtype == np.dtype("datetime64[D]") and len(batch.dates) == len(phrases) * 3
+        for text, day, valid in zip(phrases * 3, batch.dates, batch.valid):
+            expected = parse_date(text, self.REFERENCE)
+            assert bool(valid) == (expected is not None)
+            if expected:
+                assert day == np.datetime64(expected.date())
+
+    def test_parse_times_int16_with_mask(self):
+        np = pytest.importorskip("numpy")
+        batch = parse_times(["14h30", "bof", None, "14h30", "midi"])
+        assert batch.times.dtype == np.int16 and batch.times.shape == (5, 2)
+        assert batch.valid.tolist() == [True, False, False, True, True]
+        assert batch.times[0].tolist() == [14, 30] and batch.times[1].tolist() == [-1, -1]
+
+
+class TestIntentMatcher:
+    """Test the precomputed intent matcher and its use in the flow"""
+
+    def test_folding_synonyms_and_longest_phrase(self):
+        matcher = IntentMatcher({
+            "clean": ["nettoyage"],
+            "windows": ["nettoyage de vitres"],
+            "yes": ["oui", "d'accord"],
+        })
+        assert matcher.matches("NETTOYAGE de vitres!") == ("windows",)
+        assert matcher.match("D’ACCORD 👍") == "yes"
+        assert matcher.match("rien à voir") is None
+
+    def test_typo_tolerance(self):
+        matcher = IntentMatcher({"plumbing": ["plomberie"], "yes": ["oui"]})
+        assert matcher.match("plombrie") == "plumbing"      # deletion
+        assert matcher.match("plomberiee") == "plumbing"    # insertion
+        assert matcher.match("plobmerie") == "plumbing"     # transposition
+        assert matcher.match("ouii") is None                # short words stay exact
+        assert within_one_edit("menage", "manage") and not within_one_edit("menage", "mirage")
+
+    def test_flow_uses_intents(self):
+        flow = make_flow()
+        reply = flow.handle_message("u1", "telegram", "Bonjour! J'ai une fuite sous l'évier")
+        assert "Plomberie" in reply
+        assert flow.sessions["telegram:u1"].state == BookingState.ASK_DATE
+
+        flow.handle_message("u2", "telegram", "/start")
+        assert "Électricité" in flow.handle_message("u2", "telegram", "electricien svp")
+        assert flow.intents.match("oui merci!", "confirm:") == "confirm:yes"
+        assert flow._provider_action("plus loin") == "widen"
+
+    def test_control_intents_need_the_whole_message(self):
+        flow = make_flow()
+        assert flow._provider_action("2") == "select"
+        assert flow._provider_action("une autre date") == "other_date"
+        assert flow._provider_action("plus large") == "widen"
+        for msg in ("j'ai pris congé", "le train arrive", "autre chose: le 2 est loin?",
+                    "on peut chercher plus loin?"):
+            assert flow._provider_action(msg) is None, msg
+
+    def test_sync_and_async_agree_at_show_providers(self):
+        replies = []
+        for run in (lambda f: f.handle_message("u1", "telegram", msg),
+                    lambda f: run_sync(f.handle_message_async("u1", "telegram", msg))):
+            for msg in ("plus loin", "autre", "le train"):
+                flow = make_flow(http=FakeHttp({"providers": {"providers": []}}),
+                                 session_store=MemorySessionStore(), prefetch=False)
+                session = flow.get_or_create_session("u1", "telegram")
+                session.state, session.service_type = BookingState.SHOW_PROVIDERS, "plomberie"
+                session.date, session.time = datetime(2026, 3, 10), (14, 0)
+                session.location = {"address": "x", "lat": 45.5, "lng": -73.6}
+                flow.save_session(session)
+                run(flow)
+                after = flow.get_or_create_session("u1", "telegram")
+                replies.append((msg, after.state, after.search_radius_km))
+        assert replies[:3] == replies[3:]
+        assert [state for _, state, _ in replies[:3]] == [
+            BookingState.SHOW_PROVIDERS, BookingState.ASK_DATE, BookingState.SHOW_PROVIDERS]
+        assert [radius for _, _, radius in replies[:3]] == [50.0, 25.0, 25.0]
+
+    def test_confirmation_needs_an_unambiguous_answer(self):
+        flow = make_flow()
+        for msg in ("oui", "OK", "d'accord", "confirmer", "confimer"):
+            assert flow._confirmation(msg) == "yes", msg
+        for msg in ("non", "annuler", "pas ça"):
+            assert flow._confirmation(msg) == "no", msg
+        for msg in ("pas d'accord", "je ne confirme pas", "oui mais non", "pas ok", "ok non",
+                    "oui non", "n'ok"):
+            assert flow._confirmation(msg) is None, msg
+
+
+def write_catalog(path, services, version="v1"):
+    path.write_text(json.dumps({"version": version, "services": services}), encoding="utf-8")
+    return str(path)
+
+
+class TestServiceCatalog:
+    """Test the data-driven service catalogue and its hot reload"""
+
+    def test_lookups_and_prerendered_messages(self):
+        catalog = CatalogStore().current()
+        assert catalog.by_key["2"].id == "électricité"
+        assert catalog.emoji("Electricity") == "⚡"
+        assert catalog.emoji("peinture") == "🎨"  # known but not in the menu
+        assert catalog.emoji("inconnu") == "🔧"
+        assert "5. 🚚 Déménagement" in catalog.welcome["fr"]
+        assert "Peinture" not in catalog.welcome["fr"]
+        assert "5. 🚚 Moving" in catalog.welcome["en"]
+        assert catalog.choose_service["fr"].endswith("de 1 à 5 ou le nom du service.")
+
+        assert make_flow().get_welcome_message() == catalog.welcome["fr"]
+
+    def test_file_hot_reload_reaches_flow_and_notifier(self, tmp_path):
+        with open(DEFAULT_CATALOG_PATH, encoding="utf-8") as f:
+            services = json.load(f)["services"]
+        path = write_catalog(tmp_path / "services.json", services[:5])
+        store = CatalogStore(path=path, refresh_interval=0)
+        flow = make_flow(catalog=store)
+        notifier = JobNotifier(catalog=store)
+        assert "Toiture" not in flow.get_welcome_message()
+        assert not store.refresh()  # unchanged file
+
+        roofing = {"id": "toiture", "emoji": "🏠", "labels": {"fr": "Toiture", "en": "Roofing"},
+                   "synonyms": ["couvreur", "bardeaux"]}
+        write_catalog(tmp_path / "services.json", services[:5] + [roofing], version="v2")
+        os.utime(path, (time.time() + 5, time.time() + 5))
+        assert store.refresh()
+        assert store.current().version == "v2"
+        assert "6. 🏠 Toiture" in flow.get_welcome_message()
+        assert notifier._get_emoji("Roofing") == "🏠"
+
+        flow.handle_message("u1", "telegram", "/start")
+        reply = flow.handle_message("u1", "telegram", "il me faut un couvreur")
+        assert "🏠 Toiture" in reply
+        assert flow.sessions["telegram:u1"].service_type == "toiture"
+
+    def test_bad_reload_keeps_current_snapshot(self, tmp_path):
+        with open(DEFAULT_CATALOG_PATH, encoding="utf-8") as f:
+            services = json.load(f)["services"]
+        path = write_catalog(tmp_path / "services.json", services)
+        store = CatalogStore(path=path, refresh_interval=0)
+        before = store.current()
+        (tmp_path / "services.json").write_text("{not json", encoding="utf-8")
+        os.utime(path, (time.time() + 5, time.time() + 5))
+        assert not store.refresh()
+        assert store.current() is before
+
+    def test_versioned_fetch(self):
+        with open(DEFAULT_CATALOG_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+        replies = [FakeResponse(data, headers={"ETag": '"a"'}),
+                   FakeResponse(None, status=304),
+                   FakeResponse({**data, "version": "2026-11-01"}, headers={"ETag": '"b"'})]
+        calls = []
+
+        class ReplayHttp:
+            def get(self, endpoint, url, **kwargs):
+                calls.append(kwargs)
+                return replies.pop(0)
+
+        store = CatalogStore(url="http://api/services", http=ReplayHttp(), refresh_interval=0)
+
+        assert not store.refresh()  # same version as the packaged file
+        assert not store.refresh()  # 304
+        assert calls[1]["headers"] == {"If-None-Match": '"a"'}
+        assert store.refresh()
+        assert store.current().version == "2026-11-01"
+
+
+class TestNotificationTemplates:
+    """Test compiled notification templates and per-platform variants"""
+
+    JOB = JobRequest("QEP-1", "électricité", "20 février", "14h", "12 rue <Nord>", 2.46,
+                     "Client", 90.0, notes="Sonner 2x & attendre")
+
+    def test_compile_bind_render(self):
+        template = Template("{emoji} {service}: {distance_km:.1f} km{notes}", escape=str.upper)
+        assert template.fields == ("emoji", "service", "distance_km", "notes")
+        bound = template.bind(emoji="⚡", service="prise", notes=Raw(" <b>!</b>"))
+        assert bound.fields == ("distance_km",)
+        assert bound.parts[0] == "⚡ PRISE: "
+        assert bound.render(distance_km=3.14159) == "⚡ PRISE: 3.1 km <b>!</b>"
+
+    def test_fan_out_matches_single_alert(self):
+        notifier = JobNotifier()
+        alerts = notifier.format_new_job_alerts(self.JOB, [{"distance_km": 1.0}, {"distance_km": 7.25}])
+        assert "(1.0 km)" in alerts[0] and "(7.2 km)" in alerts[1]
+        assert alerts[0] == notifier.format_new_job_alert(JobRequest(**{**vars(self.JOB), "distance_km": 1.0}))
+        assert "⚡ Service: Électricité" in alerts[0]
+        assert "📝 Notes: Sonner 2x & attendre" in alerts[0]
+
+    def test_platform_variants(self):
+        notifier = JobNotifier()
+        whatsapp = notifier.format_new_job_alert(self.JOB, platform="whatsapp")
+        telegram = notifier.format_new_job_alert(self.JOB, platform="telegram")
+        assert whatsapp == notifier.format_new_job_alert(self.JOB)
+        assert "<b>" not in whatsapp and "12 rue <Nord>" in whatsapp
+        assert "🔔 <b>NOUVELLE DEMANDE!</b>" in telegram
+        assert "12 rue &lt;Nord&gt;" in telegram and "Sonner 2x &amp; attendre" in telegram
+        # No Telegram variant: plain template, values still escaped
+        review = notifier.format_client_review_request("b1", "Bob & fils", platform="telegram")
+        assert "Bob &amp; fils" in review
+
+
+class TestFanOut:
+    """Test the bulk job alert dispatcher against the stub sender"""
+
+    JOB = JobRequest("QEP-9", "plomberie", "3 mars", "9h", "12 rue Nord", 0.0, "Client", 120.0)
+
+    def test_results_per_recipient_in_order(self):
+        sender = StubSender(fail_for={"tg-bad"})
+        dispatcher = FanOutDispatcher(sender)
+        results = dispatcher.notify_new_job(self.JOB, [
+            {"id": "a", "platform": "telegram", "chat_id": "tg-a", "distance_km": 1.2},
+            {"id": "b", "phone": "+15145550100", "distance_km": 8.0},
+            {"id": "c", "platform": "telegram", "chat_id": "tg-bad"},
+            {"id": "d", "name": "sans contact"},
+        ])
+        assert [(r.provider_id, r.status) for r in results] == [
+            ("a", "sent"), ("b", "sent"), ("c", "failed"), ("d", "skipped")]
+        sent = {chat_id: (platform, text) for platform, chat_id, text in sender.sent}
+        assert "<b>NOUVELLE DEMANDE!</b>" in sent["tg-a"][1] and "(1.2 km)" in sent["tg-a"][1]
+        assert sent["+15145550100"][0] == "whatsapp" and "(8.0 km)" in sent["+15145550100"][1]
+
+    def test_rate_limit_and_concurrency_bound(self):
+        in_flight, peak = [0], [0]
+
+        class CountingSender(StubSender):
+            async def send(self, platform, chat_id, text):
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+                await asyncio.sleep(0.002)
+                in_flight[0] -= 1
+                await super().send(platform, chat_id, text)
+
+        sender = CountingSender()
+        dispatcher = FanOutDispatcher(sender, rates={"telegram": 50}, concurrency=4)
+        providers = [{"id": str(i), "platform": "telegram", "chat_id": str(i)} for i in range(60)]
+        start = time.perf_counter()
+        results = dispatcher.notify_new_job(self.JOB, providers)
+        elapsed = time.perf_counter() - start
+        assert all(r.status == "sent" for r in results) and len(sender.sent) == 60
+        assert peak[0] <= 4
+        assert elapsed >= 0.15  # 50 in the burst, the last 10 at 50/s
+
+    def test_bot_fans_out_to_nearest_providers(self):
+        bot = QEmploisBot.__new__(QEmploisBot)
+        bot.booking_flow = make_flow(http=FakeHttp())
+        bot.job_notifier = JobNotifier()
+        bot.fanout = FanOutDispatcher(StubSender(), bot.job_notifier)
+        contacts = [{**p, "platform": "telegram", "chat_id": f"tg-{p['id']}"}
+                    for p in TestProviderIndex.PROVIDERS]
+        bot.booking_flow.http = FakeHttp({"providers": {"providers": contacts}})
+        # Filled the way a booking search fills it: per service and date
+        session = BookingData("u1", "telegram", service_type="plomberie", date=parse_date("3 mars"))
+        bot.booking_flow._load_providers(session)
+
+        job = {
+            "booking_id": "QEP-9", "service_type": "plomberie", "date": "3 mars", "time": "9h",
+            "location": "12 rue Nord", "price_estimate": 120.0, "lat": 45.5236, "lng": -73.5817,
+        }
+        summary = bot.notify_providers_new_job(job, k=2)
+        assert summary["sent"] == 2 and summary["failed"] == summary["skipped"] == 0
+        assert [r["provider_id"] for r in summary["results"]] == ["near", "mid"]
+        assert [chat_id for _, chat_id, _ in bot.fanout.sender.sent] == ["tg-near", "tg-mid"]
+
+        # Undated job: every date the index holds is searched
+        summary = bot.notify_providers_new_job({**job, "date": "bientôt"}, k=2)
+        assert [r["provider_id"] for r in summary["results"]] == ["near", "mid"]
+
+
+class TestOutbox:
+    """Test the durable outbox: retries, dead letters, replay and webhook queueing"""
+
+    def test_backoff_then_dead_letter(self):
+        now = [1000.0]
+        outbox = Outbox(max_attempts=3, backoff_base=10, clock=lambda: now[0])
+        calls = []
+
+        def flaky(batch):
+            calls.append([p["n"] for p in batch])
+            if batch[0]["n"] == 1:
+                raise RuntimeError("HTTP 503")
+
+        outbox.register("webhook", flaky, batch_size=10)
+        outbox.enqueue("webhook", {"n": 1})
+        assert outbox.drain() == 0 and outbox.drain() == 0  # second drain: not due yet
+        outbox.enqueue("webhook", {"n": 2})
+        assert outbox.drain() == 1 and calls == [[1], [2]]
+
+        now[0] += 10  # first retry due after 5-10 s
+        outbox.drain()
+        now[0] += 20
+        outbox.drain()
+        assert len(calls) == 4 and len(outbox) == 0
+        [dead] = outbox.dead_letters()
+        assert dead.payload == {"n": 1} and dead.attempts == 3 and dead.error == "HTTP 503"
+        assert outbox.requeue_dead() == 1 and len(outbox) == 1
+
+    def test_log_replay_and_compaction(self, tmp_path):
+        path = str(tmp_path / "outbox.log")
+        outbox = Outbox(path=path, max_attempts=1, compact_after=5)
+        for n in range(6):
+            outbox.enqueue("message", {"n": n})
+        outbox.register("message", lambda batch: None, batch_size=4)
+        assert outbox.drain(max_batches=1) == 4
+        outbox.register("message", lambda batch: 1 / 0)
+        outbox.drain(max_batches=1)  # n=4 dead-lettered
+
+        with open(path, encoding="utf-8") as f:
+            assert len(f.readlines()) <= 4  # compacted: 2 adds + 1 dead record
+        restarted = Outbox(path=path)
+        assert [m.payload["n"] for m in restarted.dead_letters()] == [4]
+        delivered = []
+        restarted.register("message", delivered.extend)
+        restarted.drain()
+        assert delivered == [{"n": 5}]
+
+    def test_log_directory_is_created(self, tmp_path):
+        path = str(tmp_path / "var" / "qemplois" / "outbox.log")
+        outbox = Outbox(path=path)
+        outbox.enqueue("message", {"n": 1})
+        assert os.path.exists(path)
+
+    def test_client_messages_use_the_platform_variant(self):
+        bot = QEmploisBot.__new__(QEmploisBot)
+        bot.booking_flow = make_flow(http=FakeHttp())
+        bot.outbox = Outbox()
+        bot.dedup = IdempotencyCache()
+        bot.job_notifier = JobNotifier()
+        sent = []
+        bot.outbox.register("message", sent.extend)
+        bot.handle_webhook("telegram", {
+            "event": "booking.confirmed",
+            "booking": {"service_type": "plomberie", "booking_id": "B1", "client_id": "u2",
+                        "provider_name": "Jean <Plombier> & fils", "provider_phone": "514-555-0100",
+                        "date": "1 mars", "time": "14h00"},
+        })
+        bot.handle_webhook("telegram", {"event": "booking.cancelled", "booking_id": "B<2>",
+                                        "client_id": "u2"})
+        bot.handle_webhook("whatsapp", {"event": "booking.cancelled", "booking_id": "B<3>",
+                                        "client_id": "+1514"})
+        bot.outbox.drain()
+        confirmed, cancelled, plain = (m["text"] for m in sent)
+        assert "Jean &lt;Plombier&gt; &amp; fils" in confirmed and "<b>" in confirmed
+        assert "<code>#B&lt;2&gt;</code>" in cancelled
+        assert "#B<3>" in plain
+
+    def test_link_queues_webhook_off_the_request_path(self):
+        outbox = Outbox()
+        http = FakeHttp()
+        auth = AuthHandler(secret_key="s", http=http, outbox=outbox)
+        auth.redis = FakeRedis()
+        token = auth.create_session("u_1", "telegram")["token"]
+        assert auth.link_platform(token, "42", "telegram")["success"]
+        assert http.count("webhook") == 0 and len(outbox) == 1
+
+        assert outbox.drain() == 1
+        (_, _, kwargs), = http.calls
+        assert kwargs["json"]["event"] == "auth.linked"
+        assert kwargs["headers"]["X-QEmplois-Signature"] == auth._sign_webhook_payload(
+            kwargs["json"]["payload"])
+
+
+class TestAuthLuaScripts:
+    """Run the real Lua scripts (fakeredis with Lua support; skipped without it)"""
+
+    @staticmethod
+    def make_auth():
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        server = fakeredis.FakeServer()
+        auth = make_auth()
+        auth.redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+        auth._aredis = LoopLocal(lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        return auth
+
+    def test_session_link_unlink_delete(self):
+        auth = self.make_auth()
+        token = auth.create_session("u_1", "telegram")["token"]
+        assert auth.update_session(token, {"email": "a@b.ca"})
+        assert not auth.update_session(auth._generate_token("u_9", "telegram"), {})
+        assert not auth.verify_platform_token("whatsapp", "42", token)
+        assert auth.verify_platform_token("telegram", "42", token)
+        assert auth.link_platform(token, "42", "telegram") == LINK_ERRORS["linked"]
+        session = auth.get_session(token)
+        assert session["email"] == "a@b.ca" and session["linked_user_id"] == "42"
+        assert auth.get_linked_user("telegram", "42")["user_id"] == "u_1"
+
+        assert auth.unlink_platform("telegram", "42")
+        assert not auth.unlink_platform("telegram", "42")
+        assert auth.get_session(token)["status"] == "unlinked"
+        assert auth.delete_session(token)
+        assert auth.redis.keys("*") == []
+
+    def test_async_link_and_merge(self):
+        auth = self.make_auth()
+        token = auth.create_session("u_2", "whatsapp")["token"]
+
+        async def scenario():
+            assert await auth.update_session_async(token, {"phone": "+1514"})
+            assert (await auth.link_platform_async(token, "+1514", "whatsapp"))["success"]
+            return await auth.get_session_async(token)
+
+        session = asyncio.run(scenario())
+        assert session["phone"] == "+1514" and session["status"] == "linked"
+
+    def test_unlink_without_token_and_inbound_limit(self):
+        auth = self.make_auth()
+        auth.redis.set("auth:link:telegram:7", json.dumps({"user_id": "u_1"}))
+        assert auth.unlink_platform("telegram", "7")
+        limiter = InboundLimiter(user_rate=1, user_burst=1, redis_client=auth.redis,
+                                 clock=lambda: 1000.0)
+        assert limiter.check("telegram", "7") is None
+        assert limiter.check("telegram", "7") == "user"
+
+
+class TestWebhookBatching:
+    """Test batched, gzipped and signed webhook delivery through the outbox"""
+
+    class RecordingHttp:
+        def __init__(self, fail_first=0):
+            self.bodies, self.fail_first = [], fail_first
+
+        def post(self, endpoint, url, **kwargs):
+            if self.fail_first:
+                self.fail_first -= 1
+                return FakeResponse({}, status=503)
+            self.bodies.append(kwargs)
+            return FakeResponse({})
+
+    def make(self, http, now, batch_size, linger_ms):
+        outbox = Outbox(backoff_base=1, clock=lambda: now[0])
+        return AuthHandler(secret_key="s", http=http, outbox=outbox,
+                           webhook_batch_size=batch_size, webhook_linger_ms=linger_ms), outbox
+
+    def test_one_signed_gzip_request_per_batch(self):
+        now, http = [0.0], self.RecordingHttp()
+        auth, outbox = self.make(http, now, batch_size=100, linger_ms=50)
+        for n in range(250):
+            auth._fire_webhook("auth.linked", {"platform": "telegram", "platform_user_id": str(n)})
+        assert outbox.drain() == 0  # still lingering
+        now[0] = 0.05
+        assert outbox.drain() == 250
+        assert len(http.bodies) == 3
+
+        events = []
+        for request in http.bodies:
+            raw = gzip.decompress(request["data"])
+            batch = json.loads(raw)
+            # Receiver side: HMAC over the gunzipped bytes, no re-serialization
+            assert request["headers"]["X-QEmplois-Signature"] == hmac.new(
+                b"s", raw, hashlib.sha256).hexdigest()
+            assert request["headers"]["X-QEmplois-Batch"] == str(len(batch["events"]))
+            assert len(request["data"]) < len(raw) / 3
+            events += batch["events"]
+        assert [e["payload"]["platform_user_id"] for e in events] == [str(n) for n in range(250)]
+
+    def test_failed_batch_is_not_overtaken(self):
+        now, http = [0.0], self.RecordingHttp(fail_first=1)
+        auth, outbox = self.make(http, now, batch_size=2, linger_ms=50)
+        for n in range(4):
+            auth._fire_webhook("auth.linked", {"n": n})
+        now[0] = 0.05
+        assert outbox.drain() == 0  # first batch failed, the second waits behind it
+        assert http.bodies == []
+        now[0] = 2.0
+        assert outbox.drain() == 4
+        sent = [[e["payload"]["n"] for e in json.loads(gzip.decompress(r["data"]))["events"]]
+                for r in http.bodies]
+        assert sent == [[0, 1], [2, 3]]
+
+    def test_event_enqueued_after_failure_waits_for_the_retry(self):
+        now, http = [0.0], self.RecordingHttp(fail_first=1)
+        auth, outbox = self.make(http, now, batch_size=1, linger_ms=0)
+        auth._fire_webhook("auth.linked", {"n": 1})
+        assert outbox.drain() == 0
+        auth._fire_webhook("auth.linked", {"n": 2})  # after the failure
+        assert outbox.drain() == 0
+        now[0] = 2.0
+        assert outbox.drain() == 2
+        assert [r["json"]["payload"]["n"] for r in http.bodies] == [1, 2]
+
+    def test_replayed_retry_still_goes_first(self, tmp_path):
+        path, now = str(tmp_path / "outbox.log"), [0.0]
+        outbox = Outbox(path=path, backoff_base=1, clock=lambda: now[0])
+        outbox.register("webhook", lambda batch: 1 / 0, ordered=True)
+        outbox.enqueue("webhook", {"n": 1})
+        outbox.drain()
+        outbox.enqueue("webhook", {"n": 2})
+
+        sent = []
+        restarted = Outbox(path=path, clock=lambda: now[0])
+        restarted.register("webhook", lambda batch: sent.extend(p["n"] for p in batch), ordered=True)
+        assert restarted.drain() == 0
+        now[0] = 2.0
+        assert restarted.drain() == 2 and sent == [1, 2]
+
+
+class TestAuthRoundTrips:
+    """Every auth operation is one Redis round trip (two when it must read a key first)"""
+
+    def trips(self, auth, operation):
+        auth.redis.calls.clear()
+        result = operation()
+        return result, auth.redis.calls
+
+    def test_sync_flows(self):
+        auth = make_auth()
+        session, calls = self.trips(auth, lambda: auth.create_session("u_1", "telegram"))
+        assert calls == ["pipeline"]
+        token = session["token"]
+        assert auth.redis.data[f"auth:index:telegram:u_1"] == token
+
+        assert self.trips(auth, lambda: auth.get_session(token)) == (
+            json.loads(auth.redis.data[f"auth:session:{token}"]), ["getex"])
+        assert self.trips(auth, lambda: auth.update_session(token, {"email": "a@b.ca"})) == (
+            True, ["evalsha"])
+        assert self.trips(auth, lambda: auth.verify_platform_token("whatsapp", "42", token)) == (
+            False, ["evalsha"])  # wrong platform
+        assert self.trips(auth, lambda: auth.verify_platform_token("telegram", "42", token)) == (
+            True, ["evalsha"])
+        assert self.trips(auth, lambda: auth.link_platform(token, "42", "telegram"))[0] == {
+            "success": False, "error": "Already linked"}
+
+        link, calls = self.trips(auth, lambda: auth.get_linked_user("telegram", "42"))
+        assert link["user_id"] == "u_1" and calls == ["getex"]
+        assert self.trips(auth, lambda: auth.unlink_platform("telegram", "42")) == (
+            True, ["get", "evalsha"])
+        assert json.loads(auth.redis.data[f"auth:session:{token}"])["status"] == "unlinked"
+        assert self.trips(auth, lambda: auth.delete_session(token)) == (True, ["get", "evalsha"])
+        assert auth.redis.data == {}
+
+    def test_script_retries_when_the_record_changed(self):
+        auth = make_auth()
+        link_user(auth, "telegram", "42")
+        get = auth.redis.get
+
+        def stale_get(key):  # a relink lands between the read and the script
+            raw = get(key)
+            auth.redis.data[key] = json.dumps({"token": "t2", "user_id": "u_1"})
+            return raw
+
+        auth.redis.get = stale_get
+        assert auth.unlink_platform("telegram", "42")
+        assert auth.redis.calls.count("evalsha") == 2
+
+    def test_async_flows(self):
+        auth = make_auth()
+        token = auth.create_session("u_2", "whatsapp")["token"]
+
+        async def scenario():
+            auth.redis.calls.clear()
+            assert (await auth.get_session_async(token))["status"] == "pending"
+            assert await auth.verify_platform_token_async("whatsapp", "+1514", token)
+            assert (await auth.get_linked_user_async("whatsapp", "+1514"))["user_id"] == "u_2"
+            assert await auth.update_session_async(token, {"email": "c@d.ca"})
+            return list(auth.redis.calls)
+
+        assert asyncio.run(scenario()) == ["getex", "evalsha", "getex", "evalsha"]
+
+
+class TestLinkNearCache:
+    """Test the near cache in front of get_linked_user"""
+
+    def test_hits_skip_redis_and_expiry_is_touched_once(self):
+        auth = make_auth()
+        link_user(auth, "telegram", "42")
+        auth.redis.calls.clear()
+        for _ in range(5):
+            assert auth.get_linked_user("telegram", "42")["user_id"] == "u_1"
+        assert auth.redis.calls == ["getex"]
+
+        auth.link_cache.clear()  # near-cache entry expired, expiry touched recently
+        assert auth.get_linked_user("telegram", "42")["user_id"] == "u_1"
+        assert auth.redis.calls == ["getex", "get"]
+        assert auth.get_linked_user("telegram", "999") is None  # negative entries cached too
+        assert auth.get_linked_user("telegram", "999") is None
+        assert auth.link_cache_stats()["hits"] == 5
+
+    def test_unlink_on_another_worker_invalidates(self):
+        worker_a, worker_b = make_auth(), make_auth()
+        worker_b.redis = worker_a.redis
+        worker_a.start_link_listener()
+        deadline = time.time() + 2
+        while not worker_a.redis.subscribers and time.time() < deadline:
+            time.sleep(0.01)
+
+        link_user(worker_a, "whatsapp", "+1514")
+        assert worker_a.get_linked_user("whatsapp", "+1514")["user_id"] == "u_1"
+        assert worker_b.unlink_platform("whatsapp", "+1514")
+        while "whatsapp:+1514" in worker_a.link_cache and time.time() < deadline:
+            time.sleep(0.01)
+        assert worker_a.get_linked_user("whatsapp", "+1514") is None
+
+    def test_link_invalidates_negative_entry(self):
+        auth = make_auth()
+        token = auth.create_session("u_7", "telegram")["token"]
+        assert auth.get_linked_user("telegram", "7") is None
+        assert auth.verify_platform_token("telegram", "7", token)
+        assert auth.get_linked_user("telegram", "7")["user_id"] == "u_7"
+
+
+class TestTokenVerification:
+    """Test in-process token verification and the rejected-token cache"""
+
+    def test_forged_tokens_never_reach_redis(self):
+        auth = make_auth()
+        token = auth.create_session("u_1", "telegram")["token"]
+        timestamp, nonce, mac = token.split("_")[1:]
+        auth.redis.calls.clear()
+        forged = [
+            f"qem_{timestamp}_{nonce}_{'0' * len(mac)}",
+            f"qem_{timestamp}_{'f' * 16}_{mac}",
+            f"qem_{int(time.time()) - 60}_{nonce}_{'0' * 16}",  # legacy shape, no cutoff configured
+            "qem_abc_def_ghi",
+            f"qem_{timestamp}²_{nonce}_{mac}",  # isdigit() but not int()
+            f"qem_{timestamp}_{nonce}_{'é' * len(mac)}",  # compare_digest rejects non-ASCII
+        ]
+        for bad in forged:
+            assert auth.get_session(bad) is None
+            assert auth.link_platform(bad, "42", "telegram") == auth_module.LINK_ERRORS["invalid"]
+        assert auth.redis.calls == []
+        assert auth.token_counters["rejected"] == len(forged)
+        assert auth.token_counters["rejected_cached"] == len(forged)
+        assert auth.get_session(token)["user_id"] == "u_1"
+
+    def test_non_ascii_token_in_a_message_is_rejected(self):
+        auth = make_auth()
+        handler = TelegramHandler(make_flow(session_store=MemorySessionStore()), auth)
+        result = handler.handle_message({"from": {"id": 42}, "text": "/start qem_²_ab_cd"})
+        assert result["text"] and auth.redis.calls == []
+
+    def test_tokens_verify_across_workers_with_shared_secret(self):
+        worker_a, worker_b = make_auth("shared"), make_auth("shared")
+        token = worker_a._generate_token("u_1", "telegram")
+        assert worker_b._verify_token(token)
+        assert not make_auth("other")._verify_token(token)
+
+    def test_legacy_tokens_only_before_fixed_cutoff(self):
+        auth = make_auth()
+        now = int(time.time())
+        auth.legacy_token_cutoff = now - 3600  # format released an hour ago
+        assert auth._verify_token(f"qem_{now - 7200}_{'a' * 16}_{'b' * 16}")  # looked up
+        assert not auth._verify_token(f"qem_{now - 60}_{'a' * 16}_{'b' * 16}")
+        stale = make_auth()  # more than a day after release: every legacy token is too old
+        stale.legacy_token_cutoff = now - 2 * 86400
+        assert not stale._verify_token(f"qem_{now - 2 * 86400 - 10}_{'a' * 16}_{'b' * 16}")
+        assert not stale._verify_token(f"qem_{now - 60}_{'a' * 16}_{'b' * 16}")
+
+    def test_missing_session_is_cached_as_rejected(self):
+        auth = make_auth()
+        token = auth.create_session("u_1", "telegram")["token"]
+        auth.delete_session(token)
+        auth.redis.calls.clear()
+        assert auth.get_session(token) is None
+        assert auth.get_session(token) is None
+        assert auth.redis.calls == ["getex"]
+
+
+class TestInboundLimiter:
+    """Test per-user and global throttling of inbound messages"""
+
+    def test_user_and_global_limits(self):
+        now = [1000.0]
+        limiter = InboundLimiter(user_rate=1, user_burst=3, global_rate=10, global_burst=5,
+                                 clock=lambda: now[0])
+        assert [limiter.check("telegram", "1") for _ in range(4)] == [None, None, None, "user"]
+        assert [limiter.check("telegram", "2") for _ in range(3)] == [None, None, "global"]
+        now[0] += 1
+        assert limiter.check("telegram", "1") is None
+        assert limiter.counters == {"allowed": 6, "throttled_user": 1, "throttled_global": 1}
+
+    def test_redis_buckets_are_shared_and_fall_back(self):
+        now = [1000.0]
+        backend = FakeRedis()
+        worker_a, worker_b = (InboundLimiter(user_rate=1, user_burst=2, redis_client=backend,
+                                             clock=lambda: now[0]) for _ in range(2))
+        assert worker_a.check("whatsapp", "+1") is None
+        assert worker_b.check("whatsapp", "+1") is None
+        assert worker_a.check("whatsapp", "+1") == "user"
+        assert backend.calls == ["evalsha"] * 3
+
+        worker_a.redis = None
+        worker_a.async_redis = lambda: (_ for _ in ()).throw(ConnectionError("down"))
+        assert asyncio.run(worker_a.check_async("whatsapp", "+1")) is None  # local buckets
+        assert worker_a.counters["redis_errors"] == 1
+
+    def test_script_is_registered_once_per_client(self):
+        backend = FakeRedis()
+        registered = []
+        register = backend.register_script
+        backend.register_script = lambda source: registered.append(source) or register(source)
+        limiter = InboundLimiter(redis_client=backend, async_redis=lambda: FakeAsyncRedis(backend))
+        for n in range(3):
+            limiter.check("telegram", str(n))
+
+        async def burst():
+            for n in range(3):
+                await limiter.check_async("whatsapp", str(n))
+
+        asyncio.run(burst())
+        assert len(registered) == 2  # sync client, then the loop's async client
+        assert backend.calls == ["evalsha"] * 6
+
+    def test_flood_is_rejected_before_link_lookup(self):
+        auth = make_auth()
+        link_user(auth, "telegram", "42")
+        flow = make_flow(session_store=MemorySessionStore())
+        handler = TelegramHandler(flow, auth, InboundLimiter(user_rate=0.01, user_burst=1))
+        message = {"from": {"id": 42}, "text": "bonjour"}
+        assert "text" in run_sync(handler.handle_message_async(message))
+        auth.redis.calls.clear()
+        replies = [run_sync(handler.handle_message_async(message)) for _ in range(3)]
+        assert replies[0]["text"] == THROTTLED_MESSAGE
+        assert replies[1] == replies[2] == {"status": "throttled"}
+        assert auth.redis.calls == []
+
+
+class TestIdempotency:
+    """Test deduplication of redelivered messages and backend events"""
+
+    def test_claims_are_shared_and_released_on_failure(self):
+        backend = FakeRedis()
+        worker_a = IdempotencyCache(redis_client=backend)
+        worker_b = IdempotencyCache(redis_client=backend, async_redis=lambda: FakeAsyncRedis(backend))
+        assert worker_a.claim("event:e1")
+        assert not worker_a.claim("event:e1")
+        assert not asyncio.run(worker_b.claim_async("event:e1"))
+        assert backend.calls == ["set", "set"]  # the local repeat never reached Redis
+        worker_a.release("event:e1")
+        assert worker_b.claim("event:e1") is False  # still in worker b's local set
+        assert worker_a.claim("event:e1")
+
+    def test_redelivered_update_and_event_are_skipped(self):
+        auth = make_auth()
+        link_user(auth, "telegram", "42")
+        handler = TelegramHandler(make_flow(session_store=MemorySessionStore()), auth)
+        update = {"message_id": 7, "from": {"id": 42}, "chat": {"id": 42}, "text": "bonjour"}
+        assert "text" in run_sync(handler.handle_message_async(update))
+        assert run_sync(handler.handle_message_async(dict(update))) == {"status": "duplicate"}
+
+        bot = QEmploisBot.__new__(QEmploisBot)
+        bot.booking_flow = make_flow(http=FakeHttp())
+        bot.outbox = Outbox()
+        bot.dedup = IdempotencyCache()
+        bot.job_notifier = JobNotifier()
+        event = {"event": "booking.cancelled", "booking_id": "B7", "client_id": "u9"}
+        assert "outbox_id" in bot.handle_webhook("telegram", event)
+        assert bot.handle_webhook("telegram", dict(event)) == {"status": "duplicate"}
+        assert len(bot.outbox) == 1
+
+    def test_booking_post_carries_stable_idempotency_key(self):
+        flow = make_flow(http=FakeHttp())
+        session = BookingData("u1", "telegram", service_type="plomberie",
+                              date=datetime(2026, 3, 1), time=(14, 0),
+                              location={"address": "x", "lat": 45.5, "lng": -73.6},
+                              selected_provider=ProviderRecord("p1", "Jean Tremblay", 45.0))
+        key = flow._booking_request(session)["headers"]["Idempotency-Key"]
+        assert key == flow._booking_request(session)["headers"]["Idempotency-Key"]
+        session.time = (15, 0)
+        assert flow._booking_request(session)["headers"]["Idempotency-Key"] != key
+
+    def test_rebooking_the_same_slot_gets_a_new_key(self):
+        flow = make_flow(http=FakeHttp(), session_store=MemorySessionStore())
+        keys = []
+        for _ in range(2):  # book, cancel on the site, book the same slot again
+            session = flow.get_or_create_session("u1", "telegram")
+            flow._dispatch(session, "/start")
+            flow._handle_service_selection(session, "1")
+            session.date, session.time = datetime(2026, 3, 1), (14, 0)
+            session.selected_provider = ProviderRecord("p1", "Jean Tremblay", 45.0)
+            keys.append(flow._booking_request(session)["headers"]["Idempotency-Key"])
+            flow.save_session(session)
+            restored = flow.get_or_create_session("u1", "telegram")
+            assert restored.started_at == session.started_at  # survives the session store
+            time.sleep(0.001)
+        assert keys[0] != keys[1]
+
+
+class TestConversationDispatcher:
+    """Test per-conversation ordering with parallelism across users"""
+
+    def test_in_order_per_user_parallel_across_users(self):
+        dispatcher = ConversationDispatcher(workers=4)
+        running, peak, seen = set(), [0], {}
+
+        async def handle(key, n):
+            assert key not in running  # never two messages of one user at once
+            running.add(key)
+            peak[0] = max(peak[0], len(running))
+            await asyncio.sleep(0.01 if n == 0 else 0)  # first message is the slow one
+            seen.setdefault(key, []).append(n)
+            running.discard(key)
+
+        async def main():
+            await asyncio.gather(*(
+                dispatcher.submit(f"telegram:{u}", lambda u=u, n=n: handle(u, n))
+                for n in range(5) for u in range(8)
+            ))
+            return dispatcher.pending()
+
+        assert asyncio.run(main()) == 0
+        assert all(order == list(range(5)) for order in seen.values()) and len(seen) == 8
+        assert peak[0] == 4
+        assert dispatcher.counters["handled"] == 40
+
+    def test_cancelled_message_keeps_the_queue_ordered(self):
+        dispatcher = ConversationDispatcher(workers=2)
+        order = []
+
+        async def handle(n, delay=0):
+            await asyncio.sleep(delay)
+            order.append(n)
+
+        async def main():
+            first = asyncio.ensure_future(dispatcher.submit("k", lambda: handle(1, 0.02)))
+            second = asyncio.ensure_future(dispatcher.submit("k", lambda: handle(2)))
+            third = asyncio.ensure_future(dispatcher.submit("k", lambda: handle(3)))
+            await asyncio.sleep(0)
+            second.cancel()
+            await asyncio.gather(first, third)
+
+        asyncio.run(main())
+        assert order == [1, 3]
+
+    def test_quick_messages_from_one_user_both_apply(self):
+        auth = make_auth()
+        link_user(auth, "telegram", "42")
+        store = MemorySessionStore()
+        handler = TelegramHandler(make_flow(session_store=store), auth)
+
+        async def main():
+            return await asyncio.gather(
+                handler.handle_message_async({"from": {"id": 42}, "text": "bonjour"}),
+                handler.handle_message_async({"from": {"id": 42}, "text": "1"}),
+            )
+
+        asyncio.run(main())
+        session = handler.booking_flow.get_or_create_session("42", "telegram")
+        assert session.service_type == "plomberie"
+        assert session.state == BookingState.ASK_DATE
+
+    def test_slow_pre_checks_do_not_reorder_messages(self):
+        auth = make_auth()
+        link_user(auth, "telegram", "42")
+        handler = TelegramHandler(make_flow(session_store=MemorySessionStore()), auth)
+
+        async def claim(key):
+            await asyncio.sleep(0.02 if key.endswith("u1") else 0)  # first message's Redis is slower
+            return True
+
+        handler.dedup.claim_async = claim
+
+        async def main():
+            return await asyncio.gather(
+                handler.handle_message_async({"update_id": 1, "from": {"id": 42}, "text": "bonjour"}),
+                handler.handle_message_async({"update_id": 2, "from": {"id": 42}, "text": "1"}),
+            )
+
+        asyncio.run(main())
+        session = handler.booking_flow.get_or_create_session("42", "telegram")
+        assert session.state == BookingState.ASK_DATE
+
+
+class TestProviderPrefetch:
+    """Test the speculative provider search started at ASK_LOCATION"""
+
+    @staticmethod
+    def make_slow_flow(prefetch=True):
+        flow = make_flow(session_store=MemorySessionStore(), prefetch=prefetch)
+        fetches, events = [], []
+
+        async def geocode(address):
+            events.append("geocode:start")
+            await asyncio.sleep(0.05)
+            events.append("geocode:end")
+            return {"lat": 45.5236, "lng": -73.5817, "display": address, "found": True}
+
+        async def fetch(session, updated_since=None):
+            fetches.append(session.location)
+            events.append("fetch:start")
+            await asyncio.sleep(0.05)
+            events.append("fetch:end")
+            return list(TestProviderIndex.PROVIDERS)
+
+        flow._geocode_async = geocode
+        flow._fetch_providers_api_async = fetch
+        flow.events = events
+        return flow, fetches
+
+    @staticmethod
+    def converse(flow, user_id="u1"):
+        """Reach ASK_LOCATION, then send the address"""
+        async def main():
+            for text in ("/start", "1", "demain", "14h"):
+                await flow.handle_message_async(user_id, "telegram", text)
+            return await flow.handle_message_async(user_id, "telegram", "123 Rue Sherbrooke, Montréal")
+
+        return asyncio.run(main())
+
+    def test_search_overlaps_geocoding(self):
+        flow, fetches = self.make_slow_flow()
+        reply = self.converse(flow)
+        assert "Près Plateau" in reply
+        assert len(fetches) == 1 and fetches[0] is None  # fetched before the address was known
+        # The search runs while geocoding, not after it
+        assert flow.events.index("fetch:start") < flow.events.index("geocode:end")
+        assert flow.prefetch_counters["started"] == 1
+        assert flow.prefetch_counters["awaited"] + flow.prefetch_counters["ready"] == 1
+
+        slow, _ = self.make_slow_flow(prefetch=False)
+        self.converse(slow)
+        assert slow.events == ["geocode:start", "geocode:end", "fetch:start", "fetch:end"]
+        assert slow.prefetch_counters["started"] == 0
+
+    def test_returning_user_shortlist_is_warm(self):
+        flow, fetches = self.make_slow_flow()
+        self.converse(flow)
+        flow.invalidate_provider_searches("plomberie")
+        reply = self.converse(flow)  # same session: last address known
+        assert "Près Plateau" in reply
+        assert len(fetches) == 2 and fetches[-1]["lat"] == 45.5236  # prefetched around the last address
+        assert not flow._prefetches